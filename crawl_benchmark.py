@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+爬取吞吐量基准测试 - 用真实的 fetch_douban_movies 爬取本地模拟接口
+在不同场景（延迟、错误率、429突发、榜单漂移）和并发数下统计
+条/秒、p50/p99请求延迟、重试开销，结果可离线复现，用于调整生产环境的并发参数
+用法:
+    python crawl_benchmark.py
+    python crawl_benchmark.py --scenario errors --concurrency 1,4,8 --total 2000 --json result.json
+作者: mshellc
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+import http_client
+from crawl_metrics import get_metrics
+from douban_crawler import fetch_douban_movies, load_config
+from mock_douban_api import start_mock_server
+from rate_limiter import AdaptiveRateLimiter
+from retry_policy import RetryPolicy
+from snapshot import iter_snapshot_items, list_snapshot_files
+
+# 场景名 -> 模拟接口参数
+SCENARIOS = {
+    'baseline': {'latency': 0.05, 'latency_jitter': 0.02},
+    'slow': {'latency': 0.2, 'latency_jitter': 0.2},
+    'errors': {'latency': 0.05, 'latency_jitter': 0.02, 'error_rate': 0.05},
+    'burst429': {'latency': 0.05, 'latency_jitter': 0.02, 'burst_every': 8, 'burst_length': 3, 'retry_after': 1},
+    'drift': {'latency': 0.05, 'latency_jitter': 0.02, 'drift_every': 5, 'drift_size': 2}
+}
+
+
+def percentile(values, q):
+    """精确分位数（最近秩法）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(q * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def run_benchmark(scenario, concurrency, total=1000, count=20, base_config=None, seed=0):
+    """对一个场景和并发数执行一次完整爬取，返回结果字典"""
+    server = start_mock_server(total=total, seed=seed, **SCENARIOS[scenario])
+    output_dir = tempfile.mkdtemp(prefix='douban_bench_')
+    config = dict(base_config or {})
+    config.update({
+        'api_base_url': server.url,
+        'count': count,
+        'start': 0,
+        'actual_count': 0,
+        'concurrency': concurrency,
+        'output_directory': output_dir,
+        'snapshot_format': 'ndjson',
+        'snapshot_compression': 'none',
+        'checkpoint': False,
+        'resume': False,
+        'incremental': False,
+        'item_fields': 'raw',
+        'movie_store': {'enabled': False},
+        'response_cache': {'enabled': False},
+        'http_pool_size': max(concurrency, http_client.DEFAULT_POOL_SIZE)
+    })
+
+    # 每次运行使用独立的会话、限速器和重试策略，互不影响
+    session = http_client.create_session(config)
+    latencies = []
+    session.hooks['response'].append(lambda response, *args, **kwargs: latencies.append(response.elapsed.total_seconds()))
+    rate_limiter = AdaptiveRateLimiter.from_config(config)
+    retry_policy = RetryPolicy.from_config(config)
+    job_name = f"bench_{scenario}_c{concurrency}"
+
+    start_time = time.perf_counter()
+    try:
+        success = fetch_douban_movies(config, session, None, job_name, rate_limiter, retry_policy)
+        elapsed = time.perf_counter() - start_time
+        summary = get_metrics().last_run or {}
+        ids = []
+        for name in list_snapshot_files(output_dir):
+            ids.extend(str(item.get('id')) for item in iter_snapshot_items(os.path.join(output_dir, name)))
+    finally:
+        session.close()
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+    pages = summary.get('pages', 0)
+    requests_sent = summary.get('request_count', len(latencies))
+    retries = sum(summary.get('retries', {}).values())
+    return {
+        'scenario': scenario,
+        'concurrency': concurrency,
+        'success': success,
+        'items': len(ids),
+        'unique_items': len(set(ids)),
+        'expected_items': total,
+        'elapsed_seconds': round(elapsed, 3),
+        'items_per_second': round(len(ids) / elapsed, 1) if elapsed else 0.0,
+        'requests': requests_sent,
+        'pages': pages,
+        'latency_p50_seconds': round(percentile(latencies, 0.50), 4),
+        'latency_p99_seconds': round(percentile(latencies, 0.99), 4),
+        'retries': retries,
+        'retry_request_overhead': round((requests_sent - pages) / pages, 3) if pages else 0.0,
+        'backoff_seconds': summary.get('backoff_seconds', 0.0),
+        'rate_limit_wait_seconds': summary.get('rate_limit_wait_seconds', 0.0),
+        'final_rate': round(rate_limiter.rate, 2)
+    }
+
+
+def print_results(results):
+    header = (f"{'场景':<10}{'并发':>4}{'结果':>6}{'条目':>8}{'去重后':>8}{'耗时(s)':>9}{'条/秒':>9}"
+              f"{'p50(s)':>9}{'p99(s)':>9}{'请求':>6}{'重试':>6}{'重试开销':>9}{'退避(s)':>9}{'限速等待(s)':>12}")
+    print(header)
+    print('-' * 130)
+    for r in results:
+        print(f"{r['scenario']:<10}{r['concurrency']:>4}{'成功' if r['success'] else '失败':>6}"
+              f"{r['items']:>8}{r['unique_items']:>8}{r['elapsed_seconds']:>9.2f}{r['items_per_second']:>9.1f}"
+              f"{r['latency_p50_seconds']:>9.3f}{r['latency_p99_seconds']:>9.3f}{r['requests']:>6}{r['retries']:>6}"
+              f"{r['retry_request_overhead']:>9.1%}{r['backoff_seconds']:>9.1f}{r['rate_limit_wait_seconds']:>12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='豆瓣爬虫吞吐量基准测试（本地模拟接口）')
+    parser.add_argument('--scenario', default='all', help=f"场景: all 或逗号分隔的 {', '.join(SCENARIOS)}")
+    parser.add_argument('--concurrency', default='1,2,4,8', help='逗号分隔的并发数列表')
+    parser.add_argument('--total', type=int, default=1000, help='模拟接口的电影总数')
+    parser.add_argument('--count', type=int, default=20, help='每页条目数')
+    parser.add_argument('--config', help='读取该配置文件中的限速和重试参数（默认使用基准测试参数）')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='把结果写入JSON文件')
+    args = parser.parse_args()
+
+    scenarios = list(SCENARIOS) if args.scenario == 'all' else args.scenario.split(',')
+    for scenario in scenarios:
+        if scenario not in SCENARIOS:
+            parser.error(f"未知场景: {scenario}")
+    concurrency_levels = [int(value) for value in args.concurrency.split(',')]
+
+    if args.config:
+        base_config = load_config(args.config)
+        if base_config is None:
+            return 1
+    else:
+        # 默认不让限速器成为瓶颈，重试退避缩短，便于比较并发本身的效果
+        base_config = {
+            'rate_limit': {'initial_rate': 50, 'max_rate': 200, 'min_rate': 1},
+            'retry': {'max_attempts': 5, 'run_retry_budget': 0, 'base_delay': 0.2, 'max_delay': 2.0,
+                      'breaker_failure_threshold': 20, 'breaker_reset_timeout': 2}
+        }
+    # 重试和失败日志会很多，只输出错误
+    logging.basicConfig(level=logging.ERROR, format='%(levelname)s - %(message)s')
+
+    print("豆瓣爬虫吞吐量基准测试")
+    print(f"场景: {', '.join(scenarios)}，并发数: {concurrency_levels}，总数: {args.total}，每页: {args.count}")
+    print("=" * 50)
+    results = []
+    for scenario in scenarios:
+        for concurrency in concurrency_levels:
+            results.append(run_benchmark(scenario, concurrency, args.total, args.count, base_config, args.seed))
+    print_results(results)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
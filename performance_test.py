@@ -8,9 +8,12 @@ import time
 import os
 import json
 import subprocess
+import sys
 import threading
 from datetime import datetime
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
 def test_file_stat_performance():
     """测试文件统计性能"""
     print("=== 文件统计性能测试 ===")
@@ -99,6 +102,72 @@ def test_file_stat_performance():
         os.remove(os.path.join(test_dir, filename))
     os.rmdir(test_dir)
 
+def _make_movie(i):
+    """生成接近真实接口数据结构的测试电影"""
+    return {
+        "id": str(30000000 + i),
+        "title": f"测试电影{i}",
+        "year": "2025",
+        "card_subtitle": "2025 / 中国大陆 / 剧情 爱情 / 导演甲 / 演员甲 演员乙 演员丙",
+        "rating": {"value": 7.5, "count": 1000 + i, "max": 10, "star_count": 4.0},
+        "pic": {"normal": f"https://img.doubanio.com/view/photo/m/{i}.jpg",
+                "large": f"https://img.doubanio.com/view/photo/l/{i}.jpg"},
+        "tags": [{"name": "剧情", "uri": "douban://tag/剧情"}],
+        "honor_infos": [],
+        "uri": f"douban://douban.com/movie/{30000000 + i}",
+        "is_new": i % 2 == 0
+    }
+
+def test_json_codec_performance(item_count=20000, rounds=3):
+    """测试JSON后端（orjson/ujson/标准库）读写大快照的性能"""
+    print("\n=== JSON编解码性能测试 ===")
+    
+    import json_codec
+    from snapshot import iter_snapshot_items
+    
+    test_dir = "test_performance_data"
+    os.makedirs(test_dir, exist_ok=True)
+    snapshot = {"count": item_count, "total": item_count,
+                "items": [_make_movie(i) for i in range(item_count)]}
+    json_path = os.path.join(test_dir, "douban_movies_bench.json")
+    ndjson_path = os.path.join(test_dir, "douban_movies_bench.ndjson")
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f, ensure_ascii=False, indent=2)
+    with open(ndjson_path, 'w', encoding='utf-8') as f:
+        for item in snapshot["items"]:
+            f.write(json.dumps(item, ensure_ascii=False) + '\n')
+    print(f"测试快照: {item_count} 条, JSON {os.path.getsize(json_path) / 1024 / 1024:.1f} MB")
+    
+    def best_of(func):
+        times = []
+        for _ in range(rounds):
+            start_time = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start_time)
+        return min(times)
+    
+    # 基准：原有的文本模式 json.load
+    def baseline_load():
+        with open(json_path, 'r', encoding='utf-8') as f:
+            json.load(f)
+    baseline = best_of(baseline_load)
+    print(f"{'文本模式 json.load':<24} 读取JSON: {baseline:.3f}秒")
+    
+    original_backend = json_codec.backend_name()
+    try:
+        for name in json_codec.available_backends():
+            json_codec.set_backend(name)
+            read_json = best_of(lambda: sum(1 for _ in iter_snapshot_items(json_path)))
+            read_ndjson = best_of(lambda: sum(1 for _ in iter_snapshot_items(ndjson_path)))
+            write_json = best_of(lambda: json_codec.dumps(snapshot, indent=True))
+            print(f"{name:<24} 读取JSON: {read_json:.3f}秒 ({baseline / read_json:.1f}x), "
+                  f"读取NDJSON: {read_ndjson:.3f}秒, 序列化: {write_json:.3f}秒")
+    finally:
+        json_codec.set_backend(original_backend)
+        for filename in os.listdir(test_dir):
+            os.remove(os.path.join(test_dir, filename))
+        os.rmdir(test_dir)
+
 def test_memory_usage():
     """测试内存使用情况"""
     print("\n=== 内存使用测试 ===")
@@ -159,6 +228,7 @@ def main():
     
     # 运行各项测试
     test_file_stat_performance()
+    test_json_codec_performance()
     test_memory_usage()
     test_gui_startup()
     
@@ -0,0 +1,10 @@
+"""
+python src <子命令> 的入口，转发到 douban_cli
+作者: mshellc
+"""
+
+import sys
+
+import douban_cli
+
+sys.exit(douban_cli.main())
@@ -0,0 +1,181 @@
+"""
+封面预取模块
+爬取过程中每写入一页，就把该页电影的封面链接（pic.normal / pic.large）放入队列，
+由独立的少量工作线程在后台下载到 image_cache，文件名与导出Excel时的 download_image 一致（URL的MD5），
+导出时直接使用缓存，不再逐张串行下载
+作者: mshellc
+"""
+
+import hashlib
+import logging
+import os
+import queue
+import threading
+
+import requests
+
+import http_client
+from http_cassette import http_get
+from retry_policy import get_retry_policy
+
+DEFAULT_CACHE_DIR = 'image_cache'
+
+
+def cover_cache_path(url, cache_dir=DEFAULT_CACHE_DIR):
+    """封面在图片缓存目录中的路径（URL的MD5哈希 + .jpg）"""
+    return os.path.join(cache_dir, f"{hashlib.md5(url.encode()).hexdigest()}.jpg")
+
+
+class CoverPrefetcher:
+    """后台封面预取
+
+    submit() 只把链接放入队列，不阻塞爬取；下载由 workers 个低优先级线程完成，
+    每次下载后等待 interval 秒，避免与推荐接口请求争抢带宽和连接（图片与推荐接口不在同一主机，
+    不占用推荐接口的限速器，除 interval 外没有其他让位机制）。
+    图片请求使用共享的 'image' 重试策略（与导出时相同的熔断状态）。
+    stop_event 被设置后放弃尚未开始的下载，等待预取完成时也会立即返回。
+
+    Args:
+        session: HTTP会话
+        cache_dir: 图片缓存目录
+        fields: 预取的封面字段（pic 下的 normal / large）
+        workers: 下载线程数
+        interval: 每个线程两次下载之间的间隔（秒）
+        stop_event: 爬虫的停止信号
+    """
+
+    def __init__(self, session, cache_dir=DEFAULT_CACHE_DIR, fields=('normal',), workers=2, interval=0.0,
+                 timeout=None, retry_policy=None, log=None, stop_event=None):
+        self.session = session
+        self.cache_dir = cache_dir
+        self.fields = tuple(fields)
+        self.interval = float(interval)
+        self.timeout = timeout or http_client.get_timeout()
+        self.retry_policy = retry_policy or get_retry_policy('image')
+        self.log = log or logging.getLogger()
+        self.stop_event = stop_event
+        self.queued = 0
+        self.downloaded = 0
+        self.cached = 0
+        self.failed = 0
+        self._seen = set()
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._cancelled = threading.Event()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._threads = [threading.Thread(target=self._run, name=f"cover-prefetch-{number}", daemon=True)
+                         for number in range(max(1, int(workers)))]
+        for thread in self._threads:
+            thread.start()
+
+    @classmethod
+    def from_config(cls, config, session=None, log=None, stop_event=None):
+        """根据配置中的 cover_prefetch 字段创建，未启用时返回None"""
+        options = (config or {}).get('cover_prefetch') or {}
+        if not options.get('enabled', False):
+            return None
+        # 缓存目录固定为导出和GUI使用的 image_cache
+        return cls(session or http_client.get_session(config),
+                   DEFAULT_CACHE_DIR,
+                   options.get('fields') or ('normal',),
+                   options.get('workers', 2),
+                   options.get('interval', 0.0),
+                   http_client.get_timeout(config),
+                   get_retry_policy('image', config),
+                   log,
+                   stop_event)
+
+    def submit(self, items):
+        """把一批条目的封面链接加入下载队列（已缓存或已排队的链接跳过）"""
+        for item in items:
+            pic = item.get('pic') or {}
+            for field in self.fields:
+                url = pic.get(field)
+                if not url:
+                    continue
+                with self._lock:
+                    if url in self._seen:
+                        continue
+                    self._seen.add(url)
+                if os.path.exists(cover_cache_path(url, self.cache_dir)):
+                    with self._lock:
+                        self.cached += 1
+                    continue
+                with self._lock:
+                    self.queued += 1
+                self._queue.put(url)
+
+    def _download(self, url):
+        def send():
+            response = http_get(self.session, url, wait=self._cancelled.wait, headers=http_client.IMAGE_HEADERS,
+                                timeout=self.timeout)
+            response.raise_for_status()
+            return response
+
+        try:
+            response = self.retry_policy.execute(url, send, wait=self._cancelled.wait)
+        except requests.exceptions.RequestException as e:
+            self.log.debug(f"预取封面失败 {url}: {e}")
+            return False
+        if not response.headers.get('content-type', '').startswith('image/'):
+            self.log.debug(f"预取封面跳过非图片响应 {url}")
+            return False
+        # 先写临时文件再改名，导出时不会读到写了一半的图片
+        path = cover_cache_path(url, self.cache_dir)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(response.content)
+        os.replace(tmp_path, path)
+        return True
+
+    def _run(self):
+        while True:
+            url = self._queue.get()
+            try:
+                if url is None:
+                    return
+                if self._stopping():
+                    continue
+                try:
+                    ok = self._download(url)
+                except Exception as e:
+                    # 写入缓存失败等：记为失败，不影响爬取
+                    self.log.debug(f"预取封面失败 {url}: {e}")
+                    ok = False
+                with self._lock:
+                    if ok:
+                        self.downloaded += 1
+                    else:
+                        self.failed += 1
+                if self.interval > 0:
+                    self._cancelled.wait(self.interval)
+            finally:
+                self._queue.task_done()
+
+    def _stopping(self):
+        if self.stop_event is not None and self.stop_event.is_set():
+            self._cancelled.set()
+        return self._cancelled.is_set()
+
+    def close(self, wait=True):
+        """停止预取；wait 为True时先下载完队列中的全部封面（期间收到停止信号则放弃剩余下载），
+        否则放弃尚未开始的下载"""
+        if not wait:
+            self._cancelled.set()
+        pending = self._queue.qsize()
+        if wait and pending:
+            self.log.info(f"等待封面预取完成，剩余 {pending} 张")
+        queue_done = self._queue.all_tasks_done
+        while not self._stopping():
+            with queue_done:
+                if not self._queue.unfinished_tasks:
+                    break
+                queue_done.wait(0.5)
+        # 取消后工作线程跳过剩余的链接，正在进行的重试等待也会立即结束
+        self._queue.join()
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self.log.info(f"封面预取: 下载 {self.downloaded} 张，已有缓存 {self.cached} 张，失败 {self.failed} 张"
+                      f"{'，已取消剩余下载' if self._cancelled.is_set() else ''}")
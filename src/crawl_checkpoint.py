@@ -0,0 +1,72 @@
+"""
+爬取检查点模块
+每完成一页就追加写入检查点文件，中断后可从已完成的页面继续爬取
+作者: mshellc
+"""
+
+import os
+import threading
+
+import json_codec
+
+
+class CrawlCheckpoint:
+    """按页追加的爬取检查点
+
+    文件为逐行JSON：第一行是头部（爬取参数、total、第一页元数据），
+    之后每行记录一页 {"offset": 起始位置, "items": [...]}。
+    追加写入使每页的持久化开销与页大小成正比，进程被强制结束时
+    最多丢失最后一行未写完的数据。
+    """
+
+    def __init__(self, path, params):
+        self.path = path
+        self.params = params
+        self._lock = threading.Lock()
+
+    def load(self):
+        """读取检查点
+
+        Returns:
+            (total, meta, pages) 元组，pages 为 {offset: items}；
+            检查点不存在或参数不匹配时返回 None
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                header = json_codec.loads(f.readline())
+                if header.get('params') != self.params:
+                    return None
+                pages = {}
+                for line in f:
+                    try:
+                        record = json_codec.loads(line)
+                    except ValueError:
+                        # 最后一行可能在写入时被中断
+                        break
+                    pages[record['offset']] = record['items']
+        except (OSError, ValueError, KeyError):
+            return None
+        return header.get('total', 0), header.get('meta', {}), pages
+
+    def start(self, total, meta):
+        """开始新的检查点，写入头部并清空之前的记录"""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        header = {'params': self.params, 'total': total, 'meta': meta}
+        with self._lock:
+            with open(self.path, 'wb') as f:
+                f.write(json_codec.dumps(header) + b'\n')
+
+    def record_page(self, offset, items):
+        """追加一页已完成的数据"""
+        line = json_codec.dumps({'offset': offset, 'items': items})
+        with self._lock:
+            with open(self.path, 'ab') as f:
+                f.write(line + b'\n')
+
+    def remove(self):
+        """爬取成功后删除检查点"""
+        with self._lock:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,144 @@
+"""
+日志配置模块
+根日志只挂一个 QueueHandler，记录放入队列后立即返回，由 QueueListener 后台线程写入控制台和日志文件，
+请求路径上不再同步写文件；日志文件按大小轮转。
+可选JSON行格式：每条日志一行JSON，通过 extra 传入的结构化字段（page、offset、latency、status等）
+作为独立的键输出，GUI和其他下游程序无需解析日志文本
+作者: mshellc
+"""
+
+import atexit
+import copy
+import logging
+import logging.handlers
+import queue
+
+import json_codec
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+TEXT = 'text'
+JSON = 'json'
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_BACKUP_COUNT = 5
+
+# LogRecord 自带的属性，其余属性都是通过 extra 传入的结构化字段
+_RECORD_ATTRIBUTES = set(logging.LogRecord('', 0, '', 0, '', (), None).__dict__) | {'message', 'asctime', 'taskName'}
+
+
+def record_fields(record):
+    """日志记录中通过 extra 传入的结构化字段"""
+    fields = {}
+    for name, value in record.__dict__.items():
+        if name in _RECORD_ATTRIBUTES or name.startswith('_'):
+            continue
+        if not isinstance(value, (str, int, float, bool, type(None))):
+            value = str(value)
+        fields[name] = value
+    return fields
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """每条日志输出为一行JSON: time、level、thread、message 以及结构化字段"""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'thread': record.threadName,
+            'message': record.getMessage()
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        entry.update(record_fields(record))
+        return json_codec.dumps(entry).decode('utf-8')
+
+
+def make_formatter(log_format):
+    if log_format == JSON:
+        return JsonLinesFormatter()
+    if log_format != TEXT:
+        raise ValueError(f"不支持的日志格式: {log_format}")
+    return logging.Formatter(TEXT_FORMAT)
+
+
+def parse_json_line(line):
+    """解析JSON行格式的日志，不是JSON日志时返回None（如未经logging输出的异常堆栈）"""
+    if not line.startswith('{'):
+        return None
+    try:
+        entry = json_codec.loads(line)
+    except ValueError:
+        return None
+    return entry if isinstance(entry, dict) and 'level' in entry else None
+
+
+class StructuredQueueHandler(logging.handlers.QueueHandler):
+    """保留结构化信息的队列处理器
+
+    QueueHandler.prepare 会在调用线程中把异常堆栈合并进 message 并清空 exc_info/exc_text，
+    JsonLinesFormatter 就无法输出独立的 exc 字段。这里只合并参数、保留格式化后的 exc_text，
+    由后台线程中的格式化器按各自格式输出堆栈。
+    """
+
+    def prepare(self, record):
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        # exc_text 已包含完整堆栈，不再保留 traceback 对象（避免队列中的记录引用调用栈上的局部变量）
+        record.exc_info = None
+        return record
+
+
+def _stop_listener(listener):
+    """退出时写完队列中剩余的日志；监听器已被停止时不做处理"""
+    if listener._thread is not None:
+        listener.stop()
+
+
+def configure_logging(config=None, log_file='douban_crawler.log', console_format=None):
+    """配置根日志（只在程序入口调用，根日志已有处理器时不做修改）
+
+    配置项 logging:
+        queue: 是否通过队列异步写日志（默认true）
+        format: 日志文件格式 text / json
+        console_format: 控制台格式，默认text
+        max_bytes: 日志文件达到该大小后轮转，0表示不轮转
+        backup_count: 保留的轮转文件数
+
+    Returns:
+        QueueListener，未使用队列或未配置时返回None
+    """
+    config = config or {}
+    options = config.get('logging') or {}
+    root = logging.getLogger()
+    if root.handlers:
+        return None
+    root.setLevel(getattr(logging, config.get('log_level', 'INFO'), logging.INFO))
+
+    max_bytes = options.get('max_bytes', DEFAULT_MAX_BYTES)
+    if max_bytes > 0:
+        file_handler = logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=max_bytes, backupCount=options.get('backup_count', DEFAULT_BACKUP_COUNT),
+            encoding='utf-8')
+    else:
+        file_handler = logging.FileHandler(log_file, encoding='utf-8')
+    file_handler.setFormatter(make_formatter(options.get('format', TEXT)))
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(make_formatter(console_format or options.get('console_format', TEXT)))
+    handlers = (file_handler, console_handler)
+
+    if not options.get('queue', True):
+        for handler in handlers:
+            root.addHandler(handler)
+        return None
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    root.addHandler(StructuredQueueHandler(log_queue))
+    listener.start()
+    atexit.register(_stop_listener, listener)
+    return listener
@@ -0,0 +1,261 @@
+"""
+爬取指标模块
+记录请求延迟直方图、接收字节数、按原因统计的重试次数、退避/限速等待时间、
+页面和条目吞吐量；提供Prometheus文本格式的 /metrics 接口和每轮爬取的JSON汇总
+作者: mshellc
+"""
+
+import logging
+import os
+import socketserver
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import json_codec
+
+# 请求延迟直方图的桶上限（秒）
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """累积直方图（Prometheus语义：每个桶统计小于等于上限的次数）"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for index, upper in enumerate(self.buckets):
+            if value <= upper:
+                self.counts[index] += 1
+
+    def quantile(self, q):
+        """按桶估算分位数（返回所在桶的上限）"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        for upper, count in zip(self.buckets, self.counts):
+            if count >= target:
+                return upper
+        return float('inf')
+
+
+class CrawlMetrics:
+    """爬取指标
+
+    每轮爬取创建一个以进程级指标为 parent 的实例，记录时同时累加到 parent：
+    进程级指标供 /metrics 持续导出，单轮指标用于生成该轮的JSON汇总。
+    """
+
+    def __init__(self, parent=None, job_name=None):
+        self.parent = parent
+        self.job_name = job_name
+        self.started_at = time.time()
+        self.latency = Histogram()
+        self.requests = {}
+        self.retries = {}
+        self.cache_responses = {}
+        self.bytes_received = 0
+        self.backoff_seconds = 0.0
+        self.rate_limit_wait_seconds = 0.0
+        self.pages = 0
+        self.items = 0
+        self.last_run = None
+        self._lock = threading.Lock()
+
+    def _apply(self, func):
+        with self._lock:
+            func(self)
+        if self.parent is not None:
+            self.parent._apply(func)
+
+    def observe_request(self, status, latency, size=0):
+        """记录一次请求：状态（HTTP状态码或异常类型）、延迟（秒）、响应字节数"""
+        status = str(status)
+
+        def update(metrics):
+            metrics.requests[status] = metrics.requests.get(status, 0) + 1
+            metrics.latency.observe(latency)
+            metrics.bytes_received += size
+        self._apply(update)
+
+    def observe_retry(self, cause, delay):
+        """记录一次重试及其退避时间"""
+        cause = str(cause)
+
+        def update(metrics):
+            metrics.retries[cause] = metrics.retries.get(cause, 0) + 1
+            metrics.backoff_seconds += delay
+        self._apply(update)
+
+    def observe_rate_limit_wait(self, seconds):
+        """记录等待限速令牌的时间"""
+        def update(metrics):
+            metrics.rate_limit_wait_seconds += seconds
+        self._apply(update)
+
+    def observe_cache(self, result):
+        """记录一次响应缓存结果（hit/revalidated/miss）"""
+        def update(metrics):
+            metrics.cache_responses[result] = metrics.cache_responses.get(result, 0) + 1
+        self._apply(update)
+
+    def observe_page(self, item_count):
+        """记录完成的一页"""
+        def update(metrics):
+            metrics.pages += 1
+            metrics.items += item_count
+        self._apply(update)
+
+    def summary(self):
+        """当前指标的汇总字典"""
+        with self._lock:
+            elapsed = max(time.time() - self.started_at, 1e-6)
+            return {
+                'job': self.job_name,
+                'started_at': datetime.fromtimestamp(self.started_at).isoformat(timespec='seconds'),
+                'duration_seconds': round(elapsed, 3),
+                'requests': dict(self.requests),
+                'request_count': self.latency.count,
+                'latency_avg_seconds': round(self.latency.sum / self.latency.count, 4) if self.latency.count else 0.0,
+                'latency_p50_seconds': self.latency.quantile(0.5),
+                'latency_p95_seconds': self.latency.quantile(0.95),
+                'bytes_received': self.bytes_received,
+                'retries': dict(self.retries),
+                'backoff_seconds': round(self.backoff_seconds, 3),
+                'rate_limit_wait_seconds': round(self.rate_limit_wait_seconds, 3),
+                'cache_responses': dict(self.cache_responses),
+                'pages': self.pages,
+                'items': self.items,
+                'pages_per_second': round(self.pages / elapsed, 3),
+                'items_per_second': round(self.items / elapsed, 3)
+            }
+
+    def finish_run(self, output_dir=None, success=None):
+        """结束一轮爬取：生成汇总、写入 <output_dir>/.metrics/ 并登记到 parent"""
+        summary = self.summary()
+        summary['success'] = success
+        if self.parent is not None:
+            with self.parent._lock:
+                self.parent.last_run = summary
+        if output_dir:
+            metrics_dir = os.path.join(output_dir, '.metrics')
+            os.makedirs(metrics_dir, exist_ok=True)
+            name = f"{self.job_name or 'default'}_{datetime.fromtimestamp(self.started_at).strftime('%Y%m%d_%H%M%S')}.json"
+            with open(os.path.join(metrics_dir, name), 'wb') as f:
+                json_codec.dump(summary, f, indent=True)
+        logging.info(
+            f"本轮指标: {summary['request_count']} 次请求，平均延迟 {summary['latency_avg_seconds']:.3f}s "
+            f"(p95≤{summary['latency_p95_seconds']}s)，接收 {summary['bytes_received']} 字节，"
+            f"重试 {sum(summary['retries'].values())} 次，退避 {summary['backoff_seconds']:.1f}s，"
+            f"限速等待 {summary['rate_limit_wait_seconds']:.1f}s，"
+            f"{summary['pages_per_second']:.2f} 页/秒，{summary['items_per_second']:.2f} 条/秒"
+        )
+        return summary
+
+    def render_prometheus(self):
+        """Prometheus文本格式"""
+        lines = []
+
+        def metric(name, metric_type, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{val}"' for key, val in labels.items())
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+        with self._lock:
+            metric('douban_requests_total', 'counter', 'HTTP requests by status code or error type',
+                   [({'status': status}, count) for status, count in sorted(self.requests.items())])
+            lines.append('# HELP douban_request_latency_seconds Request latency')
+            lines.append('# TYPE douban_request_latency_seconds histogram')
+            for upper, count in zip(self.latency.buckets, self.latency.counts):
+                lines.append(f'douban_request_latency_seconds_bucket{{le="{upper}"}} {count}')
+            lines.append(f'douban_request_latency_seconds_bucket{{le="+Inf"}} {self.latency.count}')
+            lines.append(f'douban_request_latency_seconds_sum {self.latency.sum}')
+            lines.append(f'douban_request_latency_seconds_count {self.latency.count}')
+            metric('douban_bytes_received_total', 'counter', 'Response bytes received', [({}, self.bytes_received)])
+            metric('douban_retries_total', 'counter', 'Request retries by cause',
+                   [({'cause': cause}, count) for cause, count in sorted(self.retries.items())])
+            metric('douban_backoff_seconds_total', 'counter', 'Time spent in retry backoff',
+                   [({}, self.backoff_seconds)])
+            metric('douban_rate_limit_wait_seconds_total', 'counter', 'Time spent waiting for rate limiter tokens',
+                   [({}, self.rate_limit_wait_seconds)])
+            metric('douban_cache_responses_total', 'counter', 'Response cache results',
+                   [({'result': result}, count) for result, count in sorted(self.cache_responses.items())])
+            metric('douban_pages_total', 'counter', 'Pages fetched', [({}, self.pages)])
+            metric('douban_items_total', 'counter', 'Movie items fetched', [({}, self.items)])
+            if self.last_run is not None:
+                for key in ('duration_seconds', 'pages_per_second', 'items_per_second'):
+                    metric(f'douban_last_run_{key}', 'gauge', f'Last run {key.replace("_", " ")}',
+                           [({}, self.last_run[key])])
+        return '\n'.join(lines) + '\n'
+
+
+_process_metrics = CrawlMetrics()
+
+
+def get_metrics():
+    """进程级累计指标"""
+    return _process_metrics
+
+
+def new_run_metrics(job_name=None):
+    """创建一轮爬取的指标，记录时同时累加到进程级指标"""
+    return CrawlMetrics(parent=_process_metrics, job_name=job_name)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = get_metrics().render_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # 抓取请求很频繁，不写入爬虫日志
+        pass
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+_metrics_server = None
+
+
+def start_metrics_server(config):
+    """按配置 metrics.enabled/host/port 在后台线程启动 /metrics 接口，返回服务器或None"""
+    global _metrics_server
+    options = (config or {}).get('metrics') or {}
+    if not options.get('enabled', False) or _metrics_server is not None:
+        return _metrics_server
+    address = (options.get('host', '127.0.0.1'), int(options.get('port', 9108)))
+    try:
+        _metrics_server = _ThreadingHTTPServer(address, _MetricsHandler)
+    except OSError as e:
+        logging.warning(f"指标接口启动失败 {address[0]}:{address[1]}: {e}")
+        return None
+    threading.Thread(target=_metrics_server.serve_forever, name='metrics-server', daemon=True).start()
+    logging.info(f"指标接口: http://{address[0]}:{address[1]}/metrics")
+    return _metrics_server
+
+
+def stop_metrics_server():
+    """停止 /metrics 接口（配置变更后调用，再次 start_metrics_server 时按新配置启动）"""
+    global _metrics_server
+    if _metrics_server is not None:
+        _metrics_server.shutdown()
+        _metrics_server.server_close()
+        _metrics_server = None
@@ -0,0 +1,173 @@
+"""
+爬取流水线模块
+把爬取拆成若干阶段（请求 -> 解析/裁剪 -> 持久化），阶段之间用有界队列连接：
+下游处理不过来时上游在放入队列时阻塞（背压），每个阶段有自己的工作线程数，
+整体吞吐量取决于最慢的阶段，而不是各阶段耗时之和
+作者: mshellc
+"""
+
+import logging
+import queue
+import threading
+import time
+
+# 队列结束标记
+_DONE = object()
+# 阻塞等待时检查中止标记的间隔（秒）
+_POLL_INTERVAL = 0.1
+
+
+class PipelineAborted(Exception):
+    """流水线已因某个阶段出错而中止"""
+
+
+class Stage:
+    """流水线阶段
+
+    Args:
+        name: 阶段名（用于日志和统计）
+        func: 处理函数 func(item)，返回值传给下一阶段；返回None表示不向下游传递
+        workers: 工作线程数
+    """
+
+    def __init__(self, name, func, workers=1):
+        self.name = name
+        self.func = func
+        self.workers = max(1, int(workers))
+        self.processed = 0
+        self.busy_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self._stats_lock = threading.Lock()
+
+    def _add_stats(self, busy, blocked):
+        with self._stats_lock:
+            self.processed += 1
+            self.busy_seconds += busy
+            self.blocked_seconds += blocked
+
+
+class Pipeline:
+    """多阶段流水线
+
+    put() 把条目送入第一个阶段（队列满时阻塞），join() 等待全部条目处理完毕。
+    任一阶段抛出异常时流水线中止：其余工作线程尽快退出，put() 和 join() 重新抛出第一个异常。
+
+    Args:
+        stages: Stage 列表，按处理顺序排列
+        queue_size: 每个阶段输入队列的容量
+    """
+
+    def __init__(self, stages, queue_size=8):
+        self.stages = list(stages)
+        self._queues = [queue.Queue(maxsize=max(1, int(queue_size))) for _ in self.stages]
+        self._threads = [[] for _ in self.stages]
+        self._abort = threading.Event()
+        self._error = None
+        self._error_lock = threading.Lock()
+        self._started_at = None
+
+    def start(self):
+        self._started_at = time.monotonic()
+        for index, stage in enumerate(self.stages):
+            for number in range(stage.workers):
+                thread = threading.Thread(target=self._run_worker, args=(index,),
+                                          name=f"pipeline-{stage.name}-{number}", daemon=True)
+                thread.start()
+                self._threads[index].append(thread)
+        return self
+
+    def _fail(self, error):
+        with self._error_lock:
+            if self._error is None:
+                self._error = error
+        self._abort.set()
+
+    def _raise_if_failed(self):
+        if self._abort.is_set():
+            raise self._error if self._error is not None else PipelineAborted()
+
+    def _put(self, index, item):
+        """放入第 index 个阶段的输入队列，队列满时阻塞，流水线中止时抛出异常"""
+        target = self._queues[index]
+        while True:
+            self._raise_if_failed()
+            try:
+                target.put(item, timeout=_POLL_INTERVAL)
+                return
+            except queue.Full:
+                continue
+
+    def _run_worker(self, index):
+        stage = self.stages[index]
+        source = self._queues[index]
+        has_next = index + 1 < len(self.stages)
+        while not self._abort.is_set():
+            try:
+                item = source.get(timeout=_POLL_INTERVAL)
+            except queue.Empty:
+                continue
+            if item is _DONE:
+                # 把结束标记放回，让同一阶段的其他工作线程也能看到
+                source.put(_DONE)
+                return
+            started = time.monotonic()
+            try:
+                result = stage.func(item)
+            except BaseException as e:
+                self._fail(e)
+                return
+            finished = time.monotonic()
+            if has_next and result is not None:
+                try:
+                    self._put(index + 1, result)
+                except BaseException:
+                    return
+            stage._add_stats(finished - started, time.monotonic() - finished)
+
+    def put(self, item):
+        """送入一个条目（背压：第一个阶段的队列满时阻塞）"""
+        self._put(0, item)
+
+    def join(self):
+        """按阶段顺序关闭队列并等待所有工作线程退出，有阶段出错时抛出该异常"""
+        for index, threads in enumerate(self._threads):
+            if not self._abort.is_set():
+                try:
+                    self._put(index, _DONE)
+                except BaseException:
+                    pass
+            for thread in threads:
+                thread.join()
+        self._raise_if_failed()
+
+    def abort(self, error=None):
+        """中止流水线（如调用方被中断），并等待工作线程退出"""
+        self._fail(error or PipelineAborted())
+        for threads in self._threads:
+            for thread in threads:
+                thread.join()
+
+    def summary(self):
+        """各阶段统计：处理数、忙碌时间、因下游队列已满而阻塞的时间"""
+        elapsed = time.monotonic() - self._started_at if self._started_at else 0.0
+        return {
+            'elapsed_seconds': round(elapsed, 3),
+            'stages': [{
+                'name': stage.name,
+                'workers': stage.workers,
+                'processed': stage.processed,
+                'busy_seconds': round(stage.busy_seconds, 3),
+                'blocked_seconds': round(stage.blocked_seconds, 3),
+                # 忙碌时间占 (工作线程数 × 总耗时) 的比例，接近100%的阶段就是瓶颈
+                'utilization': round(stage.busy_seconds / (stage.workers * elapsed), 3) if elapsed else 0.0
+            } for stage in self.stages]
+        }
+
+    def log_summary(self, log=None):
+        log = log or logging.getLogger()
+        summary = self.summary()
+        parts = [f"{s['name']}×{s['workers']} 处理 {s['processed']}，忙碌 {s['busy_seconds']:.1f}s"
+                 f"（利用率 {s['utilization']:.0%}），背压等待 {s['blocked_seconds']:.1f}s"
+                 for s in summary['stages']]
+        log.info(f"流水线 {summary['elapsed_seconds']:.1f}s: " + '；'.join(parts))
+        return summary
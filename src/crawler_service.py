@@ -0,0 +1,371 @@
+"""
+爬虫常驻服务模块
+爬虫进程常驻运行，按自己的调度器执行定时爬取，并通过本机TCP端口接收控制命令
+（start/stop/status/reconfigure/logs/metrics/shutdown），GUI连接该端口进行控制，
+不再为每一轮爬取启动新的Python进程
+作者: mshellc
+"""
+
+import argparse
+import collections
+import ipaddress
+import logging
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+import douban_crawler
+import http_client
+import json_codec
+from http_cassette import close_cassette
+from movie_store import close_movie_store
+from response_cache import reset_response_cache
+from retry_policy import reset_retry_policies
+from crawl_logging import TEXT_FORMAT, record_fields
+from crawl_metrics import get_metrics, start_metrics_server, stop_metrics_server
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 47621
+
+# 只在启动时读取、修改后需要重启服务才能生效的配置项
+RESTART_KEYS = ('service', 'logging', 'log_level')
+
+
+def is_loopback(host):
+    """host 是否为本机回环地址"""
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+    except (OSError, ValueError):
+        return False
+
+
+def service_address(config):
+    """控制端口地址，取配置中的 service.host / service.port
+
+    控制命令没有身份验证，且可以修改输出目录、接口地址等配置，因此只允许监听本机回环地址，
+    配置为其他地址时改用 127.0.0.1。
+    """
+    options = (config or {}).get('service') or {}
+    host = options.get('host', DEFAULT_HOST)
+    if not is_loopback(host):
+        logging.warning(f"控制端口只能监听本机回环地址，忽略 service.host={host}，改用 {DEFAULT_HOST}")
+        host = DEFAULT_HOST
+    return host, int(options.get('port', DEFAULT_PORT))
+
+
+class LogBuffer(logging.Handler):
+    """保存最近的日志记录，客户端按序号增量拉取"""
+
+    def __init__(self, capacity=2000):
+        super().__init__()
+        self.setFormatter(logging.Formatter(TEXT_FORMAT))
+        self._records = collections.deque(maxlen=capacity)
+        self._seq = 0
+        self._records_lock = threading.Lock()
+
+    def emit(self, record):
+        try:
+            line = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+        fields = record_fields(record)
+        with self._records_lock:
+            self._seq += 1
+            self._records.append([self._seq, record.levelname, line, fields])
+
+    def since(self, seq):
+        """返回序号大于 seq 的日志记录 [序号, 级别, 文本, 结构化字段]"""
+        with self._records_lock:
+            return [entry for entry in self._records if entry[0] > seq]
+
+
+class CrawlerService:
+    """常驻爬虫服务
+
+    调度线程按 crawl_interval 循环执行 run_crawl_cycle；stop 通过共享的 stop_event
+    让正在进行的爬取保存检查点后退出。reconfigure 更新的配置从下一轮爬取开始生效，
+    依赖配置的进程级共享对象（会话、重试策略、响应缓存、电影库、磁带、指标接口）在下一轮之前按新配置重建；
+    RESTART_KEYS 中的配置项（控制端口、日志）需要重启服务才能生效。
+    """
+
+    IDLE = 'idle'
+    RUNNING = 'running'
+    WAITING = 'waiting'
+
+    def __init__(self, config, log_buffer=None):
+        self.config = config
+        self.log_buffer = log_buffer
+        self.state = self.IDLE
+        self.cycles = 0
+        self.last_success = None
+        self.last_started = None
+        self.last_finished = None
+        self.next_run = None
+        self._once = False
+        self._pending_start = None
+        self._changed_keys = set()
+        self._thread = None
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self, once=False):
+        """开始调度，已在运行时返回False
+
+        stop 之后调度线程仍在收尾（保存检查点）时不等待，排队到它退出后立即重新开始，同样返回True。
+        """
+        with self._lock:
+            if self._thread is not None:
+                if not douban_crawler.stop_event.is_set():
+                    return False
+                self._pending_start = once
+                logging.info("上一轮爬取正在停止，结束后重新开始")
+                return True
+            douban_crawler.stop_event.clear()
+            self._once = once
+            self._thread = threading.Thread(target=self._run_loop, name='crawler-scheduler', daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self, wait=0):
+        """停止调度和正在进行的爬取"""
+        with self._lock:
+            self._pending_start = None
+        douban_crawler.stop_event.set()
+        self._wake.set()
+        thread = self._thread
+        if wait and thread is not None:
+            thread.join(wait)
+
+    def reconfigure(self, config=None):
+        """更新配置，未传入时重新读取config.json"""
+        if config is None:
+            config = douban_crawler.load_config()
+            if config is None:
+                raise ValueError("配置文件格式错误")
+        with self._lock:
+            changed = {key for key in set(self.config) | set(config) if self.config.get(key) != config.get(key)}
+            self._changed_keys |= changed
+            self.config = config
+            if self.state == self.WAITING and self.last_finished is not None:
+                # 按新的间隔重新计算下一轮时间
+                self.next_run = self.last_finished + config.get('crawl_interval', 3600)
+        self._wake.set()
+        logging.info("服务配置已更新，将从下一轮爬取开始生效")
+        restart_keys = [key for key in RESTART_KEYS if key in changed]
+        if restart_keys:
+            logging.warning(f"配置项 {', '.join(restart_keys)} 需要重启服务才能生效")
+
+    def status(self):
+        with self._lock:
+            config = self.config
+            return {
+                'state': self.state,
+                'cycles': self.cycles,
+                'last_success': self.last_success,
+                'last_started': self.last_started,
+                'last_finished': self.last_finished,
+                'next_run': self.next_run,
+                'enable_schedule': config.get('enable_schedule', False),
+                'crawl_interval': config.get('crawl_interval', 3600),
+                'tags': config.get('tags'),
+                'sort': config.get('sort')
+            }
+
+    def _set_state(self, state, **fields):
+        with self._lock:
+            self.state = state
+            for name, value in fields.items():
+                setattr(self, name, value)
+
+    def _apply_pending_reset(self):
+        """配置变更后重建依赖配置的进程级共享对象（只在两轮爬取之间执行）
+
+        页大小缓存、字段裁剪等每轮按配置创建的对象不需要重建；磁带只在 cassette 配置变化时重建，
+        避免录制模式下重新打开时覆盖已录制的内容。
+        """
+        with self._lock:
+            changed, self._changed_keys = self._changed_keys, set()
+            config = self.config
+        if not changed:
+            return
+        http_client.close_session()
+        reset_retry_policies()
+        if changed & {'response_cache'}:
+            reset_response_cache()
+        if changed & {'movie_store', 'output_directory'}:
+            close_movie_store()
+        if changed & {'cassette', 'output_directory'}:
+            close_cassette()
+        if changed & {'metrics'}:
+            stop_metrics_server()
+            start_metrics_server(config)
+
+    def _run_loop(self):
+        try:
+            while True:
+                self._run_schedule()
+                with self._lock:
+                    once, self._pending_start = self._pending_start, None
+                    if once is None:
+                        # 在同一把锁内清除线程，start 不会把请求排队给已经退出的线程
+                        self._thread = None
+                        self.state = self.IDLE
+                        self.next_run = None
+                        break
+                    douban_crawler.stop_event.clear()
+                    self._once = once
+        except BaseException:
+            with self._lock:
+                self._thread = None
+                self.state = self.IDLE
+            raise
+        logging.info("爬虫服务已停止调度")
+
+    def _run_schedule(self):
+        stop_event = douban_crawler.stop_event
+        while not stop_event.is_set():
+            self._apply_pending_reset()
+            with self._lock:
+                config = self.config
+            self._set_state(self.RUNNING, last_started=time.time(), next_run=None)
+            logging.info("开始爬取任务...")
+            try:
+                success = douban_crawler.run_crawl_cycle(config)
+            except Exception as e:
+                logging.error(f"爬取任务发生未预期错误: {e}")
+                success = False
+            finished = time.time()
+            with self._lock:
+                self.cycles += 1
+                self.last_success = success
+                self.last_finished = finished
+                config = self.config
+            logging.info("爬取任务完成" if success else "爬取任务失败")
+
+            if self._once or stop_event.is_set() or not config.get('enable_schedule', False):
+                break
+
+            interval = config.get('crawl_interval', 3600)
+            self._set_state(self.WAITING, next_run=finished + interval)
+            logging.info(f"等待 {interval} 秒后进行下一次爬取...")
+            # 等待期间可被 stop 或 reconfigure（修改间隔）唤醒
+            while not stop_event.is_set():
+                with self._lock:
+                    remaining = self.next_run - time.time()
+                if remaining <= 0:
+                    break
+                self._wake.wait(remaining)
+                self._wake.clear()
+
+    def handle_command(self, request, server=None):
+        """执行一条控制命令，返回响应字典"""
+        cmd = request.get('cmd')
+        if cmd == 'start':
+            if 'config' in request:
+                self.reconfigure(request['config'])
+            started = self.start(once=request.get('once', False))
+            return {'ok': True, 'started': started, 'status': self.status()}
+        if cmd == 'stop':
+            self.stop(wait=request.get('wait', 0))
+            return {'ok': True, 'status': self.status()}
+        if cmd == 'status':
+            return {'ok': True, 'status': self.status()}
+        if cmd == 'metrics':
+            return {'ok': True, 'metrics': get_metrics().summary(), 'last_run': get_metrics().last_run}
+        if cmd == 'reconfigure':
+            self.reconfigure(request.get('config'))
+            return {'ok': True, 'status': self.status()}
+        if cmd == 'logs':
+            records = self.log_buffer.since(request.get('since', 0)) if self.log_buffer else []
+            return {'ok': True, 'records': records, 'status': self.status()}
+        if cmd == 'shutdown':
+            self.stop()
+            if server is not None:
+                # shutdown 会等待 serve_forever 退出，不能在请求处理线程中直接调用
+                threading.Thread(target=server.shutdown, daemon=True).start()
+            return {'ok': True}
+        return {'ok': False, 'error': f"未知命令: {cmd}"}
+
+
+class _ControlHandler(socketserver.StreamRequestHandler):
+    """控制连接：每行一个JSON命令，每个命令返回一行JSON响应"""
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                response = self.server.service.handle_command(json_codec.loads(line), self.server)
+            except Exception as e:
+                response = {'ok': False, 'error': str(e)}
+            self.wfile.write(json_codec.dumps(response) + b'\n')
+
+
+class ControlServer(socketserver.ThreadingTCPServer):
+    """只监听本机地址的控制端口"""
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, service):
+        super().__init__(address, _ControlHandler)
+        self.service = service
+
+
+def send_command(address, cmd, timeout=5, **params):
+    """向常驻服务发送一条命令并返回响应
+
+    Raises:
+        OSError: 服务未运行或连接失败
+    """
+    request = dict(params, cmd=cmd)
+    with socket.create_connection(address, timeout=timeout) as sock:
+        sock.sendall(json_codec.dumps(request) + b'\n')
+        with sock.makefile('rb') as f:
+            line = f.readline()
+    if not line:
+        raise ConnectionError("服务未返回响应")
+    return json_codec.loads(line)
+
+
+def is_service_running(address, timeout=1):
+    """检查常驻服务是否可以连接"""
+    try:
+        return send_command(address, 'status', timeout=timeout).get('ok', False)
+    except (OSError, ValueError):
+        return False
+
+
+def serve(config, autostart=False):
+    """启动常驻服务并阻塞，直到收到 shutdown 命令或 Ctrl+C"""
+    log_buffer = LogBuffer()
+    logging.getLogger().addHandler(log_buffer)
+    service = CrawlerService(config, log_buffer)
+    address = service_address(config)
+    server = ControlServer(address, service)
+    logging.info(f"爬虫服务已启动，控制端口: {address[0]}:{address[1]}")
+    start_metrics_server(config)
+    if autostart:
+        service.start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logging.info("用户中断服务")
+    finally:
+        service.stop(wait=30)
+        server.server_close()
+        logging.info("爬虫服务已退出")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='豆瓣电影爬虫常驻服务')
+    parser.add_argument('--autostart', action='store_true', help='启动后立即开始爬取')
+    args = parser.parse_args()
+    config = douban_crawler.load_config()
+    if config is None:
+        sys.exit(1)
+    douban_crawler.setup_logging(config)
+    serve(config, autostart=args.autostart)
@@ -0,0 +1,191 @@
+"""
+豆瓣电影工具命令行入口
+用法（在项目根目录执行）:
+    python src crawl [--service] [--autostart]
+    python src export [--all-files] [--no-images] [--include-partial]
+    python src stats [--all] [--service]
+    python src shard plan|work|merge|status [--run-id RUN_ID]
+或将src加入PYTHONPATH后使用 python -m douban_cli <子命令>
+
+各子命令只在执行时导入所需模块：stats 不导入requests，只有 export 导入pandas/openpyxl
+作者: mshellc
+"""
+
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+
+DEFAULT_CONFIG_PATH = 'config.json'
+
+
+def _load_config(path):
+    """读取配置文件，格式错误时返回None"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except json.JSONDecodeError as e:
+        print(f"配置文件格式错误: {e}", file=sys.stderr)
+        return None
+
+
+def _format_size(size):
+    if size >= 1024 * 1024:
+        return f"{size / (1024 * 1024):.1f} MB"
+    if size >= 1024:
+        return f"{size / 1024:.1f} KB"
+    return f"{size} B"
+
+
+def cmd_crawl(args, config):
+    """执行爬取（单次或定时），或以常驻服务方式运行"""
+    import douban_crawler
+
+    # 配置文件不存在时使用爬虫的默认配置
+    config = config or douban_crawler.load_config(args.config)
+    douban_crawler.setup_logging(config)
+    if args.service:
+        import crawler_service
+        crawler_service.serve(config, autostart=args.autostart)
+        return 0
+    douban_crawler.install_signal_handlers()
+    try:
+        success = douban_crawler.main(config)
+    except KeyboardInterrupt:
+        return 130
+    return 0 if success is not False else 1
+
+
+def cmd_export(args, config):
+    """导出Excel"""
+    import export_to_excel
+
+    export_to_excel.export_douban_to_excel(
+        use_latest_only=not args.all_files,
+        include_images=not args.no_images,
+        config=config,
+        include_partial=args.include_partial
+    )
+    return 0
+
+
+def cmd_stats(args, config):
+    """输出快照、电影库和常驻服务的统计信息"""
+    from snapshot import list_snapshot_files, count_snapshot_items
+    from movie_store import MovieStore
+
+    data_dir = config.get('output_directory', 'data')
+    snapshot_files = list_snapshot_files(data_dir)
+    paths = [os.path.join(data_dir, name) for name in snapshot_files]
+    total_size = sum(os.path.getsize(path) for path in paths)
+    print(f"数据目录: {data_dir}")
+    print(f"快照文件: {len(paths)} 个 ({_format_size(total_size)})")
+
+    if paths:
+        latest = max(paths, key=os.path.getmtime)
+        latest_time = datetime.fromtimestamp(os.path.getmtime(latest)).strftime('%Y-%m-%d %H:%M')
+        print(f"最新快照: {os.path.basename(latest)} ({latest_time}), {count_snapshot_items(latest)} 条")
+        if args.all:
+            total_items = sum(count_snapshot_items(path) for path in paths)
+            print(f"所有快照合计: {total_items} 条（含重复）")
+
+    movie_store = MovieStore.from_config(config, create=False)
+    if movie_store is not None:
+        print(f"电影库: {movie_store.count()} 部，最近更新 {movie_store.last_seen() or '从未'}")
+        movie_store.close()
+
+    if args.service:
+        import crawler_service
+        address = crawler_service.service_address(config)
+        try:
+            status = crawler_service.send_command(address, 'status', timeout=2)['status']
+        except (OSError, ValueError):
+            print(f"常驻服务: 未运行 ({address[0]}:{address[1]})")
+        else:
+            print(f"常驻服务: {status['state']}，已完成 {status['cycles']} 轮，"
+                  f"上一轮{'成功' if status['last_success'] else '失败' if status['last_success'] is False else '无'}")
+    return 0
+
+
+def cmd_shard(args, config):
+    """分片爬取：plan（协调者）、work（工作进程）、merge（合并）、status（进度）"""
+    import douban_crawler
+    import sharded_crawl
+
+    config = config or douban_crawler.load_config(args.config)
+    if args.action == 'status':
+        result = sharded_crawl.run_status(config, args.run_id)
+        if result is None:
+            print("队列中没有分片运行")
+            return 1
+        run_id, jobs = result
+        print(f"分片运行: {run_id}")
+        for job_name, counts in jobs.items():
+            summary = '，'.join(f"{state} {count}" for state, count in sorted(counts.items()))
+            print(f"  {job_name}: {summary}")
+        return 0
+
+    douban_crawler.setup_logging(config)
+    douban_crawler.install_signal_handlers()
+    if args.action == 'plan':
+        return 0 if sharded_crawl.plan_run(config, args.run_id) else 1
+    if args.action == 'work':
+        success = sharded_crawl.run_worker(config, args.run_id, args.worker_id, args.max_leases)
+        return 0 if success else 1
+    filenames = sharded_crawl.merge_run(config, args.run_id, allow_partial=args.partial,
+                                        keep_parts=args.keep_parts)
+    return 0 if filenames is not None else 1
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='douban_cli', description='豆瓣电影数据工具')
+    parser.add_argument('--config', default=DEFAULT_CONFIG_PATH, help='配置文件路径（默认 config.json）')
+    subparsers = parser.add_subparsers(dest='command')
+
+    crawl_parser = subparsers.add_parser('crawl', help='爬取豆瓣电影数据')
+    crawl_parser.add_argument('--service', action='store_true', help='以常驻服务方式运行，通过控制端口接收命令')
+    crawl_parser.add_argument('--autostart', action='store_true', help='常驻服务启动后立即开始爬取')
+    crawl_parser.set_defaults(func=cmd_crawl)
+
+    export_parser = subparsers.add_parser('export', help='导出数据到Excel')
+    export_parser.add_argument('--all-files', action='store_true',
+                               help='导出全部数据（启用电影库时读取电影库，否则处理所有快照文件）')
+    export_parser.add_argument('--no-images', action='store_true', help='不下载封面图片，仅保留封面链接')
+    export_parser.add_argument('--include-partial', action='store_true',
+                               help='包含中止的爬取保存的部分结果快照（文件名带 _partial）')
+    export_parser.set_defaults(func=cmd_export)
+
+    stats_parser = subparsers.add_parser('stats', help='查看数据统计')
+    stats_parser.add_argument('--all', action='store_true', help='统计所有快照中的条目数（需要读取全部快照）')
+    stats_parser.add_argument('--service', action='store_true', help='同时查询常驻服务状态')
+    stats_parser.set_defaults(func=cmd_stats)
+
+    shard_parser = subparsers.add_parser('shard', help='分片爬取（多进程/多机器共享租约队列）')
+    shard_parser.add_argument('action', choices=['plan', 'work', 'merge', 'status'],
+                              help='plan 创建租约，work 领取并执行租约，merge 合并结果，status 查看进度')
+    shard_parser.add_argument('--run-id', help='分片运行ID（默认为最近一次运行，plan时默认按时间生成）')
+    shard_parser.add_argument('--worker-id', help='工作进程标识（默认为 主机名-进程号）')
+    shard_parser.add_argument('--max-leases', type=int, default=0, help='工作进程最多执行的租约数，0表示不限')
+    shard_parser.add_argument('--partial', action='store_true', help='仍有未完成租约时也合并已完成部分')
+    shard_parser.add_argument('--keep-parts', action='store_true', help='合并后保留分片结果')
+    shard_parser.set_defaults(func=cmd_shard)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not args.command:
+        parser.print_help()
+        return 2
+    config = _load_config(args.config)
+    if config is None:
+        return 1
+    return args.func(args, config)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,7 @@
 """
 豆瓣电影数据爬虫核心模块
+导入本模块不会读取配置或配置日志，配置由调用方传入；
+作为脚本运行或通过 douban_cli 调用时才读取config.json并配置日志
 作者: mshellc
 """
 
@@ -9,11 +11,44 @@ import time
 from datetime import datetime
 import logging
 import os
+import threading
+import signal
+import sys
+import itertools
+import argparse
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import http_client
+from rate_limiter import AdaptiveRateLimiter, parse_retry_after
+from crawl_checkpoint import CrawlCheckpoint
+from retry_policy import get_retry_policy
+from response_cache import get_response_cache
+from http_cassette import close_cassette, get_cassette, http_get
+from snapshot import create_snapshot_writer, iter_snapshot_items
+from movie_store import get_movie_store
+from item_fields import build_projection, project_items
+from movie_details import DetailEnricher
+from crawl_pipeline import Pipeline, Stage
+from page_size import AUTO as PAGE_SIZE_AUTO, PageSizeCache, honoured_count, probe_max_from_config
+from page_drift import PageDriftTracker
+from cover_prefetch import CoverPrefetcher
+import json_codec
+from crawl_logging import configure_logging
+from crawl_metrics import new_run_metrics, start_metrics_server
+
+DEFAULT_CONFIG_PATH = 'config.json'
+DEFAULT_LOG_FILE = 'douban_crawler.log'
+# 推荐接口地址，可通过配置 api_base_url 指向本地模拟接口（mock_douban_api.py）
+DEFAULT_API_BASE_URL = 'https://m.douban.com'
+RECOMMEND_PATH = '/rexxar/api/v2/movie/recommend'
+# 补抓漂移窗口时，榜单仍在变化导致窗口平移的最多次数
+DRIFT_WINDOW_ADJUSTMENTS = 3
 
 # 加载配置
-def load_config():
+def load_config(path=DEFAULT_CONFIG_PATH):
     try:
-        with open('config.json', 'r', encoding='utf-8') as f:
+        with open(path, 'r', encoding='utf-8') as f:
             config = json.load(f)
         return config
     except FileNotFoundError:
@@ -29,23 +64,129 @@ def load_config():
         print(f"配置文件格式错误: {e}")
         return None
 
-# 配置日志
-config = load_config()
-if config is None:
-    exit(1)
-
-log_level = getattr(logging, config.get('log_level', 'INFO'))
-logging.basicConfig(
-    level=log_level,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('douban_crawler.log'),
-        logging.StreamHandler()
-    ]
-)
-
-def fetch_douban_movies(config=None):
-    """爬取豆瓣电影推荐数据"""
+# 配置日志（只在程序入口调用）
+def setup_logging(config=None, log_file=DEFAULT_LOG_FILE, console_format=None):
+    """配置根日志：经队列异步输出到控制台和按大小轮转的日志文件，详见 crawl_logging"""
+    return configure_logging(config, log_file, console_format)
+
+# 停止信号：收到SIGINT/SIGTERM或调用request_stop()后，爬取会在当前请求完成后停止
+stop_event = threading.Event()
+
+
+class CrawlCancelled(Exception):
+    """爬取被停止信号中止"""
+
+
+def request_stop(signum=None, frame=None):
+    """请求优雅停止当前爬取（可直接作为信号处理函数）"""
+    if stop_event.is_set() and signum == signal.SIGINT:
+        # 再次按下Ctrl+C时强制中断
+        raise KeyboardInterrupt
+    if signum is not None:
+        logging.warning(f"收到停止信号 {signum}，将在当前请求完成后保存已爬取数据并退出")
+    stop_event.set()
+
+
+def install_signal_handlers():
+    """注册优雅停止的信号处理（只能在主线程调用）"""
+    for name in ('SIGINT', 'SIGTERM', 'SIGBREAK'):
+        if hasattr(signal, name):
+            signal.signal(getattr(signal, name), request_stop)
+
+
+class RequestBudgetExceeded(Exception):
+    """本轮爬取的全局请求预算已用完"""
+
+
+class RequestBudget:
+    """多个爬取任务共享的全局请求预算
+    
+    限制同一时刻进行中的请求数量，并可选地限制单轮爬取的请求总数。
+    """
+    
+    def __init__(self, max_inflight=8, max_requests=0):
+        self.max_inflight = max(1, int(max_inflight))
+        self.max_requests = max(0, int(max_requests))
+        self.used = 0
+        self._slots = threading.BoundedSemaphore(self.max_inflight)
+        self._lock = threading.Lock()
+    
+    def __enter__(self):
+        with self._lock:
+            if self.max_requests and self.used >= self.max_requests:
+                raise RequestBudgetExceeded(f"已达到单轮请求上限 {self.max_requests}")
+            self.used += 1
+        self._slots.acquire()
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._slots.release()
+        return False
+
+
+class JobLogAdapter(logging.LoggerAdapter):
+    """为多任务爬取的日志添加任务名前缀"""
+    
+    def process(self, msg, kwargs):
+        job = self.extra.get('job')
+        if job:
+            msg = f"[{job}] {msg}"
+            # JSON日志中任务名作为独立字段输出
+            kwargs['extra'] = dict(kwargs.get('extra') or {}, job=job)
+        return msg, kwargs
+
+
+def incremental_index_path(config, job_name=None):
+    """增量模式下已知电影ID索引文件的路径（每个任务一个）"""
+    output_dir = config.get('output_directory', 'data')
+    return os.path.join(output_dir, '.incremental', f"{job_name or 'default'}.json")
+
+def load_incremental_state(index_path):
+    """读取增量索引
+    
+    Returns:
+        (已知电影ID集合, 上一份快照路径)；索引或快照不存在时返回 (空集合, None)，即执行全量爬取
+    """
+    try:
+        with open(index_path, 'rb') as f:
+            index = json_codec.load(f)
+        if os.path.exists(index['snapshot']):
+            return set(index['ids']), index['snapshot']
+    except (OSError, KeyError, ValueError):
+        pass
+    return set(), None
+
+def save_incremental_state(index_path, ids, snapshot_path):
+    """保存增量索引：已知电影ID列表及最新快照路径"""
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    index = {
+        'snapshot': snapshot_path,
+        'ids': list(ids),
+        'updated_at': datetime.now().isoformat(timespec='seconds')
+    }
+    tmp_path = index_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        json_codec.dump(index, f)
+    os.replace(tmp_path, index_path)
+
+def checkpoint_path(config, job_name=None):
+    """检查点文件路径（每个任务一个）"""
+    output_dir = config.get('output_directory', 'data')
+    return os.path.join(output_dir, '.checkpoints', f"{job_name or 'default'}.jsonl")
+
+def fetch_douban_movies(config=None, session=None, budget=None, job_name=None, rate_limiter=None,
+                        retry_policy=None):
+    """爬取豆瓣电影推荐数据
+    
+    Args:
+        config: 爬取配置，为空时从config.json读取
+        session: 共享的requests会话，为空时使用http_client的进程级共享会话
+        budget: 共享的RequestBudget，为空时不限制
+        job_name: 任务名，设置后会写入日志前缀和快照文件名
+        rate_limiter: 共享的AdaptiveRateLimiter，为空时按配置新建
+        retry_policy: 重试策略，为空时使用进程内共享的 'api' 策略
+    """
+    log = JobLogAdapter(logging.getLogger(), {'job': job_name})
     if config is None:
         config = load_config()
     count = config.get('count', 20)
@@ -53,130 +194,592 @@ def fetch_douban_movies(config=None):
     tags = config.get('tags', '2025')
     sort = config.get('sort', 'R')
     actual_count = config.get('actual_count', 0)
-    max_retries = config.get('max_retries', 3)
+    concurrency = max(1, int(config.get('concurrency', 1)))
+    incremental = config.get('incremental', False)
+    # 字段裁剪：只保留配置的字段（raw为完整数据），在写入检查点和快照之前完成
+    item_fields = config.get('item_fields', 'raw')
+    projection = build_projection(item_fields)
     
-    base_url = f"https://m.douban.com/rexxar/api/v2/movie/recommend?refresh=0&start={{}}&count={count}&selected_categories={{}}&uncollect=false&score_range=0,10&tags={tags}&sort={sort}"
+    api_base_url = config.get('api_base_url') or DEFAULT_API_BASE_URL
+    endpoint = f"{api_base_url.rstrip('/')}{RECOMMEND_PATH}"
     
-    headers = {
-        'Referer': 'https://movie.douban.com/explore',
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        'Accept': 'application/json, text/plain, */*',
-        'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-        'Connection': 'keep-alive'
-    }
+    def build_base_url(page_count):
+        return f"{endpoint}?refresh=0&start={{}}&count={page_count}&selected_categories={{}}&uncollect=false&score_range=0,10&tags={tags}&sort={sort}"
     
-    timeout = config.get('timeout', 30)
+    # 页大小自动探测：优先使用缓存的页大小，没有缓存时第一页按 probe_max 请求，由返回条目数确定
+    auto_count = count == PAGE_SIZE_AUTO
+    page_size_cache = None
+    if auto_count:
+        page_size_cache = PageSizeCache.from_config(config)
+        count = page_size_cache.get(endpoint)
+        if count:
+            log.info(f"使用缓存的页大小: 每页 {count} 条")
+        else:
+            count = probe_max_from_config(config)
+            log.info(f"探测页大小: 第一页按每页 {count} 条请求")
+    base_url = build_base_url(count)
+    
+    timeout = http_client.get_timeout(config)
+    if session is None:
+        session = http_client.get_session(config)
+    if rate_limiter is None:
+        rate_limiter = AdaptiveRateLimiter.from_config(config)
+    if retry_policy is None:
+        retry_policy = get_retry_policy('api', config)
+    response_cache = get_response_cache(config)
+    # 录制/回放（可选）：请求经过磁带文件
+    cassette = get_cassette(config)
+    # 本轮指标（同时累加到进程级指标，供 /metrics 导出）
+    metrics = new_run_metrics(job_name)
+    succeeded = False
     
-    all_items = []
     total_count = 0
-    start_pos = start
     count_per_page = count
+    first_meta = {}
+    
+    # 增量模式：读取上一轮的已知电影，遇到整页都是已知电影时停止翻页
+    known_ids = set()
+    previous_snapshot = None
+    if incremental:
+        index_path = incremental_index_path(config, job_name)
+        known_ids, previous_snapshot = load_incremental_state(index_path)
+        if known_ids:
+            log.info(f"增量模式: 已知 {len(known_ids)} 部电影，遇到整页已知电影时停止翻页")
+        else:
+            log.info("增量模式: 未找到历史索引，执行全量爬取")
+    
+    def page_all_known(items):
+        """判断一页数据是否全部为已知电影"""
+        return bool(known_ids) and bool(items) and all(str(item.get('id')) in known_ids for item in items)
+    
+    # 页面级检查点：已完成的页面按起始位置记录，便于中断后继续
+    page_sizes = {}      # 已完成页面: 起始位置 -> 条目数
+    pending_pages = {}   # 已完成但尚未按顺序写入快照的页面
+    page_meta = {}       # 尚未写入快照的页面: 起始位置 -> (接口返回的total, 请求序号)，用于检测榜单漂移
+    fetch_sequence = itertools.count(1)
+    checkpoint = None
+    if config.get('checkpoint', True):
+        checkpoint_params = {'tags': tags, 'sort': sort, 'count': count, 'start': start, 'item_fields': item_fields}
+        checkpoint = CrawlCheckpoint(checkpoint_path(config, job_name), checkpoint_params)
+        if config.get('resume', False):
+            state = checkpoint.load()
+            if state:
+                total_count, first_meta, pending_pages = state
+                page_sizes = {offset: len(items) for offset, items in pending_pages.items()}
+                log.info(f"从检查点恢复: 已完成 {len(page_sizes)} 页，共 {sum(page_sizes.values())} 条")
+    
+    # 快照写入器：页面按start顺序写入，NDJSON格式下每页到达后立即落盘
+    writer = create_snapshot_writer(config, job_name, limit=actual_count)
+    # 电影库（可选）：写入快照的条目同时按电影ID upsert
+    movie_store = get_movie_store(config)
+    # 榜单漂移：按电影ID去重，相邻两页之间有遗漏时补抓受影响的窗口
+    drift = PageDriftTracker.from_config(config, log)
+    next_offset = start
+    
+    def emit_items(items):
+        """把一批条目去重后写入快照和电影库"""
+        written = writer.write_items(drift.dedup(items))
+        if movie_store is not None:
+            movie_store.upsert_items(written, job_name)
+        if cover_prefetcher is not None:
+            cover_prefetcher.submit(written)
+    
+    def emit_page(offset, items):
+        """按顺序写入一页数据，与上一页之间检测到遗漏时先写入补抓到的电影"""
+        total, _ = page_meta.pop(offset, (None, None))
+        if stop_event.is_set():
+            # 停止时只保存已完成的页面，不再检测漂移和补抓
+            window = None
+        else:
+            window = drift.check_boundary(offset, count_per_page, total, items)
+        if window is not None:
+            emit_items(refetch_window(window, items))
+        emit_items(items)
+    
+    def emit_ready(flush_all=False):
+        """把已按顺序就绪的页面写入快照；flush_all 时不再等待缺失的页面"""
+        nonlocal next_offset
+        while next_offset in pending_pages:
+            emit_page(next_offset, pending_pages.pop(next_offset))
+            next_offset += count_per_page
+        if flush_all:
+            for offset in sorted(pending_pages):
+                emit_page(offset, pending_pages.pop(offset))
     
-    def make_request_with_retry(url, max_attempts=3):
-        """带重试机制的请求函数"""
-        for attempt in range(max_attempts):
+    def record_page(offset, items, meta=None):
+        """记录一页已完成的数据，写入检查点和快照；meta 为 (接口返回的total, 请求序号)"""
+        page_sizes[offset] = len(items)
+        if meta is not None:
+            page_meta[offset] = meta
+            drift.observe(meta)
+        metrics.observe_page(len(items))
+        if checkpoint is not None:
+            checkpoint.record_page(offset, items)
+        pending_pages[offset] = items
+        emit_ready()
+    
+    def fetched_count():
+        return sum(page_sizes.values())
+    
+    def make_request_with_retry(url, extra_headers=None):
+        """按统一重试策略发送请求，请求节奏由自适应限速器控制"""
+        request_headers = dict(http_client.API_HEADERS, **(extra_headers or {}))
+        
+        def send():
+            if stop_event.is_set():
+                raise CrawlCancelled()
+            wait_start = time.monotonic()
+            if cassette is None or not cassette.replaying:
+                # 回放时不访问网络，无需限速；等待令牌时收到停止信号立即中止
+                if not rate_limiter.acquire(wait=stop_event.wait):
+                    raise CrawlCancelled()
+            request_start = time.monotonic()
+            metrics.observe_rate_limit_wait(request_start - wait_start)
             try:
-                response = requests.get(url, headers=headers, timeout=timeout)
+                if budget is not None:
+                    with budget:
+                        response = http_get(session, url, wait=stop_event.wait, headers=request_headers, timeout=timeout)
+                else:
+                    response = http_get(session, url, wait=stop_event.wait, headers=request_headers, timeout=timeout)
+                latency = time.monotonic() - request_start
+                metrics.observe_request(response.status_code, latency, len(response.content))
+                log.debug(f"请求完成 {response.status_code}，耗时 {latency:.3f}s: {url}",
+                          extra={'url': url, 'status': response.status_code, 'latency': round(latency, 4)})
                 response.raise_for_status()
-                return response
             except requests.exceptions.RequestException as e:
-                if attempt == max_attempts - 1:
-                    raise
-                wait_time = 2 ** attempt  # 指数退避
-                logging.warning(f"请求失败，{wait_time}秒后重试 (尝试 {attempt + 1}/{max_attempts}): {e}")
-                time.sleep(wait_time)
+                error_response = getattr(e, 'response', None)
+                if error_response is not None:
+                    rate_limiter.on_failure(error_response.status_code,
+                                            parse_retry_after(error_response.headers.get('Retry-After'),
+                                                              retry_policy.max_delay))
+                else:
+                    metrics.observe_request(type(e).__name__, time.monotonic() - request_start)
+                    rate_limiter.on_failure()
+                raise
+            rate_limiter.on_success(time.monotonic() - request_start)
+            return response
+        
+        def on_retry(error, attempt, delay):
+            error_response = getattr(error, 'response', None)
+            status = error_response.status_code if error_response is not None else type(error).__name__
+            metrics.observe_retry(status, delay)
+            log.warning(f"请求失败，{delay:.1f}秒后重试 (尝试 {attempt}/{retry_policy.max_attempts}): {error}",
+                        extra={'url': url, 'status': status, 'attempt': attempt, 'delay': round(delay, 3)})
+        
+        return retry_policy.execute(url, send, wait=stop_event.wait, on_retry=on_retry)
     
-    try:
-        # 先获取第一页数据来获取total总数
-        first_page_url = base_url.format(start_pos, "{}")
-        response = make_request_with_retry(first_page_url, max_retries)
+    def fetch_body(url):
+        """请求接口并返回原始响应体，启用响应缓存时优先使用缓存"""
+        entry = None
+        extra_headers = None
+        if response_cache is not None:
+            entry = response_cache.get(url)
+            if entry is not None:
+                if response_cache.is_fresh(entry):
+                    log.debug(f"使用缓存响应: {url}")
+                    metrics.observe_cache('hit')
+                    return entry.body
+                extra_headers = response_cache.conditional_headers(entry)
         
-        first_data = response.json()
-        total_count = first_data.get('total', 0)
+        response = make_request_with_retry(url, extra_headers)
+        if response.status_code == 304 and entry is not None:
+            # 服务器确认内容未变化，刷新缓存时间后直接使用缓存
+            metrics.observe_cache('revalidated')
+            response_cache.touch(url, entry)
+            return entry.body
+        if response_cache is not None:
+            metrics.observe_cache('miss')
+            response_cache.store(url, response)
+        return response.content
+    
+    def decode_body(url, body):
+        """解析响应体，无法解析时删除对应的缓存，避免重试时再次读到同一份损坏的响应"""
+        try:
+            return json_codec.loads(body)
+        except ValueError:
+            if response_cache is not None:
+                response_cache.discard(url)
+            raise
+    
+    def fetch_json(url):
+        """请求接口并解析JSON"""
+        return decode_body(url, fetch_body(url))
+    
+    # 详情补全（可选）：按电影ID请求详情接口，与推荐接口共用限速器、重试和缓存
+    enricher = DetailEnricher.from_config(config, fetch_json, api_base_url, log)
+    # 封面预取（可选）：写入快照的电影封面由后台线程下载到图片缓存，导出时直接使用
+    cover_prefetcher = CoverPrefetcher.from_config(config, session, log, stop_event)
+    
+    def prepare_items(items):
+        """字段裁剪后补全详情"""
+        items = project_items(items, projection)
+        if enricher is not None:
+            enricher.enrich(items)
+        return items
+    
+    def fetch_page(page_start):
+        """爬取单页数据，返回该页的items列表和 (total, 请求序号)"""
+        data = fetch_json(base_url.format(page_start, "{}"))
+        return prepare_items(data.get('items', [])), (data.get('total', total_count), next(fetch_sequence))
+    
+    def refetch_window(window, page_items):
+        """补抓可能遗漏的窗口，返回本轮尚未写入、也不在当前页中的电影"""
+        page_ids = {str(item.get('id')) for item in page_items}
+        found = []
+        shift = 0
+        adjustments = 0
+        offset = window.start
+        while offset < window.end:
+            size = min(count_per_page, window.end - offset)
+            try:
+                data = fetch_json(build_base_url(size).format(max(0, offset + shift), "{}"))
+            except (requests.exceptions.RequestException, ValueError) as e:
+                log.warning(f"补抓起始位置 {offset + shift} 的窗口失败: {e}")
+                break
+            changed = data.get('total', window.total) - window.total - shift
+            if changed and adjustments < DRIFT_WINDOW_ADJUSTMENTS:
+                # 补抓前榜单又发生了变化，按total的差值平移窗口后重新请求
+                shift += changed
+                adjustments += 1
+                log.info(f"补抓时total变化 {changed:+d}，窗口平移到起始位置 {max(0, offset + shift)}")
+                continue
+            found.extend(item for item in data.get('items', [])
+                         if str(item.get('id')) not in drift.seen_ids and str(item.get('id')) not in page_ids)
+            offset += size
+        found = prepare_items(found)
+        drift.recovered += len(found)
+        return found
+    
+    def run_page_pipeline(offsets):
+        """用流水线爬取一组页面，页面完成后按起始位置顺序写入检查点和快照"""
+        pipeline_options = config.get('pipeline') or {}
+        done_pages = [0]
+        
+        def fetch_stage(offset):
+            fetch_start = time.monotonic()
+            body = fetch_body(base_url.format(offset, "{}"))
+            return offset, body, next(fetch_sequence), time.monotonic() - fetch_start
+        
+        def decode_stage(page):
+            offset, body, sequence, latency = page
+            data = decode_body(base_url.format(offset, "{}"), body)
+            return offset, prepare_items(data.get('items', [])), (data.get('total', total_count), sequence), latency
         
-        if total_count == 0:
-            logging.warning("未获取到电影数据")
-            return False
+        def persist_stage(page):
+            offset, items, meta, latency = page
+            record_page(offset, items, meta)
+            done_pages[0] += 1
+            page_number = offset // count_per_page + 1
+            log.info(f"已完成第 {page_number} 页，起始位置: {offset} "
+                     f"({done_pages[0]}/{len(offsets)})，当前速率: {rate_limiter.rate:.2f} 次/秒",
+                     extra={'page': page_number, 'offset': offset, 'items': len(items),
+                            'latency': round(latency, 4), 'rate': round(rate_limiter.rate, 2)})
+            return None
         
-        logging.info(f"总共需要爬取 {total_count} 条电影数据，每页 {count_per_page} 条，起始位置: {start}")
+        pipeline = Pipeline([
+            Stage('fetch', fetch_stage, concurrency),
+            Stage('decode', decode_stage, pipeline_options.get('decode_workers', 1)),
+            # 持久化按页面顺序写入，固定为单线程
+            Stage('persist', persist_stage, 1)
+        ], queue_size=pipeline_options.get('queue_size', 8)).start()
+        try:
+            for offset in offsets:
+                pipeline.put(offset)
+            pipeline.join()
+        except BaseException as e:
+            # 出错或被中止时其余阶段尽快退出，未开始的页面不再请求
+            pipeline.abort(e)
+            raise
+        finally:
+            pipeline.log_summary(log)
+    
+    try:
+        first_page_url = base_url.format(start, "{}")
+        if start not in page_sizes:
+            # 先获取第一页数据来获取total总数
+            first_data = fetch_json(first_page_url)
+            first_sequence = next(fetch_sequence)
+            total_count = first_data.get('total', 0)
+            
+            if total_count == 0:
+                log.warning("未获取到电影数据")
+                return False
+            
+            first_meta = {
+                'recommend_categories': first_data.get('recommend_categories', []),
+                'show_rating_filter': first_data.get('show_rating_filter', False)
+            }
+            if auto_count:
+                # 按第一页实际返回的条目数确认（或修正）页大小，并据此规划剩余页面
+                supported = honoured_count(count_per_page, len(first_data.get('items', [])), start, total_count)
+                if supported is not None:
+                    page_size_cache.put(endpoint, supported)
+                    if supported != count_per_page:
+                        log.info(f"接口每页最多返回 {supported} 条，页大小由 {count_per_page} 调整为 {supported}")
+                        count_per_page = supported
+                        base_url = build_base_url(supported)
+                        if checkpoint is not None:
+                            checkpoint.params['count'] = supported
+            if checkpoint is not None:
+                checkpoint.start(total_count, first_meta)
+            first_items = prepare_items(first_data.get('items', []))
+            writer.open(total_count, first_meta)
+            record_page(start, first_items, (total_count, first_sequence))
+        else:
+            first_items = pending_pages[start]
+            writer.open(total_count, first_meta)
+            emit_ready()
         
-        # 添加第一页数据
-        all_items.extend(first_data.get('items', []))
+        log.info(f"总共需要爬取 {total_count} 条电影数据，每页 {count_per_page} 条，起始位置: {start}")
         
         # 如果设置了实际爬取数量限制，且已经达到限制，则停止爬取
-        if actual_count > 0 and len(all_items) >= actual_count:
-            all_items = all_items[:actual_count]
-            logging.info(f"已达到实际爬取数量限制 {actual_count} 条，停止爬取")
+        if actual_count > 0 and fetched_count() >= actual_count:
+            log.info(f"已达到实际爬取数量限制 {actual_count} 条，停止爬取")
+        elif page_all_known(first_items):
+            log.info("第一页均为已知电影，无需继续翻页")
         else:
-            # 计算需要爬取的页数
-            total_pages = (total_count + count_per_page - 1) // count_per_page
+            # 计算需要爬取的剩余页面起始位置
+            page_offsets = list(range(start + count_per_page, total_count, count_per_page))
+            if actual_count > 0:
+                # 只调度满足实际爬取数量所需的页面
+                remaining = actual_count - len(first_items)
+                needed_pages = (remaining + count_per_page - 1) // count_per_page
+                page_offsets = page_offsets[:needed_pages]
+            # 跳过检查点中已完成的页面
+            pending_offsets = [offset for offset in page_offsets if offset not in page_sizes]
             
-            # 从第二页开始爬取剩余页面
-            for page in range(1, total_pages):
-                start_pos = page * count_per_page
-                if start_pos >= total_count:
-                    break
+            if pending_offsets and not known_ids:
+                # 流水线模式：第一页确定total后，剩余页面按 请求 -> 解析/裁剪 -> 持久化 分阶段处理，
+                # 阶段之间由有界队列连接，网络等待、解析和写入互相重叠
+                log.info(f"流水线爬取剩余 {len(pending_offsets)} 页，请求并发数: {concurrency}")
+                run_page_pipeline(pending_offsets)
+            else:
+                # 顺序模式：增量模式需要逐页判断是否停止
+                for start_pos in pending_offsets:
+                    log.info(f"正在爬取第 {start_pos // count_per_page + 1} 页，起始位置: {start_pos}，"
+                             f"当前速率: {rate_limiter.rate:.2f} 次/秒",
+                             extra={'page': start_pos // count_per_page + 1, 'offset': start_pos,
+                                    'rate': round(rate_limiter.rate, 2)})
                     
-                page_url = base_url.format(start_pos, "{}")
-                logging.info(f"正在爬取第 {page + 1} 页，起始位置: {start_pos}")
-                
-                response = make_request_with_retry(page_url, max_retries)
-                
-                page_data = response.json()
-                all_items.extend(page_data.get('items', []))
-                
-                # 如果设置了实际爬取数量限制，且已经达到限制，则停止爬取
-                if actual_count > 0 and len(all_items) >= actual_count:
-                    all_items = all_items[:actual_count]
-                    logging.info(f"已达到实际爬取数量限制 {actual_count} 条，停止爬取")
-                    break
-                
-                # 智能延迟控制：根据当前请求速度动态调整
-                # 如果当前页数据量较少，减少延迟；数据量多则增加延迟
-                current_items = len(page_data.get('items', []))
-                delay = max(0.5, min(2.0, 2.0 - (current_items / count_per_page) * 1.5))
-                time.sleep(delay)
-        
-        # 创建完整的返回数据
-        complete_data = {
-            'count': len(all_items),
-            'total': total_count,
-            'items': all_items,
-            'recommend_categories': first_data.get('recommend_categories', []),
-            'show_rating_filter': first_data.get('show_rating_filter', False)
-        }
+                    page_items, page_info = fetch_page(start_pos)
+                    record_page(start_pos, page_items, page_info)
+                    
+                    # 如果设置了实际爬取数量限制，且已经达到限制，则停止爬取
+                    if actual_count > 0 and fetched_count() >= actual_count:
+                        log.info(f"已达到实际爬取数量限制 {actual_count} 条，停止爬取")
+                        break
+                    
+                    if page_all_known(page_items):
+                        log.info(f"起始位置 {start_pos} 的整页均为已知电影，停止翻页")
+                        break
+            
+            if not known_ids:
+                # 榜单在爬取过程中变长时，按最后一次请求看到的total补抓原定最后一页之后的页面
+                while (actual_count <= 0 or fetched_count() < actual_count) and drift.tail_page_needed(next_offset):
+                    log.info(f"榜单已变长到 {drift.latest_total} 条，补抓起始位置 {next_offset} 的尾部页面")
+                    page_items, page_info = fetch_page(next_offset)
+                    record_page(next_offset, page_items, page_info)
+        
+        emit_ready(flush_all=True)
         
-        # 创建输出目录
-        output_dir = config.get('output_directory', 'data')
-        os.makedirs(output_dir, exist_ok=True)
+        if known_ids:
+            # 增量合并：本轮结果在前（同一ID以最新数据为准），随后接上一份快照中未再次出现的电影
+            fetched_ids = set(writer.ids)
+            new_count = len(fetched_ids - known_ids)
+            writer.limit = 0
+            for item in iter_snapshot_items(previous_snapshot):
+                if str(item.get('id')) not in fetched_ids:
+                    writer.write_items([item])
+            log.info(f"增量爬取发现 {new_count} 部新电影，合并后共 {writer.count} 部")
         
-        # 保存数据到文件
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = os.path.join(output_dir, f"douban_movies_{timestamp}.json")
+        filename = writer.close()
         
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(complete_data, f, ensure_ascii=False, indent=2)
+        if incremental:
+            save_incremental_state(index_path, writer.ids, filename)
+        if checkpoint is not None:
+            checkpoint.remove()
         
-        logging.info(f"成功爬取所有数据并保存到 {filename}")
-        logging.info(f"总共爬取到 {len(all_items)} 条电影数据，预期总数: {total_count}")
+        log.info(f"成功爬取所有数据并保存到 {filename}")
+        log.info(f"总共爬取到 {writer.count} 条电影数据，预期总数: {total_count}")
         
+        succeeded = True
         return True
         
+    except CrawlCancelled:
+        # 收到停止信号：把已完成的页面保存为标记为partial的快照，检查点保留以便继续
+        filename = None
+        try:
+            emit_ready(flush_all=True)
+            if writer.count:
+                filename = writer.close(partial=True)
+        finally:
+            # 保存过程中出现任何异常都放弃快照，不留下 .part 文件
+            if filename is None:
+                writer.abort()
+        if filename is not None:
+            log.warning(f"爬取已中止，{writer.count} 条部分结果已保存到 {filename}，启用resume可从检查点继续")
+        else:
+            log.warning("爬取已中止，没有可保存的数据")
+        return False
     except requests.exceptions.RequestException as e:
-        logging.error(f"网络请求错误: {e}, URL: {first_page_url if 'first_page_url' in locals() else 'N/A'}")
+        writer.abort()
+        log.error(f"网络请求错误: {e}, URL: {first_page_url if 'first_page_url' in locals() else 'N/A'}")
         if hasattr(e, 'response') and e.response is not None:
-            logging.error(f"HTTP状态码: {e.response.status_code}")
+            log.error(f"HTTP状态码: {e.response.status_code}")
         return False
     except json.JSONDecodeError as e:
-        logging.error(f"JSON解析错误: {e}, URL: {first_page_url if 'first_page_url' in locals() else 'N/A'}")
+        writer.abort()
+        log.error(f"JSON解析错误: {e}, URL: {first_page_url if 'first_page_url' in locals() else 'N/A'}")
         return False
     except Exception as e:
-        logging.error(f"未知错误: {e}, URL: {first_page_url if 'first_page_url' in locals() else 'N/A'}")
+        writer.abort()
+        log.error(f"未知错误: {e}, URL: {first_page_url if 'first_page_url' in locals() else 'N/A'}")
         return False
+    finally:
+        drift.log_summary()
+        if enricher is not None:
+            enricher.close()
+        if cover_prefetcher is not None:
+            # 爬取成功时等待剩余封面下载完成，中止或失败时放弃尚未开始的下载
+            cover_prefetcher.close(wait=succeeded)
+        # 每轮（每个任务）结束时输出指标汇总，并写入 <output_directory>/.metrics/
+        metrics.finish_run(config.get('output_directory', 'data'), succeeded)
 
-def main():
-    """主函数"""
-    config = load_config()
+def expand_crawl_jobs(config):
+    """展开配置中的爬取任务列表
+    
+    jobs 支持两种写法:
+      - 任务列表: [{"tags": "2024", "sort": "T"}, {"tags": "2025", "sort": "R"}]
+      - 任务矩阵: {"tags": ["2024", "2025"], "sort": ["T", "R", "S"]}，按笛卡尔积展开
+    未配置 jobs 时返回空列表。
+    """
+    jobs = config.get('jobs')
+    if not jobs:
+        return []
+    if isinstance(jobs, dict):
+        keys = list(jobs.keys())
+        values = [v if isinstance(v, list) else [v] for v in jobs.values()]
+        return [dict(zip(keys, combo)) for combo in itertools.product(*values)]
+    return [dict(job) for job in jobs]
+
+def job_config_for(config, job):
+    """任务配置：全局配置加上任务参数"""
+    job_config = dict(config)
+    job_config.pop('jobs', None)
+    job_config.update(job)
+    return job_config
+
+def job_name_for(job_config, job=None):
+    """根据任务参数生成任务名（用于日志、检查点、增量索引和快照文件名）
+    
+    任务名为 tags_sort，job 中的其他参数（如 score_range、start）按键名排序依次追加为 _键-值，
+    只在这些参数上不同的任务不会共用同一个任务名。
+    """
+    name = f"{job_config.get('tags', '')}_{job_config.get('sort', '')}"
+    for key in sorted(job or {}):
+        if key not in ('tags', 'sort'):
+            name += f"_{key}-{job[key]}"
+    # 只保留可用于文件名的字符
+    return re.sub(r'[^\w.,+-]+', '-', name)
+
+def unique_job_names(job_configs, jobs):
+    """为每个任务生成任务名，参数完全相同的任务按序号区分"""
+    names = []
+    for job_config, job in zip(job_configs, jobs):
+        name = job_name_for(job_config, job)
+        if name in names:
+            name = f"{name}_{len(names) + 1}"
+        names.append(name)
+    return names
+
+def run_crawl_jobs(config, jobs):
+    """在同一进程内并发执行多个爬取任务
+    
+    所有任务共享一个连接池会话和一个全局请求预算，每个任务写入自己的快照文件。
+    
+    Returns:
+        执行失败的任务列表
+    """
+    job_concurrency = max(1, int(config.get('job_concurrency', 4)))
+    max_inflight = config.get('max_inflight_requests', 8)
+    budget = RequestBudget(max_inflight, config.get('max_requests_per_run', 0))
+    # 所有任务共享同一个限速器，整体请求速率随服务器状态自适应
+    rate_limiter = AdaptiveRateLimiter.from_config(config)
+    
+    logging.info(f"共 {len(jobs)} 个爬取任务，任务并发数: {job_concurrency}，全局并发请求上限: {budget.max_inflight}")
+    
+    failed_jobs = []
+    # 所有任务共用进程级会话，连接池大小至少覆盖全局并发请求上限（会话已存在时由 get_session 扩大连接池）
+    session_config = dict(config)
+    session_config['http_pool_size'] = max(config.get('http_pool_size', http_client.DEFAULT_POOL_SIZE), budget.max_inflight)
+    session = http_client.get_session(session_config)
+    job_configs = [job_config_for(config, job) for job in jobs]
+    job_names = unique_job_names(job_configs, jobs)
+    with ThreadPoolExecutor(max_workers=job_concurrency) as executor:
+        futures = {}
+        for job, job_config, job_name in zip(jobs, job_configs, job_names):
+            future = executor.submit(fetch_douban_movies, job_config, session, budget,
+                                     job_name, rate_limiter)
+            futures[future] = job
+        
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                success = future.result()
+            except Exception as e:
+                logging.error(f"任务 {job} 执行异常: {e}")
+                success = False
+            if not success:
+                failed_jobs.append(job)
+    
+    logging.info(f"爬取任务完成: 成功 {len(jobs) - len(failed_jobs)} 个，失败 {len(failed_jobs)} 个，"
+                 f"共发出 {budget.used} 次请求，最终速率: {rate_limiter.rate:.2f} 次/秒")
+    return failed_jobs
+
+def run_crawl_cycle(config):
+    """执行一轮爬取（含整轮重试），返回是否成功
+    
+    收到停止信号时提前返回，已完成的页面保存在检查点和partial快照中。
+    """
+    # 本轮所有请求重试和整轮重试共享同一个重试预算
+    retry_policy = get_retry_policy('api', config)
+    retry_policy.new_run()
+    success = False
+    run_attempt = 0
+    run_delay = 0
+    pending_jobs = expand_crawl_jobs(config)
+    run_config = config
+    
+    while not stop_event.is_set():
+        run_attempt += 1
+        logging.info(f"开始第 {run_attempt} 次爬取尝试...")
+        if pending_jobs:
+            # 多任务模式：只重试失败的任务
+            pending_jobs = run_crawl_jobs(run_config, pending_jobs)
+            success = not pending_jobs
+        else:
+            success = fetch_douban_movies(run_config)
+        if success or stop_event.is_set():
+            break
+        if not retry_policy.allow_run_retry(run_attempt):
+            logging.warning(f"重试预算已用完（本轮已重试 {retry_policy.retries_used} 次），放弃本轮爬取")
+            break
+        # 重试时从检查点继续，不再从第一页重新开始
+        run_config = dict(config, resume=True)
+        run_delay = retry_policy.run_delay(run_delay)
+        logging.warning(f"爬取失败，{run_delay:.0f}秒后从检查点继续...")
+        stop_event.wait(run_delay)
+    
+    return success
+
+def main(config=None):
+    """主函数
+    
+    Args:
+        config: 配置字典，为空时从config.json读取
+    """
+    if config is None:
+        config = load_config()
     if config is None:
         return False
     
@@ -191,23 +794,19 @@ def main():
     else:
         logging.info("定时任务未启用，将执行单次爬取")
     
+    stop_event.clear()
+    start_metrics_server(config)
+    
     # 主爬取循环
     while True:
         try:
             logging.info(f"开始爬取任务...")
             
-            max_retries = config.get('max_retries', 3)
-            success = False
-            retries = 0
+            success = run_crawl_cycle(config)
             
-            while not success and retries < max_retries:
-                logging.info(f"开始第 {retries + 1} 次爬取尝试...")
-                success = fetch_douban_movies(config)
-                if not success:
-                    retries += 1
-                    if retries < max_retries:
-                        logging.warning(f"爬取失败，30秒后重试...")
-                        time.sleep(30)
+            if stop_event.is_set():
+                logging.info("已收到停止信号，程序退出")
+                return success
             
             if not success:
                 logging.error("所有重试均失败")
@@ -226,8 +825,10 @@ def main():
                 logging.info(f"爬取成功，等待 {crawl_interval} 秒后进行下一次爬取...")
             else:
                 logging.warning(f"爬取失败，等待 {crawl_interval} 秒后重试...")
-                
-            time.sleep(crawl_interval)
+            
+            if stop_event.wait(crawl_interval):
+                logging.info("已收到停止信号，程序退出")
+                break
             
         except KeyboardInterrupt:
             logging.info("用户中断程序执行")
@@ -237,13 +838,24 @@ def main():
             if not enable_schedule:
                 break
             logging.info(f"等待 {crawl_interval} 秒后重试...")
-            time.sleep(crawl_interval)
+            if stop_event.wait(crawl_interval):
+                break
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='豆瓣电影爬虫')
+    parser.add_argument('--log-format', choices=('text', 'json'), help='控制台日志格式（GUI使用json）')
+    args = parser.parse_args()
+    config = load_config()
+    if config is None:
+        sys.exit(1)
+    setup_logging(config, console_format=args.log_format)
+    install_signal_handlers()
     try:
-        main()
+        main(config)
     except KeyboardInterrupt:
         logging.info("程序被用户中断")
     except Exception as e:
-        logging.error(f"程序异常: {e}")
\ No newline at end of file
+        logging.error(f"程序异常: {e}")
+    finally:
+        close_cassette()
\ No newline at end of file
@@ -10,9 +10,22 @@ import subprocess
 import os
 import json
 import time
-import requests
+import signal
+import shutil
 from datetime import datetime
 
+import http_client
+from retry_policy import get_retry_policy
+from http_cassette import get_cassette, http_get
+from cover_prefetch import cover_cache_path
+from crawl_logging import parse_json_line
+from snapshot import is_snapshot_file, list_snapshot_files, iter_snapshot_items, count_snapshot_items
+from movie_store import MovieStore
+import crawler_service
+
+# 爬虫子进程放入独立进程组，Windows下才能向其发送CTRL_BREAK_EVENT实现优雅停止
+CRAWLER_CREATIONFLAGS = getattr(subprocess, 'CREATE_NEW_PROCESS_GROUP', 0)
+
 class ToolTip:
     """
     悬浮提示工具类
@@ -309,6 +322,8 @@ class DoubanCrawlerGUI:
         self.is_running = False
         self.log_file = None
         self.after_ids = []  # 存储定时任务的after回调ID
+        self.service_attached = False  # 是否已连接常驻爬虫服务
+        self.service_process = None  # 由GUI启动的常驻服务进程
         
         self.load_config()
         self.update_stats()
@@ -367,6 +382,16 @@ class DoubanCrawlerGUI:
         except Exception as e:
             self.log(f"❌ 加载配置失败: {e}", "ERROR")
     
+    def _read_config_file(self):
+        """读取config.json原始内容，文件不存在或格式错误时返回空字典"""
+        if not os.path.exists('config.json'):
+            return {}
+        try:
+            with open('config.json', 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+    
     def save_config(self):
         """保存配置"""
         try:
@@ -378,18 +403,22 @@ class DoubanCrawlerGUI:
                 "近期热度": "U"
             }
             
-            config = {
+            # 保留配置文件中GUI未管理的字段（如并发数等高级参数）
+            config = self._read_config_file()
+            
+            config.update({
                 "crawl_interval": int(self.interval_var.get()),
                 "max_retries": int(self.retries_var.get()),
                 "timeout": int(self.timeout_var.get()),
-                "count": int(self.count_var.get()),
+                # 填 auto 时由爬虫自动探测接口支持的最大页大小
+                "count": "auto" if self.count_var.get().strip() == "auto" else int(self.count_var.get()),
                 "start": int(self.start_var.get()),
                 "tags": self.tags_var.get(),
                 "sort": sort_mapping.get(self.sort_var.get(), "R"),
                 "actual_count": int(self.actual_count_var.get() or 0),
-                "output_directory": "data",
-                "log_level": "INFO"
-            }
+                "output_directory": config.get("output_directory", "data"),
+                "log_level": config.get("log_level", "INFO")
+            })
             with open('config.json', 'w', encoding='utf-8') as f:
                 json.dump(config, f, indent=2, ensure_ascii=False)
             self.log("✅ 配置已保存", "INFO")
@@ -552,6 +581,11 @@ class DoubanCrawlerGUI:
         else:
             self.log("🚀 启动单次爬虫任务", "INFO")
         
+        # 启用常驻服务时由服务负责调度，不再为每一轮爬取启动新进程
+        if self._read_config_file().get('service', {}).get('enabled', False):
+            self._start_via_service()
+            return
+        
         def run_crawler():
             self.is_running = True
             self.start_btn.config(state=tk.DISABLED)
@@ -564,10 +598,11 @@ class DoubanCrawlerGUI:
             try:
                 # 使用subprocess运行爬虫（二进制模式读取，避免解码阻塞）
                 self.crawler_process = subprocess.Popen(
-                    ['python', 'src\\douban_crawler.py'],
+                    ['python', 'src\\douban_crawler.py', '--log-format', 'json'],
                     stdout=subprocess.PIPE,
                     stderr=subprocess.PIPE,
-                    cwd=os.getcwd()
+                    cwd=os.getcwd(),
+                    creationflags=CRAWLER_CREATIONFLAGS
                 )
                 
                 # 实时输出标准输出
@@ -622,15 +657,7 @@ class DoubanCrawlerGUI:
                                     # 如果都失败，使用忽略错误的方式
                                     line = raw_line.decode('utf-8', errors='ignore').strip()
                             if line:
-                                # 解析日志级别，根据实际内容确定日志等级
-                                log_level = "ERROR"  # 默认设为ERROR
-                                if "INFO" in line:
-                                    log_level = "INFO"
-                                elif "WARNING" in line:
-                                    log_level = "WARNING"
-                                elif "ERROR" in line:
-                                    log_level = "ERROR"
-                                self.root.after(0, self.log, line, log_level)
+                                self.root.after(0, self.log, *self._parse_crawler_line(line))
                         except Exception as e:
                             # 如果发生异常，检查进程是否还在运行
                             if not self.is_running or self.crawler_process is None or self.crawler_process.poll() is not None:
@@ -707,10 +734,11 @@ class DoubanCrawlerGUI:
             try:
                 # 使用subprocess运行爬虫（二进制模式读取，避免解码阻塞）
                 self.crawler_process = subprocess.Popen(
-                    ['python', 'src\\douban_crawler.py'],
+                    ['python', 'src\\douban_crawler.py', '--log-format', 'json'],
                     stdout=subprocess.PIPE,
                     stderr=subprocess.PIPE,
-                    cwd=os.getcwd()
+                    cwd=os.getcwd(),
+                    creationflags=CRAWLER_CREATIONFLAGS
                 )
                 
                 # 实时输出标准输出
@@ -765,15 +793,7 @@ class DoubanCrawlerGUI:
                                     # 如果都失败，使用忽略错误的方式
                                     line = raw_line.decode('utf-8', errors='ignore').strip()
                             if line:
-                                # 解析日志级别，根据实际内容确定日志等级
-                                log_level = "ERROR"  # 默认设为ERROR
-                                if "INFO" in line:
-                                    log_level = "INFO"
-                                elif "WARNING" in line:
-                                    log_level = "WARNING"
-                                elif "ERROR" in line:
-                                    log_level = "ERROR"
-                                self.root.after(0, self.log, line, log_level)
+                                self.root.after(0, self.log, *self._parse_crawler_line(line))
                         except Exception as e:
                             # 如果发生异常，检查进程是否还在运行
                             if not self.is_running or self.crawler_process is None or self.crawler_process.poll() is not None:
@@ -823,6 +843,107 @@ class DoubanCrawlerGUI:
         # 在新线程中运行爬虫
         threading.Thread(target=run_crawler, daemon=True).start()
     
+    def _service_address(self):
+        return crawler_service.service_address(self._read_config_file())
+    
+    def _ensure_service(self, address):
+        """确保常驻服务在运行，未运行时启动服务进程并等待控制端口就绪"""
+        if crawler_service.is_service_running(address):
+            return True
+        self.root.after(0, self.log, "🔌 正在启动常驻爬虫服务...", "INFO")
+        self.service_process = subprocess.Popen(
+            ['python', 'src\\crawler_service.py'],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            cwd=os.getcwd(),
+            creationflags=CRAWLER_CREATIONFLAGS
+        )
+        deadline = time.time() + 15
+        while time.time() < deadline:
+            if self.service_process.poll() is not None:
+                return False
+            if crawler_service.is_service_running(address):
+                return True
+            time.sleep(0.3)
+        return False
+    
+    def _start_via_service(self):
+        """通过常驻服务开始爬取，服务不可用时回退为子进程方式"""
+        self.is_running = True
+        self.start_btn.config(state=tk.DISABLED)
+        self.stop_btn.config(state=tk.NORMAL)
+        self.export_btn.config(state=tk.DISABLED)
+        self.open_data_btn.config(state=tk.DISABLED)
+        
+        config = self._read_config_file()
+        config['enable_schedule'] = self.enable_schedule_var.get()
+        
+        def run():
+            address = crawler_service.service_address(config)
+            try:
+                if not self._ensure_service(address):
+                    raise ConnectionError("常驻服务启动失败")
+                # 只显示本次启动之后的日志
+                records = crawler_service.send_command(address, 'logs', since=0)['records']
+                last_seq = records[-1][0] if records else 0
+                response = crawler_service.send_command(address, 'start', config=config)
+                if not response.get('ok'):
+                    raise RuntimeError(response.get('error'))
+                if not response.get('started'):
+                    self.root.after(0, self.log, "ℹ️ 常驻服务已在爬取中，已更新配置并连接", "INFO")
+                elif response.get('status', {}).get('state') != crawler_service.CrawlerService.IDLE:
+                    self.root.after(0, self.log, "ℹ️ 常驻服务正在停止上一轮爬取，结束后自动开始", "INFO")
+            except Exception as e:
+                self.root.after(0, self.log, f"⚠️ 无法使用常驻服务（{e}），改为子进程方式运行", "WARNING")
+                self.root.after(0, self._start_crawler_direct)
+                return
+            self.service_attached = True
+            self.root.after(0, self.log, f"🔌 已连接常驻爬虫服务 {address[0]}:{address[1]}", "INFO")
+            self._monitor_service(address, last_seq)
+        
+        threading.Thread(target=run, daemon=True).start()
+    
+    # 日志级别到界面显示等级的映射
+    LOG_LEVEL_MAPPING = {"DEBUG": "INFO", "INFO": "INFO", "WARNING": "WARNING", "ERROR": "ERROR", "CRITICAL": "ERROR"}
+    
+    def _parse_crawler_line(self, line):
+        """解析爬虫子进程输出的一行JSON日志，返回 (显示文本, 显示等级)
+        
+        不是JSON日志的行（如未经logging输出的异常堆栈）按错误显示。
+        """
+        entry = parse_json_line(line)
+        if entry is None:
+            return line, "ERROR"
+        message = entry.get('message', '')
+        if entry.get('exc'):
+            message = f"{message}\n{entry['exc']}"
+        return message, self.LOG_LEVEL_MAPPING.get(entry.get('level'), "INFO")
+    
+    def _monitor_service(self, address, last_seq):
+        """轮询常驻服务的日志和状态，服务停止调度后恢复界面"""
+        last_cycles = None
+        while self.service_attached:
+            try:
+                response = crawler_service.send_command(address, 'logs', since=last_seq)
+            except (OSError, ValueError) as e:
+                self.root.after(0, self.log, f"❌ 与常驻服务的连接中断: {e}", "ERROR")
+                break
+            for seq, levelname, line, *_ in response.get('records', []):
+                last_seq = seq
+                self.root.after(0, self.log, line, self.LOG_LEVEL_MAPPING.get(levelname, "INFO"))
+            status = response.get('status', {})
+            # 每完成一轮爬取刷新一次统计
+            if last_cycles is not None and status.get('cycles') != last_cycles:
+                self.root.after(0, self.update_stats)
+            last_cycles = status.get('cycles')
+            if status.get('state') == crawler_service.CrawlerService.IDLE:
+                break
+            time.sleep(1)
+        if self.service_attached:
+            self.service_attached = False
+            self.root.after(0, self.stop_crawler_ui)
+            self.root.after(0, self.update_stats)
+    
     def stop_crawler(self):
         """停止爬虫"""
         if not self.is_running:
@@ -832,6 +953,16 @@ class DoubanCrawlerGUI:
         self.log("🛑 正在停止爬虫...", "INFO")
         self.is_running = False
         
+        if self.service_attached:
+            # 常驻服务保存检查点后停止调度，服务进程保持运行，下次启动无需重新创建进程
+            self.service_attached = False
+            try:
+                crawler_service.send_command(self._service_address(), 'stop')
+            except (OSError, ValueError) as e:
+                self.log(f"❌ 停止常驻服务中的爬虫时发生错误: {e}", "ERROR")
+            self.stop_crawler_ui()
+            return
+        
         # 如果启用了定时任务，取消所有待定的定时重启
         if self.enable_schedule_var.get():
             # 取消所有after回调（包括可能的定时重启）
@@ -841,8 +972,17 @@ class DoubanCrawlerGUI:
         
         if self.crawler_process:
             try:
-                self.crawler_process.terminate()
-                self.crawler_process.wait(timeout=5)
+                # 先发送停止信号，让爬虫保存已爬取的部分数据和检查点
+                if os.name == 'nt':
+                    self.crawler_process.send_signal(signal.CTRL_BREAK_EVENT)
+                else:
+                    self.crawler_process.terminate()
+                try:
+                    self.crawler_process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    self.log("⚠️ 爬虫未能在10秒内退出，强制结束进程", "WARNING")
+                    self.crawler_process.kill()
+                    self.crawler_process.wait(timeout=5)
             except Exception as e:
                 self.log(f"❌ 停止爬虫时发生错误: {e}", "ERROR")
         
@@ -1009,8 +1149,8 @@ class DoubanCrawlerGUI:
                 self.root.after(0, lambda: messagebox.showerror("错误", "数据目录不存在，请先爬取数据"))
                 return
             
-            json_files = [f for f in os.listdir(data_dir) if f.endswith('.json')]
-            if not json_files:
+            snapshot_files = list_snapshot_files(data_dir)
+            if not snapshot_files:
                 self.root.after(0, lambda: self.log("❌ 没有找到数据文件", "ERROR"))
                 self.root.after(0, lambda: messagebox.showerror("错误", "没有找到数据文件"))
                 return
@@ -1019,14 +1159,26 @@ class DoubanCrawlerGUI:
             total_skipped = 0
             total_failed = 0
             
-            for json_file in json_files:
-                file_path = os.path.join(data_dir, json_file)
+            # 复用共享会话，避免每张封面都重新建立连接
+            config = self._read_config_file()
+            session = http_client.get_session(config)
+            timeout = http_client.get_timeout(config)
+            retry_policy = get_retry_policy('image', config)
+            retry_policy.new_run()
+            get_cassette(config)
+            
+            # 启用电影库时直接遍历电影库（每部电影只出现一次），否则逐个读取快照
+            movie_store = MovieStore.from_config(config, create=False)
+            if movie_store is not None:
+                sources = [(os.path.basename(movie_store.path), movie_store.iter_items)]
+            else:
+                sources = [(name, lambda path=os.path.join(data_dir, name): iter_snapshot_items(path, columns=('id', 'title', 'pic')))
+                           for name in snapshot_files]
+            
+            for source_name, iter_movies in sources:
                 try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                    
-                    movies = data.get('items', [])
-                    for movie in movies:
+                    # 逐条读取，不把整个文件载入内存
+                    for movie in iter_movies():
                         # 获取电影标题和ID
                         title = movie.get('title', '未知电影')
                         movie_id = movie.get('id', '未知ID')
@@ -1049,10 +1201,22 @@ class DoubanCrawlerGUI:
                             total_skipped += 1
                             continue
                         
+                        # 爬取时已预取过该封面（cover_prefetch.fields 包含 large）则直接复制
+                        cached_path = cover_cache_path(large_url)
+                        if os.path.exists(cached_path):
+                            shutil.copyfile(cached_path, filepath)
+                            self.root.after(0, lambda f=filename: self.log(f"✅ 使用预取的封面: {f}", "SUCCESS"))
+                            total_downloaded += 1
+                            continue
+                        
                         # 下载封面
-                        try:
-                            response = requests.get(large_url, timeout=30)
+                        def send(url=large_url):
+                            response = http_get(session, url, headers=http_client.IMAGE_HEADERS, timeout=timeout)
                             response.raise_for_status()
+                            return response
+                        
+                        try:
+                            response = retry_policy.execute(large_url, send)
                             
                             with open(filepath, 'wb') as img_file:
                                 img_file.write(response.content)
@@ -1065,7 +1229,10 @@ class DoubanCrawlerGUI:
                             total_failed += 1
                             
                 except Exception as e:
-                    self.root.after(0, lambda f=json_file, e=e: self.log(f"❌ 处理文件 {f} 时出错: {e}", "ERROR"))
+                    self.root.after(0, lambda f=source_name, e=e: self.log(f"❌ 处理文件 {f} 时出错: {e}", "ERROR"))
+            
+            if movie_store is not None:
+                movie_store.close()
             
             # 显示下载结果
             result_msg = f"🎉 下载完成！成功: {total_downloaded} 个，跳过: {total_skipped} 个，失败: {total_failed} 个"
@@ -1119,12 +1286,17 @@ class DoubanCrawlerGUI:
             latest_file = None
             latest_time = 0
             
+            movie_store = MovieStore.from_config(self._read_config_file(), create=False)
+            if movie_store is not None:
+                total_movies = movie_store.count()
+                movie_store.close()
+            
             if os.path.exists(data_dir):
                 # 使用更高效的文件遍历方式
-                json_files = []
+                snapshot_files = []
                 for entry in os.scandir(data_dir):
-                    if entry.is_file() and entry.name.endswith('.json'):
-                        json_files.append(entry.name)
+                    if entry.is_file() and is_snapshot_file(entry.name):
+                        snapshot_files.append(entry.name)
                         
                         file_path = entry.path
                         file_time = entry.stat().st_mtime
@@ -1136,26 +1308,15 @@ class DoubanCrawlerGUI:
                             latest_file = file_path
                             latest_time = file_time
                         
-                        # 统计总电影数量 - 使用更高效的方式
+                        # 统计总电影数量：电影库可用时直接查询去重后的数量，无需读取快照
+                        if movie_store is not None:
+                            continue
                         try:
-                            # 只读取文件开头部分来获取items数量
-                            with open(file_path, 'r', encoding='utf-8') as f:
-                                # 读取前2000个字符，通常足够包含items数组信息
-                                content_start = f.read(2000)
-                                if '"items":' in content_start:
-                                    # 如果items在文件开头，继续读取完整文件
-                                    f.seek(0)
-                                    data = json.load(f)
-                                    total_movies += len(data.get('items', []))
-                                else:
-                                    # 完整读取文件
-                                    f.seek(0)
-                                    data = json.load(f)
-                                    total_movies += len(data.get('items', []))
-                        except:
+                            total_movies += count_snapshot_items(file_path)
+                        except (OSError, ValueError):
                             continue
                 
-                total_files = len(json_files)
+                total_files = len(snapshot_files)
             
             # 格式化文件大小
             if total_size >= 1024 * 1024:
@@ -1166,7 +1327,7 @@ class DoubanCrawlerGUI:
                 size_str = f"{total_size} B"
             
             # 更新状态栏统计信息
-            self.data_stats_var.set(f"📊 数据文件: {total_files} 个 ({size_str})")
+            self.data_stats_var.set(f"📊 数据文件: {total_files} 个 ({size_str})，电影 {total_movies} 部")
             self.last_update_var.set(f"📅 最后更新: {datetime.fromtimestamp(latest_time).strftime('%Y-%m-%d %H:%M')}" if latest_time else "📅 最后更新: 从未")
             
             # 统计Excel文件
@@ -1187,11 +1348,21 @@ class DoubanCrawlerGUI:
     def on_closing(self):
         """窗口关闭事件处理"""
         if self.is_running:
-            if messagebox.askokcancel("确认", "爬虫正在运行，确定要退出吗？"):
-                self.stop_crawler()
-                self.root.destroy()
-        else:
-            self.root.destroy()
+            if not messagebox.askokcancel("确认", "爬虫正在运行，确定要退出吗？"):
+                return
+            self.stop_crawler()
+        self._shutdown_service()
+        self.root.destroy()
+    
+    def _shutdown_service(self):
+        """关闭由GUI启动的常驻服务进程（外部启动的服务保持运行）"""
+        if self.service_process is None or self.service_process.poll() is not None:
+            return
+        try:
+            crawler_service.send_command(self._service_address(), 'shutdown')
+            self.service_process.wait(timeout=30)
+        except Exception:
+            self.service_process.kill()
 
 if __name__ == "__main__":
     root = tk.Tk()
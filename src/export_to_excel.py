@@ -16,6 +16,13 @@ from openpyxl.utils import get_column_letter
 from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
 import io
 
+import http_client
+from retry_policy import get_retry_policy
+from http_cassette import close_cassette, get_cassette, http_get
+from cover_prefetch import cover_cache_path
+from snapshot import list_snapshot_files, iter_snapshot_items
+from movie_store import MovieStore
+
 def download_image(url, timeout=5, cache_dir='image_cache'):
     """下载图片并返回BytesIO对象，同时缓存到本地文件夹"""
     if not url:
@@ -24,10 +31,8 @@ def download_image(url, timeout=5, cache_dir='image_cache'):
     # 创建缓存目录
     os.makedirs(cache_dir, exist_ok=True)
     
-    # 生成缓存文件名（使用URL的MD5哈希）
-    import hashlib
-    url_hash = hashlib.md5(url.encode()).hexdigest()
-    cache_path = os.path.join(cache_dir, f"{url_hash}.jpg")
+    # 生成缓存文件名（使用URL的MD5哈希，与爬取时的封面预取一致）
+    cache_path = cover_cache_path(url, cache_dir)
     
     # 检查缓存是否存在
     if os.path.exists(cache_path):
@@ -40,12 +45,16 @@ def download_image(url, timeout=5, cache_dir='image_cache'):
     
     try:
         print(f"开始下载图片: {url}")
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-            'Referer': 'https://movie.douban.com/'
-        }
-        response = requests.get(url, headers=headers, timeout=timeout)
-        response.raise_for_status()
+        session = http_client.get_session()
+        
+        def send():
+            response = http_get(session, url, headers=http_client.IMAGE_HEADERS,
+                                timeout=http_client.get_timeout(read_timeout=timeout))
+            response.raise_for_status()
+            return response
+        
+        # 按统一重试策略下载（只重试网络错误/429/5xx，CDN故障时熔断快速失败）
+        response = get_retry_policy('image').execute(url, send)
         
         # 检查是否为图片
         content_type = response.headers.get('content-type', '')
@@ -75,88 +84,119 @@ def download_image(url, timeout=5, cache_dir='image_cache'):
         print(f"警告: 下载图片时发生未知错误 {url}: {e}")
         return None
 
-def export_douban_to_excel(use_latest_only=True, include_images=True):
+# 导出表格用到的快照字段，列式快照只读取这些列
+EXPORT_FIELDS = ('id', 'title', 'year', 'rating', 'card_subtitle', 'pic', 'details')
+
+def build_movie_row(item):
+    """把一条快照电影数据转换为表格行"""
+    details = item.get('details')
+    if details:
+        # 已补全详情时直接使用结构化字段
+        country = ' '.join(details.get('countries', []))
+        movie_type = ' '.join(details.get('genres', []))
+        director = ' '.join(details.get('directors', []))
+        actors = ' '.join(details.get('actors', []))
+    else:
+        # 解析副标题信息
+        subtitle = item.get('card_subtitle', '')
+        parts = subtitle.split(' / ')
+        
+        # 提取各部分信息
+        country = parts[1] if len(parts) > 1 else ''
+        movie_type = parts[2] if len(parts) > 2 else ''
+        director = parts[3] if len(parts) > 3 else ''
+        actors = parts[4] if len(parts) > 4 else ''
+    
+    # 提取关键信息
+    return {
+        '电影ID': item.get('id', ''),
+        '电影标题': item.get('title', ''),
+        '年份': item.get('year', ''),
+        '评分': item.get('rating', {}).get('value', 0),
+        '评分人数': item.get('rating', {}).get('count', 0),
+        '制片国家': country,
+        '影片类型': movie_type,
+        '导演': director,
+        '主演': actors,
+        '封面链接': item.get('pic', {}).get('normal', '') if item.get('pic') else ''
+    }
+
+def export_douban_to_excel(use_latest_only=True, include_images=True, config=None, include_partial=False):
     """从data目录导出豆瓣电影数据到Excel
     
     Args:
-        use_latest_only: 是否只使用最新的JSON文件，避免处理过多数据
+        use_latest_only: 是否只使用最新的快照文件；为False时读取电影库（已启用时）或所有快照
         include_images: 是否包含封面图片
+        config: 配置字典，为空时从config.json读取
+        include_partial: 是否包含中止的爬取保存的部分结果快照（文件名带 _partial）
     """
     
-    # 读取data目录下的JSON文件
-    data_dir = 'data'
-    all_items = []
-    
-    if not os.path.exists(data_dir):
-        print("错误: 找不到data目录")
-        return
-    
-    # 获取所有JSON文件
-    json_files = [f for f in os.listdir(data_dir) if f.endswith('.json')]
-    if not json_files:
-        print("错误: data目录中没有JSON文件")
-        return
-    
-    if use_latest_only:
-        # 只使用最新的文件
-        json_files = [max(json_files, key=lambda x: os.path.getmtime(os.path.join(data_dir, x)))]
-        print(f"只处理最新文件: {json_files[0]}")
-    
-    for filename in json_files:
-        file_path = os.path.join(data_dir, filename)
+    # 读取配置文件（tags参数和连接池设置）
+    if config is None:
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                items = data.get('items', [])
-                all_items.extend(items)
-                print(f"从 {filename} 读取了 {len(items)} 条电影数据")
-        except Exception as e:
-            print(f"警告: 读取文件 {filename} 时出错: {e}")
-            continue
-    
-    if not all_items:
-        print("错误: 没有找到电影数据")
-        return
-    
-    # 准备数据列表
+            with open('config.json', 'r', encoding='utf-8') as f:
+                config = json.load(f)
+        except Exception:
+            config = {}
+    
+    # 按配置初始化共享会话和封面重试策略，后续封面下载复用同一连接池
+    http_client.get_session(config)
+    get_retry_policy('image', config).new_run()
+    # 按配置启用录制/回放，封面下载经过同一个磁带
+    get_cassette(config)
+    
+    # 准备数据列表：逐条读取，只保留表格需要的字段
     movies_data = []
     
-    for item in all_items:
-        # 解析副标题信息
-        subtitle = item.get('card_subtitle', '')
-        parts = subtitle.split(' / ')
+    # 导出全部数据时优先读取电影库：每部电影只有一份，无需解析所有快照
+    movie_store = None if use_latest_only else MovieStore.from_config(config, create=False)
+    if movie_store is not None:
+        for item in movie_store.iter_items():
+            movies_data.append(build_movie_row(item))
+        movie_store.close()
+        print(f"从电影库 {movie_store.path} 读取了 {len(movies_data)} 部电影")
+    else:
+        # 读取data目录下的快照文件
+        data_dir = config.get('output_directory', 'data')
         
-        # 提取各部分信息
-        country = parts[1] if len(parts) > 1 else ''
-        movie_type = parts[2] if len(parts) > 2 else ''
-        director = parts[3] if len(parts) > 3 else ''
-        actors = parts[4] if len(parts) > 4 else ''
+        if not os.path.exists(data_dir):
+            print("错误: 找不到data目录")
+            return
+        
+        # 获取所有快照文件（默认跳过中止的爬取留下的部分结果）
+        snapshot_files = list_snapshot_files(data_dir, include_partial)
+        if not snapshot_files:
+            if list_snapshot_files(data_dir):
+                print("错误: data目录中只有部分结果快照，使用 --include-partial 导出")
+            else:
+                print("错误: data目录中没有快照文件")
+            return
         
-        # 提取关键信息
-        movie_info = {
-            '电影ID': item.get('id', ''),
-            '电影标题': item.get('title', ''),
-            '年份': item.get('year', ''),
-            '评分': item.get('rating', {}).get('value', 0),
-            '评分人数': item.get('rating', {}).get('count', 0),
-            '制片国家': country,
-            '影片类型': movie_type,
-            '导演': director,
-            '主演': actors,
-            '封面链接': item.get('pic', {}).get('normal', '') if item.get('pic') else ''
-        }
-        movies_data.append(movie_info)
+        if use_latest_only:
+            # 只使用最新的文件
+            snapshot_files = [max(snapshot_files, key=lambda x: os.path.getmtime(os.path.join(data_dir, x)))]
+            print(f"只处理最新文件: {snapshot_files[0]}")
+        
+        for filename in snapshot_files:
+            file_path = os.path.join(data_dir, filename)
+            read_count = 0
+            try:
+                for item in iter_snapshot_items(file_path, columns=EXPORT_FIELDS):
+                    movies_data.append(build_movie_row(item))
+                    read_count += 1
+                print(f"从 {filename} 读取了 {read_count} 条电影数据")
+            except Exception as e:
+                print(f"警告: 读取文件 {filename} 时出错: {e}")
+                continue
+    
+    if not movies_data:
+        print("错误: 没有找到电影数据")
+        return
     
     # 创建DataFrame
     df = pd.DataFrame(movies_data)
     
-    # 读取配置文件获取tags参数
-    try:
-        with open('config.json', 'r', encoding='utf-8') as f:
-            config = json.load(f)
-        tags = config.get('tags', '')
-    except Exception:
-        tags = ''
+    tags = config.get('tags', '')
     
     # 生成文件名
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -338,13 +378,19 @@ if __name__ == "__main__":
     parser.add_argument('--no-images', action='store_true', 
                        help='不下载封面图片，仅保留封面链接')
     parser.add_argument('--all-files', action='store_true',
-                       help='处理所有JSON文件，而不仅是最新的')
+                       help='导出全部数据（启用电影库时读取电影库，否则处理所有快照文件），而不仅是最新的')
+    parser.add_argument('--include-partial', action='store_true',
+                       help='包含中止的爬取保存的部分结果快照（文件名带 _partial）')
     parser.add_argument('--progress', action='store_true',
                        help='显示进度信息')
     
     args = parser.parse_args()
     
-    export_douban_to_excel(
-        use_latest_only=not args.all_files,
-        include_images=not args.no_images
-    )
\ No newline at end of file
+    try:
+        export_douban_to_excel(
+            use_latest_only=not args.all_files,
+            include_images=not args.no_images,
+            include_partial=args.include_partial
+        )
+    finally:
+        close_cassette()
\ No newline at end of file
@@ -0,0 +1,186 @@
+"""
+HTTP录制/回放模块
+录制模式下把每个请求的响应（推荐接口分页和封面图片）写入gzip压缩的磁带文件；
+回放模式下从磁带返回响应，可按原始耗时或零延迟回放，不访问网络，
+便于在与生产一致的数据上分析解析、持久化和导出的性能，并以文件形式分享性能回归
+作者: mshellc
+"""
+
+import atexit
+import gzip
+import http.client
+import logging
+import os
+import threading
+import time
+import zlib
+from collections import defaultdict
+from datetime import timedelta
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+import json_codec
+
+# 录制时保留的响应头（其余响应头对解析和重试没有影响）
+RECORDED_HEADERS = ('content-type', 'etag', 'last-modified', 'cache-control', 'retry-after')
+
+
+class CassetteMiss(Exception):
+    """回放时磁带中没有该请求（不属于网络错误，不会被重试）"""
+
+
+class Cassette:
+    """磁带文件
+
+    文件为gzip流，每条记录由一行JSON头部（url、状态码、响应头、耗时、响应体长度）
+    和紧随其后的原始响应体组成。录制默认覆盖已有的磁带；append 为True时追加为新的gzip成员，读取时自动连接
+    （同一URL先返回较早录制的响应）。
+    回放时同一URL的多条记录按录制顺序依次返回（如重试前的429/5xx），用完后重复返回最后一条。
+    网络异常（超时、连接失败）也会录制，回放时抛出同类型的异常。
+    录制进程被强制结束时磁带没有gzip结束标记，读取时保留截断位置之前的完整记录。
+    """
+
+    RECORD = 'record'
+    REPLAY = 'replay'
+
+    def __init__(self, path, mode, latency='original', append=False):
+        if mode not in (self.RECORD, self.REPLAY):
+            raise ValueError(f"不支持的磁带模式: {mode}")
+        self.path = path
+        self.mode = mode
+        self.zero_latency = latency == 'zero'
+        self._lock = threading.Lock()
+        self._file = None
+        self._entries = defaultdict(list)
+        self._positions = defaultdict(int)
+        if mode == self.RECORD:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            self._file = gzip.open(path, 'ab' if append else 'wb')
+            logging.info(f"HTTP录制模式: 响应{'追加' if append else ''}写入 {path}")
+        else:
+            self._load()
+            logging.info(f"HTTP回放模式: 从 {path} 读取 {sum(map(len, self._entries.values()))} 条响应"
+                         f"（{'零延迟' if self.zero_latency else '原始耗时'}）")
+
+    @classmethod
+    def from_config(cls, config):
+        """根据配置中的 cassette 字段创建磁带，未启用时返回None"""
+        options = (config or {}).get('cassette') or {}
+        mode = options.get('mode', 'off')
+        if mode in (None, '', 'off'):
+            return None
+        path = options.get('path') or os.path.join((config or {}).get('output_directory', 'data'),
+                                                    'cassettes', 'default.cassette.gz')
+        return cls(path, mode, options.get('latency', 'original'), options.get('append', False))
+
+    @property
+    def replaying(self):
+        return self.mode == self.REPLAY
+
+    def _load(self):
+        count = 0
+        with gzip.open(self.path, 'rb') as f:
+            try:
+                while True:
+                    line = f.readline()
+                    if not line:
+                        break
+                    header = json_codec.loads(line)
+                    length = header.get('length', 0)
+                    body = f.read(length)
+                    if len(body) < length:
+                        raise EOFError("响应体不完整")
+                    self._entries[header['url']].append((header, body))
+                    count += 1
+            except (EOFError, zlib.error, gzip.BadGzipFile, ValueError) as e:
+                # 录制中途被结束：丢弃最后一条不完整的记录，保留之前的完整记录
+                logging.warning(f"磁带 {self.path} 在第 {count + 1} 条记录处截断（{e}），只回放前 {count} 条")
+
+    def _write(self, header, body=b''):
+        header['length'] = len(body)
+        with self._lock:
+            self._file.write(json_codec.dumps(header) + b'\n' + body)
+            self._file.flush()
+
+    def _replay(self, url, wait=None):
+        with self._lock:
+            entries = self._entries.get(url)
+            if not entries:
+                raise CassetteMiss(f"磁带中没有该请求: {url}")
+            index = min(self._positions[url], len(entries) - 1)
+            self._positions[url] += 1
+        header, body = entries[index]
+        if not self.zero_latency:
+            # 等待期间收到停止信号时立即返回，由调用方检查停止信号
+            (wait or time.sleep)(header.get('elapsed', 0))
+        if 'error' in header:
+            error_class = getattr(requests.exceptions, header['error'], requests.exceptions.ConnectionError)
+            raise error_class(header.get('message', ''))
+        response = requests.Response()
+        response.status_code = header['status']
+        response.reason = http.client.responses.get(response.status_code, '')
+        response.headers = CaseInsensitiveDict(header.get('headers') or {})
+        response.url = url
+        response.encoding = 'utf-8'
+        response.elapsed = timedelta(seconds=header.get('elapsed', 0))
+        response._content = body
+        return response
+
+    def get(self, session, url, wait=None, **kwargs):
+        """代替 session.get：录制模式下请求并记录响应，回放模式下直接返回磁带中的响应
+
+        wait 用于回放时模拟原始耗时（如 stop_event.wait，收到停止信号时提前返回），默认 time.sleep
+        """
+        if self.replaying:
+            return self._replay(url, wait)
+        start = time.monotonic()
+        try:
+            response = session.get(url, **kwargs)
+        except requests.exceptions.RequestException as e:
+            self._write({'url': url, 'error': type(e).__name__, 'message': str(e),
+                         'elapsed': round(time.monotonic() - start, 4)})
+            raise
+        headers = {name: response.headers[name] for name in RECORDED_HEADERS if name in response.headers}
+        self._write({'url': url, 'status': response.status_code, 'headers': headers,
+                     'elapsed': round(time.monotonic() - start, 4)}, response.content)
+        return response
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+_shared_cassette = None
+_shared_cassette_lock = threading.Lock()
+
+
+def get_cassette(config=None):
+    """获取进程内共享的磁带，未启用时返回None（录制的磁带在进程退出时关闭）"""
+    global _shared_cassette
+    with _shared_cassette_lock:
+        if _shared_cassette is None:
+            _shared_cassette = Cassette.from_config(config)
+            if _shared_cassette is not None:
+                atexit.unregister(close_cassette)
+                atexit.register(close_cassette)
+        return _shared_cassette
+
+
+def close_cassette():
+    """关闭共享磁带，录制的磁带写入gzip结束标记"""
+    global _shared_cassette
+    with _shared_cassette_lock:
+        if _shared_cassette is not None:
+            _shared_cassette.close()
+            _shared_cassette = None
+
+
+def http_get(session, url, wait=None, **kwargs):
+    """发送GET请求，启用录制/回放时经过磁带（wait 见 Cassette.get）"""
+    cassette = get_cassette()
+    if cassette is None:
+        return session.get(url, **kwargs)
+    return cassette.get(session, url, wait=wait, **kwargs)
@@ -0,0 +1,111 @@
+"""
+共享HTTP客户端模块
+为爬虫、Excel导出和GUI封面下载提供统一的长连接会话
+作者: mshellc
+"""
+
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# 默认请求头（所有请求共用）
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Referer': 'https://movie.douban.com/explore',
+    'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
+    'Connection': 'keep-alive'
+}
+
+# 推荐接口请求头
+API_HEADERS = {
+    'Accept': 'application/json, text/plain, */*'
+}
+
+# 封面图片请求头
+IMAGE_HEADERS = {
+    'Accept': 'image/webp,image/apng,image/*,*/*;q=0.8',
+    'Referer': 'https://movie.douban.com/'
+}
+
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 30
+DEFAULT_POOL_SIZE = 10
+
+_shared_session = None
+_shared_lock = threading.Lock()
+
+
+def create_session(config=None):
+    """创建带连接池和默认请求头的会话
+
+    支持的配置项:
+        http_pool_size: 默认每个主机的连接池大小
+        http_pool_sizes: 按主机单独设置连接池大小，如 {"img1.doubanio.com": 16}
+    """
+    config = config or {}
+    pool_size = max(1, int(config.get('http_pool_size', DEFAULT_POOL_SIZE)))
+
+    session = requests.Session()
+    session.headers.update(DEFAULT_HEADERS)
+
+    default_adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', default_adapter)
+    session.mount('http://', default_adapter)
+
+    # 按主机挂载独立的连接池（requests按最长前缀匹配适配器）
+    for host, host_pool_size in (config.get('http_pool_sizes') or {}).items():
+        host_pool_size = max(1, int(host_pool_size))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=host_pool_size)
+        session.mount(f'https://{host}', adapter)
+        session.mount(f'http://{host}', adapter)
+
+    return session
+
+
+def _ensure_pool_size(session, pool_size):
+    """会话默认连接池小于 pool_size 时挂载更大的连接池（只扩大不缩小，按主机单独设置的连接池不变）"""
+    current = getattr(session.get_adapter('https://'), '_pool_maxsize', 0)
+    if current >= pool_size:
+        return
+    # 原有适配器上进行中的请求不受影响，之后的请求使用新的连接池
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+
+def get_session(config=None):
+    """获取进程内共享的会话，首次调用时按配置创建
+
+    会话已存在而配置要求更大的 http_pool_size 时（如多任务爬取按全局并发请求上限扩大连接池），
+    扩大共享会话的默认连接池。
+    """
+    global _shared_session
+    with _shared_lock:
+        if _shared_session is None:
+            _shared_session = create_session(config)
+        elif config and 'http_pool_size' in config:
+            _ensure_pool_size(_shared_session, max(1, int(config['http_pool_size'])))
+        return _shared_session
+
+
+def close_session():
+    """关闭共享会话，下次获取时会重新创建"""
+    global _shared_session
+    with _shared_lock:
+        if _shared_session is not None:
+            _shared_session.close()
+            _shared_session = None
+
+
+def get_timeout(config=None, read_timeout=None):
+    """返回 (连接超时, 读取超时) 元组
+
+    连接超时取 connect_timeout，读取超时取 timeout（与原有配置项保持一致）。
+    """
+    config = config or {}
+    connect = config.get('connect_timeout', DEFAULT_CONNECT_TIMEOUT)
+    if read_timeout is None:
+        read_timeout = config.get('timeout', DEFAULT_READ_TIMEOUT)
+    return (min(connect, read_timeout), read_timeout)
+
@@ -0,0 +1,71 @@
+"""
+电影字段裁剪模块
+在数据进入内存、检查点和快照之前，按配置只保留需要的字段
+作者: mshellc
+"""
+
+# 预置字段方案：raw 保留接口返回的完整数据（归档用），export 只保留导出和封面下载用到的字段
+FIELD_PRESETS = {
+    'raw': None,
+    'export': [
+        'id', 'title', 'year', 'card_subtitle',
+        'rating.value', 'rating.count',
+        'pic.normal', 'pic.large'
+    ]
+}
+
+
+def build_projection(fields):
+    """把字段配置编译为嵌套的字段树
+
+    Args:
+        fields: 预置方案名（'raw'、'export'）或字段路径列表，嵌套字段用 . 连接，如 'rating.value'
+    Returns:
+        字段树字典，如 {'id': None, 'rating': {'value': None}}；raw模式返回None
+    """
+    if fields is None:
+        fields = 'raw'
+    if isinstance(fields, str):
+        if fields not in FIELD_PRESETS:
+            raise ValueError(f"未知的字段方案: {fields}")
+        fields = FIELD_PRESETS[fields]
+        if fields is None:
+            return None
+    tree = {}
+    # id 用于去重、增量和电影库主键，始终保留
+    for path in ['id'] + list(fields):
+        node = tree
+        parts = path.split('.')
+        for part in parts[:-1]:
+            child = node.get(part)
+            if child is None:
+                if part in node:
+                    # 已经保留了整个父字段，无需再细分
+                    break
+                child = node[part] = {}
+            node = child
+        else:
+            node[parts[-1]] = None
+    return tree
+
+
+def project_item(item, projection):
+    """按字段树裁剪一条数据，缺失的字段直接跳过"""
+    if projection is None:
+        return item
+    result = {}
+    for key, sub in projection.items():
+        if key not in item:
+            continue
+        value = item[key]
+        if sub is not None and isinstance(value, dict):
+            value = project_item(value, sub)
+        result[key] = value
+    return result
+
+
+def project_items(items, projection):
+    """裁剪一页数据"""
+    if projection is None:
+        return items
+    return [project_item(item, projection) for item in items]
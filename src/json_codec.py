@@ -0,0 +1,127 @@
+"""
+JSON编解码模块
+优先使用orjson或ujson（已安装时），否则回退到标准库json；
+统一以UTF-8字节进行读写，文件读写可以跳过文本解码
+作者: mshellc
+"""
+
+import json
+
+# 按速度从快到慢尝试的后端
+BACKEND_PRIORITY = ('orjson', 'ujson', 'json')
+
+
+class _StdlibBackend:
+    name = 'json'
+
+    @staticmethod
+    def loads(data):
+        return json.loads(data)
+
+    @staticmethod
+    def dumps(obj, indent=False):
+        if indent:
+            text = json.dumps(obj, ensure_ascii=False, indent=2)
+        else:
+            text = json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+        return text.encode('utf-8')
+
+
+class _OrjsonBackend:
+    name = 'orjson'
+
+    def __init__(self):
+        import orjson
+        self._orjson = orjson
+
+    def loads(self, data):
+        return self._orjson.loads(data)
+
+    def dumps(self, obj, indent=False):
+        return self._orjson.dumps(obj, option=self._orjson.OPT_INDENT_2 if indent else 0)
+
+
+class _UjsonBackend:
+    name = 'ujson'
+
+    def __init__(self):
+        import ujson
+        self._ujson = ujson
+
+    def loads(self, data):
+        if isinstance(data, (bytes, bytearray)):
+            data = data.decode('utf-8')
+        return self._ujson.loads(data)
+
+    def dumps(self, obj, indent=False):
+        text = self._ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False,
+                                 indent=2 if indent else 0)
+        return text.encode('utf-8')
+
+
+_BACKEND_CLASSES = {
+    'orjson': _OrjsonBackend,
+    'ujson': _UjsonBackend,
+    'json': _StdlibBackend
+}
+
+
+def _create_backend(name):
+    backend_class = _BACKEND_CLASSES.get(name)
+    if backend_class is None:
+        raise ValueError(f"不支持的JSON后端: {name}")
+    return backend_class()
+
+
+def _detect_backend():
+    for name in BACKEND_PRIORITY:
+        try:
+            return _create_backend(name)
+        except ImportError:
+            continue
+
+
+_backend = _detect_backend()
+
+
+def set_backend(name):
+    """切换JSON后端（'orjson'、'ujson'、'json'），未安装时抛出ImportError"""
+    global _backend
+    _backend = _create_backend(name)
+
+
+def backend_name():
+    """当前使用的JSON后端名称"""
+    return _backend.name
+
+
+def available_backends():
+    """已安装的JSON后端"""
+    names = []
+    for name in BACKEND_PRIORITY:
+        try:
+            _create_backend(name)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+def loads(data):
+    """解析JSON，data 可以是 bytes 或 str"""
+    return _backend.loads(data)
+
+
+def dumps(obj, indent=False):
+    """序列化为UTF-8字节（保留中文不转义），indent 为True时缩进2个空格"""
+    return _backend.dumps(obj, indent)
+
+
+def load(f):
+    """从二进制文件对象读取JSON"""
+    return _backend.loads(f.read())
+
+
+def dump(obj, f, indent=False):
+    """写入二进制文件对象"""
+    f.write(_backend.dumps(obj, indent))
@@ -0,0 +1,260 @@
+"""
+本地模拟豆瓣推荐接口
+模拟 /rexxar/api/v2/movie/recommend 的分页（start/count）、total 和接近真实的电影数据，
+以及 /rexxar/api/v2/movie/<id> 详情接口，
+可配置响应延迟、错误率、429突发和榜单漂移（新电影插入到榜首使后续页面整体后移），
+用于离线测试和基准测试（将配置中的 api_base_url 指向本服务）
+用法:
+    python src/mock_douban_api.py --port 8765 --total 1000 --latency 0.05 --error-rate 0.02
+作者: mshellc
+"""
+
+import argparse
+import random
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import json_codec
+
+RECOMMEND_PATH = '/rexxar/api/v2/movie/recommend'
+DETAIL_PREFIX = '/rexxar/api/v2/movie/'
+
+_GENRES = ['剧情', '喜剧', '动作', '爱情', '科幻', '悬疑', '惊悚', '动画', '犯罪', '纪录片']
+_REGIONS = ['中国大陆', '美国', '日本', '韩国', '中国香港', '英国', '法国']
+
+
+def make_movie(movie_id, seed=0):
+    """按电影ID生成确定的电影数据（字段结构与真实接口一致）"""
+    rng = random.Random(f"{seed}:{movie_id}")
+    genres = rng.sample(_GENRES, rng.randint(1, 3))
+    year = str(rng.randint(1990, 2025))
+    value = round(rng.uniform(4.0, 9.6), 1)
+    return {
+        'id': str(movie_id),
+        'title': f"模拟电影{movie_id}",
+        'type': 'movie',
+        'year': year,
+        'card_subtitle': f"{year} / {rng.choice(_REGIONS)} / {' '.join(genres)} / 导演{rng.randint(1, 500)} / "
+                         f"演员{rng.randint(1, 2000)} 演员{rng.randint(1, 2000)}",
+        'rating': {'count': rng.randint(100, 500000), 'max': 10, 'star_count': round(value / 2 * 2) / 2,
+                   'value': value},
+        'pic': {'large': f"https://img1.doubanio.com/view/photo/m_ratio_poster/public/p{movie_id}.jpg",
+                'normal': f"https://img1.doubanio.com/view/photo/s_ratio_poster/public/p{movie_id}.jpg"},
+        'tags': [{'name': genre, 'uri': f"douban://douban.com/movie/tag?tag={genre}"} for genre in genres],
+        'honor_infos': [],
+        'uri': f"douban://douban.com/movie/{movie_id}",
+        'is_new': rng.random() < 0.1,
+        'null_rating_reason': ''
+    }
+
+
+def make_movie_detail(movie_id, seed=0):
+    """按电影ID生成与 make_movie 一致的详情数据"""
+    movie = make_movie(movie_id, seed)
+    subtitle = movie['card_subtitle'].split(' / ')
+    return dict(movie,
+                countries=[subtitle[1]],
+                genres=subtitle[2].split(' '),
+                directors=[{'name': subtitle[3], 'id': str(movie_id)}],
+                actors=[{'name': name} for name in subtitle[4].split(' ')],
+                languages=['汉语普通话'],
+                durations=['120分钟'],
+                pubdate=[f"{movie['year']}-01-01"],
+                aka=[],
+                intro=f"{movie['title']}的剧情简介")
+
+
+class MockDoubanAPI:
+    """模拟接口的数据和故障注入
+
+    Args:
+        total: 初始电影总数
+        latency: 每个请求的基础延迟（秒）
+        latency_jitter: 在基础延迟上叠加的随机延迟上限（秒）
+        error_rate: 返回5xx错误的概率
+        burst_every: 每隔多少个请求开始一次429突发，0表示不突发
+        burst_length: 每次突发连续返回429的请求数
+        retry_after: 429响应的 Retry-After（秒），0表示不返回该响应头
+        drift_every: 每隔多少个成功的分页请求向榜首插入新电影，0表示不漂移
+        drift_size: 每次插入的新电影数
+        max_count: 每页最多返回的条目数（模拟接口对 count 的上限），0表示不限
+        seed: 随机种子，相同参数和种子下数据与故障序列可复现（并发时请求顺序本身会变化）
+    """
+
+    def __init__(self, total=500, latency=0.0, latency_jitter=0.0, error_rate=0.0,
+                 burst_every=0, burst_length=3, retry_after=1, drift_every=0, drift_size=1, max_count=0, seed=0):
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.burst_every = burst_every
+        self.burst_length = burst_length
+        self.retry_after = retry_after
+        self.drift_every = drift_every
+        self.drift_size = drift_size
+        self.max_count = max_count
+        self.seed = seed
+        self.catalog = [10000000 + i for i in range(total)]
+        self._next_id = 10000000 + total
+        self._random = random.Random(seed)
+        self._burst_remaining = 0
+        self.requests = 0
+        self.page_requests = 0
+        self.responses = {}
+        self._lock = threading.Lock()
+
+    def _record(self, status):
+        self.responses[status] = self.responses.get(status, 0) + 1
+
+    def _inject_fault(self):
+        """按配置注入429突发或5xx错误，返回 (错误响应或None, 延迟)；调用方需持有锁"""
+        self.requests += 1
+        delay = self.latency + self._random.uniform(0, self.latency_jitter)
+        if self.burst_every and self.requests % self.burst_every == 0:
+            self._burst_remaining = self.burst_length
+        if self._burst_remaining > 0:
+            self._burst_remaining -= 1
+            self._record(429)
+            headers = {'Retry-After': str(self.retry_after)} if self.retry_after else {}
+            return (429, headers, {'msg': 'rate_limit_exceeded', 'code': 1999}), delay
+        if self.error_rate and self._random.random() < self.error_rate:
+            status = self._random.choice((500, 502, 503))
+            self._record(status)
+            return (status, {}, {'msg': 'internal_error'}), delay
+        return None, delay
+
+    def handle_detail(self, movie_id):
+        """处理一次详情请求，返回值同 handle"""
+        with self._lock:
+            fault, delay = self._inject_fault()
+            if fault is not None:
+                return fault, delay
+            if not movie_id.isdigit() or int(movie_id) < 10000000 or int(movie_id) >= self._next_id:
+                self._record(404)
+                return (404, {}, {'msg': 'movie_not_found', 'code': 404}), delay
+            self._record(200)
+        return (200, {}, make_movie_detail(movie_id, self.seed)), delay
+
+    def handle(self, start, count):
+        """处理一次分页请求，返回 (状态码, 响应头, 响应体字典) 和需要模拟的延迟"""
+        with self._lock:
+            fault, delay = self._inject_fault()
+            if fault is not None:
+                return fault, delay
+
+            self.page_requests += 1
+            if self.drift_every and self.page_requests % self.drift_every == 0:
+                new_ids = list(range(self._next_id, self._next_id + self.drift_size))
+                self._next_id += self.drift_size
+                self.catalog[0:0] = new_ids
+            if self.max_count:
+                count = min(count, self.max_count)
+            page_ids = self.catalog[start:start + count]
+            total = len(self.catalog)
+            self._record(200)
+        body = {
+            'count': len(page_ids),
+            'start': start,
+            'total': total,
+            'items': [make_movie(movie_id, self.seed) for movie_id in page_ids],
+            'recommend_tags': [],
+            'recommend_categories': [{'is_control': True, 'type': '类型', 'data': [{'text': '全部', 'default': True}]}],
+            'show_rating_filter': True
+        }
+        return (200, {}, body), delay
+
+    def stats(self):
+        with self._lock:
+            return {'requests': self.requests, 'page_requests': self.page_requests,
+                    'responses': dict(self.responses), 'catalog_size': len(self.catalog)}
+
+
+class _MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        if parsed.path.startswith(DETAIL_PREFIX) and parsed.path != RECOMMEND_PATH:
+            (status, headers, body), delay = self.server.api.handle_detail(parsed.path[len(DETAIL_PREFIX):])
+            if delay > 0:
+                time.sleep(delay)
+            self._send(status, headers, body)
+            return
+        if parsed.path != RECOMMEND_PATH:
+            self._send(404, {}, {'msg': 'not_found'})
+            return
+        query = parse_qs(parsed.query)
+        try:
+            start = max(0, int(query.get('start', ['0'])[0]))
+            count = max(0, int(query.get('count', ['20'])[0]))
+        except ValueError:
+            self._send(400, {}, {'msg': 'invalid_request'})
+            return
+        (status, headers, body), delay = self.server.api.handle(start, count)
+        if delay > 0:
+            time.sleep(delay)
+        self._send(status, headers, body)
+
+    def _send(self, status, headers, body):
+        data = json_codec.dumps(body)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockDoubanServer(socketserver.ThreadingMixIn, HTTPServer):
+    """模拟接口服务器，url 属性可直接作为配置中的 api_base_url"""
+
+    daemon_threads = True
+
+    def __init__(self, address, api):
+        super().__init__(address, _MockHandler)
+        self.api = api
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def start_mock_server(host='127.0.0.1', port=0, **options):
+    """在后台线程启动模拟接口（port为0时自动选择端口），options 见 MockDoubanAPI"""
+    server = MockDoubanServer((host, port), MockDoubanAPI(**options))
+    threading.Thread(target=server.serve_forever, name='mock-douban-api', daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='本地模拟豆瓣推荐接口')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--total', type=int, default=500, help='电影总数')
+    parser.add_argument('--latency', type=float, default=0.0, help='基础延迟（秒）')
+    parser.add_argument('--latency-jitter', type=float, default=0.0, help='随机延迟上限（秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='5xx错误概率')
+    parser.add_argument('--burst-every', type=int, default=0, help='每隔多少个请求出现一次429突发')
+    parser.add_argument('--burst-length', type=int, default=3, help='每次429突发的请求数')
+    parser.add_argument('--retry-after', type=int, default=1, help='429响应的Retry-After秒数')
+    parser.add_argument('--drift-every', type=int, default=0, help='每隔多少个分页请求插入新电影')
+    parser.add_argument('--drift-size', type=int, default=1, help='每次插入的新电影数')
+    parser.add_argument('--max-count', type=int, default=0, help='每页最多返回的条目数，0表示不限')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    options = {name: value for name, value in vars(args).items() if name not in ('host', 'port')}
+    server = MockDoubanServer((args.host, args.port), MockDoubanAPI(**options))
+    print(f"模拟接口已启动: {server.url}{RECOMMEND_PATH}（在config.json中设置 \"api_base_url\": \"{server.url}\"）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
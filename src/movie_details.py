@@ -0,0 +1,159 @@
+"""
+电影详情补全模块
+推荐接口只返回摘要 card_subtitle，本模块按电影ID请求详情接口，
+把制片国家、类型、导演、主演等结构化字段合并到条目的 details 字段；
+详情按电影ID缓存在本地SQLite中（带TTL），未过期的电影不会重复请求
+作者: mshellc
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import json_codec
+
+DETAIL_PATH = '/rexxar/api/v2/movie/{}'
+DEFAULT_TTL = 7 * 24 * 3600
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS details (
+    id TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    fetched_at REAL NOT NULL
+);
+'''
+
+
+def _names(values):
+    """人员列表只保留姓名"""
+    return [value.get('name', '') if isinstance(value, dict) else str(value) for value in values or []]
+
+
+def extract_details(data):
+    """从详情接口响应中提取结构化字段"""
+    return {
+        'countries': list(data.get('countries') or []),
+        'genres': list(data.get('genres') or []),
+        'directors': _names(data.get('directors')),
+        'actors': _names(data.get('actors')),
+        'languages': list(data.get('languages') or []),
+        'durations': list(data.get('durations') or []),
+        'pubdate': list(data.get('pubdate') or []),
+        'aka': list(data.get('aka') or []),
+        'intro': data.get('intro', '')
+    }
+
+
+class DetailCache:
+    """电影详情缓存（SQLite，按电影ID保存提取后的结构化字段和抓取时间）"""
+
+    def __init__(self, path, ttl=DEFAULT_TTL):
+        self.path = path
+        self.ttl = float(ttl)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def get_many(self, movie_ids):
+        """批量读取未过期的详情，返回 {id: details}"""
+        if not movie_ids:
+            return {}
+        oldest = time.time() - self.ttl
+        found = {}
+        ids = list(movie_ids)
+        with self._lock:
+            # SQLite单条语句的参数个数有上限，分批查询
+            for index in range(0, len(ids), 500):
+                batch = ids[index:index + 500]
+                rows = self._conn.execute(
+                    f"SELECT id, data FROM details WHERE fetched_at >= ? AND id IN ({','.join('?' * len(batch))})",
+                    [oldest] + batch).fetchall()
+                found.update((movie_id, json_codec.loads(data)) for movie_id, data in rows)
+        return found
+
+    def put(self, movie_id, details):
+        with self._lock:
+            with self._conn:
+                self._conn.execute('INSERT OR REPLACE INTO details VALUES (?, ?, ?)',
+                                   (movie_id, json_codec.dumps(details).decode('utf-8'), time.time()))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class DetailEnricher:
+    """详情补全
+
+    详情请求通过调用方传入的 fetch_json 发送，与推荐接口共用同一个限速器、重试策略、
+    响应缓存和录制/回放；同时进行的详情请求数由 concurrency 限制。
+    单部电影的详情请求失败不影响该页，条目保持不带 details 写入。
+    """
+
+    def __init__(self, fetch_json, api_base_url, cache=None, concurrency=4, log=None):
+        self.fetch_json = fetch_json
+        self.detail_url = api_base_url.rstrip('/') + DETAIL_PATH
+        self.cache = cache
+        self.log = log or logging.getLogger()
+        self.fetched = 0
+        self.cached = 0
+        self.failed = 0
+        self._stats_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, int(concurrency)),
+                                            thread_name_prefix='detail')
+
+    @classmethod
+    def from_config(cls, config, fetch_json, api_base_url, log=None):
+        """根据配置中的 enrichment 字段创建，未启用时返回None"""
+        options = (config or {}).get('enrichment') or {}
+        if not options.get('enabled', False):
+            return None
+        cache = None
+        if options.get('cache', True):
+            cache_path = options.get('cache_path') or os.path.join('cache', 'details.db')
+            cache = DetailCache(cache_path, options.get('ttl', DEFAULT_TTL))
+        return cls(fetch_json, api_base_url, cache, options.get('concurrency', 4), log)
+
+    def _fetch(self, movie_id):
+        try:
+            details = extract_details(self.fetch_json(self.detail_url.format(movie_id)))
+        except (requests.exceptions.RequestException, ValueError) as e:
+            with self._stats_lock:
+                self.failed += 1
+            self.log.warning(f"获取电影 {movie_id} 详情失败: {e}")
+            return None
+        if self.cache is not None:
+            self.cache.put(movie_id, details)
+        with self._stats_lock:
+            self.fetched += 1
+        return details
+
+    def enrich(self, items):
+        """为一批条目补全 details 字段（原地修改并返回 items）"""
+        ids = [str(item.get('id')) for item in items if item.get('id') is not None]
+        found = self.cache.get_many(ids) if self.cache is not None else {}
+        missing = list(dict.fromkeys(movie_id for movie_id in ids if movie_id not in found))
+        with self._stats_lock:
+            self.cached += len(ids) - len(missing)
+        if missing:
+            # 任一请求抛出的其他异常（如停止信号）在这里继续向上传递
+            found.update(zip(missing, self._executor.map(self._fetch, missing)))
+        for item in items:
+            details = found.get(str(item.get('id')))
+            if details is not None:
+                item['details'] = details
+        return items
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        if self.cache is not None:
+            self.cache.close()
+        self.log.info(f"详情补全: 请求 {self.fetched} 部，使用缓存 {self.cached} 部，失败 {self.failed} 部")
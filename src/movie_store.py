@@ -0,0 +1,171 @@
+"""
+电影数据库模块
+以电影ID为主键把爬取结果写入本地SQLite数据库，同一部电影只保存一份，
+记录首次/最近出现时间，供导出和GUI直接查询，无需反复解析所有快照
+作者: mshellc
+"""
+
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+import json_codec
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS movies (
+    id TEXT PRIMARY KEY,
+    title TEXT,
+    year TEXT,
+    rating_value REAL,
+    rating_count INTEGER,
+    card_subtitle TEXT,
+    pic_normal TEXT,
+    pic_large TEXT,
+    data TEXT NOT NULL,
+    first_seen TEXT NOT NULL,
+    last_seen TEXT NOT NULL,
+    seen_count INTEGER NOT NULL DEFAULT 1,
+    last_job TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_movies_last_seen ON movies(last_seen);
+CREATE INDEX IF NOT EXISTS idx_movies_year ON movies(year);
+CREATE INDEX IF NOT EXISTS idx_movies_rating ON movies(rating_value);
+'''
+
+UPSERT_SQL = '''
+INSERT INTO movies (id, title, year, rating_value, rating_count, card_subtitle, pic_normal, pic_large,
+                    data, first_seen, last_seen, seen_count, last_job)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1, ?)
+ON CONFLICT(id) DO UPDATE SET
+    title = excluded.title,
+    year = excluded.year,
+    rating_value = excluded.rating_value,
+    rating_count = excluded.rating_count,
+    card_subtitle = excluded.card_subtitle,
+    pic_normal = excluded.pic_normal,
+    pic_large = excluded.pic_large,
+    data = excluded.data,
+    last_seen = excluded.last_seen,
+    seen_count = movies.seen_count + 1,
+    last_job = excluded.last_job
+'''
+
+
+def _movie_row(item, seen_at, job_name):
+    """把一条电影数据转换为数据库行"""
+    rating = item.get('rating') or {}
+    pic = item.get('pic') or {}
+    return (
+        str(item.get('id')),
+        item.get('title'),
+        item.get('year'),
+        rating.get('value'),
+        rating.get('count'),
+        item.get('card_subtitle'),
+        pic.get('normal'),
+        pic.get('large'),
+        json_codec.dumps(item).decode('utf-8'),
+        seen_at,
+        seen_at,
+        job_name
+    )
+
+
+class MovieStore:
+    """SQLite电影库
+
+    - 主键为电影ID，重复出现的电影执行upsert：更新数据和 last_seen，保留 first_seen
+    - 常用字段单独成列并建立索引，完整数据以JSON保存在 data 列
+    - 同一进程内多个爬取任务共享一个连接，写入由锁串行化
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    @staticmethod
+    def path_from_config(config):
+        """数据库路径，默认为输出目录下的 movies.db"""
+        options = (config or {}).get('movie_store') or {}
+        return options.get('path') or os.path.join((config or {}).get('output_directory', 'data'), 'movies.db')
+
+    @classmethod
+    def from_config(cls, config, create=True):
+        """根据配置中的 movie_store 字段打开电影库
+
+        Args:
+            config: 配置字典
+            create: 为False时数据库文件不存在则返回None（只读场景，如导出和GUI统计）
+        Returns:
+            MovieStore，未启用时返回None
+        """
+        options = (config or {}).get('movie_store') or {}
+        if not options.get('enabled', False):
+            return None
+        path = cls.path_from_config(config)
+        if not create and not os.path.exists(path):
+            return None
+        return cls(path)
+
+    def upsert_items(self, items, job_name=None, seen_at=None):
+        """写入一批电影（单个事务）"""
+        if not items:
+            return
+        seen_at = seen_at or datetime.now().isoformat(timespec='seconds')
+        rows = [_movie_row(item, seen_at, job_name) for item in items]
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(UPSERT_SQL, rows)
+
+    def count(self):
+        """电影总数"""
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM movies').fetchone()[0]
+
+    def last_seen(self):
+        """最近一次写入时间，数据库为空时返回None"""
+        with self._lock:
+            return self._conn.execute('SELECT MAX(last_seen) FROM movies').fetchone()[0]
+
+    def iter_items(self, batch_size=500):
+        """按最近出现时间倒序遍历完整电影数据"""
+        with self._lock:
+            cursor = self._conn.execute('SELECT data FROM movies ORDER BY last_seen DESC, id')
+            rows = cursor.fetchmany(batch_size)
+        while rows:
+            for (data,) in rows:
+                yield json_codec.loads(data)
+            with self._lock:
+                rows = cursor.fetchmany(batch_size)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_shared_store = None
+_shared_store_lock = threading.Lock()
+
+
+def get_movie_store(config=None):
+    """获取进程内共享的电影库，未启用时返回None"""
+    global _shared_store
+    with _shared_store_lock:
+        if _shared_store is None:
+            _shared_store = MovieStore.from_config(config)
+        return _shared_store
+
+
+def close_movie_store():
+    """关闭共享电影库（配置变更后调用），下次获取时按新配置打开"""
+    global _shared_store
+    with _shared_store_lock:
+        if _shared_store is not None:
+            _shared_store.close()
+            _shared_store = None
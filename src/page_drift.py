@@ -0,0 +1,145 @@
+"""
+榜单漂移检测模块
+推荐接口按 start/count 偏移量分页，而榜单在爬取过程中会实时变化（新电影插入、电影下架），
+两次请求之间整体后移会使下一页与上一页重复，整体前移会使两页之间漏掉电影。
+本模块按电影ID去重，并根据相邻两页各自返回的 total 和请求先后顺序判断两页之间是否有遗漏，
+给出需要补抓的偏移量窗口，只补抓受影响的窗口而不必整轮重爬
+作者: mshellc
+"""
+
+import logging
+
+
+class DriftWindow:
+    """需要补抓的偏移量窗口
+
+    Args:
+        start: 窗口起始位置
+        size: 窗口大小（条）
+        total: 确定窗口位置时参照的 total，补抓时接口返回的 total 与之不同说明榜单又发生了变化
+    """
+
+    def __init__(self, start, size, total):
+        self.start = start
+        self.size = size
+        self.total = total
+
+    @property
+    def end(self):
+        return self.start + self.size
+
+
+def drift_window(offset, previous_total, total, overlap):
+    """根据相邻两页各自返回的 total 判断两页之间可能遗漏的窗口
+
+    假设榜单变化集中在边界之前（新电影插入或电影下架使后面的电影整体前后移动），两页 total 相差 n 时：
+      - 先请求上一页、榜单再变长（或先请求下一页、榜单再变短），下一页开头的 n 部电影与上一页重复
+      - 反过来则两页之间漏掉 n 部电影，按 total 较大时的排名它们位于 [offset, offset + n)
+    并发请求时无法可靠判断两页的先后（响应到达顺序不等于服务器生成顺序），
+    因此用下一页中已写入过的电影数 overlap 区分：重复数不少于 n 时说明是前一种情况，无需补抓。
+    两页 total 相同时无法定位遗漏（如排名互换），只按ID去重。
+
+    Args:
+        offset: 下一页的起始位置（即两页的边界）
+        previous_total: 上一页返回的 total
+        total: 下一页返回的 total
+        overlap: 下一页中已写入过的电影数
+
+    Returns:
+        DriftWindow，无需补抓时返回None
+    """
+    shift = abs(total - previous_total)
+    if shift == 0 or overlap >= shift:
+        return None
+    return DriftWindow(offset, shift, max(total, previous_total))
+
+
+class PageDriftTracker:
+    """按写入顺序跟踪页面：电影ID去重，并在相邻页面之间检测漂移
+
+    Args:
+        refetch: 检测到遗漏时是否补抓
+        max_window: 单个补抓窗口的最大条数（total 剧烈变化时不按差值补抓整段）
+        max_refetches: 每轮最多补抓的窗口数
+    """
+
+    def __init__(self, refetch=True, max_window=100, max_refetches=20, log=None):
+        self.refetch = refetch
+        self.max_window = max(1, int(max_window))
+        self.max_refetches = max(0, int(max_refetches))
+        self.log = log or logging.getLogger()
+        self.seen_ids = set()
+        self.duplicates = 0
+        self.drifts = 0
+        self.refetches = 0
+        self.recovered = 0
+        self.latest_total = None
+        self._latest_seq = -1
+        self._last = None
+
+    @classmethod
+    def from_config(cls, config, log=None):
+        options = (config or {}).get('drift') or {}
+        return cls(options.get('refetch', True), options.get('max_window', 100),
+                   options.get('max_refetches', 20), log)
+
+    def dedup(self, items):
+        """去掉本轮已写入过的电影（同一ID保留最先写入的一条），返回剩余条目"""
+        unique = []
+        for item in items:
+            movie_id = item.get('id')
+            if movie_id is not None:
+                movie_id = str(movie_id)
+                if movie_id in self.seen_ids:
+                    self.duplicates += 1
+                    continue
+                self.seen_ids.add(movie_id)
+            unique.append(item)
+        return unique
+
+    def observe(self, meta):
+        """记录一页的 (total, 请求序号)，保留最后一次请求看到的total"""
+        total, seq = meta
+        if seq > self._latest_seq:
+            self._latest_seq = seq
+            self.latest_total = total
+
+    def tail_page_needed(self, offset):
+        """榜单在爬取过程中变长时，原定最后一页之后还有被挤出的电影，判断是否需要补抓 offset 处的尾部页面"""
+        if not self.refetch or self.latest_total is None or offset >= self.latest_total:
+            return False
+        if self.refetches >= self.max_refetches:
+            return False
+        self.drifts += 1
+        self.refetches += 1
+        return True
+
+    def check_boundary(self, offset, page_size, total, items):
+        """记录即将写入的页面，返回它与上一页之间需要补抓的窗口（无需补抓时返回None）
+
+        Args:
+            offset: 页面起始位置
+            page_size: 每页条数（只比较相邻的两页）
+            total: 该页返回的total，从检查点恢复的页面为None
+            items: 该页的条目（尚未去重）
+        """
+        previous, self._last = self._last, (offset, total)
+        if previous is None or total is None or previous[1] is None or previous[0] + page_size != offset:
+            return None
+        overlap = sum(1 for item in items if str(item.get('id')) in self.seen_ids)
+        window = drift_window(offset, previous[1], total, overlap)
+        if window is None:
+            return None
+        self.drifts += 1
+        self.log.info(f"检测到榜单漂移: 起始位置 {offset} 前后两页的total分别为 {previous[1]} 和 {total}，"
+                      f"重复 {overlap} 条，可能遗漏的位置: [{window.start}, {window.end})")
+        if not self.refetch or self.refetches >= self.max_refetches:
+            return None
+        self.refetches += 1
+        window.size = min(window.size, self.max_window)
+        return window
+
+    def log_summary(self):
+        if self.duplicates or self.drifts:
+            self.log.info(f"榜单漂移: 去除重复 {self.duplicates} 条，检测到漂移 {self.drifts} 处，"
+                          f"补抓窗口 {self.refetches} 个，补回 {self.recovered} 条")
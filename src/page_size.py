@@ -0,0 +1,90 @@
+"""
+页大小探测模块
+配置 "count": "auto" 时，第一页按 probe_max 请求，根据返回的 items 数量判断接口实际支持的最大页大小，
+结果按接口地址缓存到本地文件，之后的爬取直接使用缓存的页大小，页数越少请求越少
+作者: mshellc
+"""
+
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import json_codec
+
+AUTO = 'auto'
+DEFAULT_PROBE_MAX = 100
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_CACHE_PATH = os.path.join('cache', 'page_size.json')
+
+# 每个任务各自创建 PageSizeCache，并发任务读写同一缓存文件时由模块级锁串行化
+_cache_lock = threading.Lock()
+
+
+def honoured_count(requested, returned, start, total):
+    """根据一次请求的结果判断接口支持的页大小
+
+    返回的条目数达到请求数时说明请求的页大小被完整支持；少于请求数且不是最后一页时，
+    返回的条目数就是接口的上限；最后一页无法判断，返回None。
+    """
+    if returned >= requested:
+        return requested
+    if start + returned >= total:
+        return None
+    return max(1, returned)
+
+
+class PageSizeCache:
+    """按接口地址缓存探测到的页大小 {endpoint: {"count": n, "probed_at": 时间戳}}"""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=DEFAULT_TTL):
+        self.path = path
+        self.ttl = float(ttl)
+
+    @classmethod
+    def from_config(cls, config):
+        options = (config or {}).get('page_size') or {}
+        return cls(options.get('cache_path') or DEFAULT_CACHE_PATH, options.get('ttl', DEFAULT_TTL))
+
+    def _load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                return json_codec.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, endpoint):
+        """未过期的页大小，没有缓存时返回None"""
+        with _cache_lock:
+            entry = self._load().get(endpoint)
+        if not entry or time.time() - entry.get('probed_at', 0) > self.ttl:
+            return None
+        return entry.get('count')
+
+    def put(self, endpoint, count):
+        """写入页大小，返回是否写入成功（缓存写入失败只记录警告，不影响爬取）"""
+        with _cache_lock:
+            entries = self._load()
+            entries[endpoint] = {'count': count, 'probed_at': time.time()}
+            tmp_path = None
+            try:
+                directory = os.path.dirname(self.path) or '.'
+                os.makedirs(directory, exist_ok=True)
+                # 临时文件名唯一，其他进程同时写入同一缓存时不会互相覆盖临时文件
+                fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(self.path) + '.', suffix='.tmp',
+                                                dir=directory)
+                with os.fdopen(fd, 'wb') as f:
+                    json_codec.dump(entries, f, indent=True)
+                os.replace(tmp_path, self.path)
+                return True
+            except OSError as e:
+                logging.warning(f"写入页大小缓存 {self.path} 失败: {e}")
+                if tmp_path is not None and os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                return False
+
+
+def probe_max_from_config(config):
+    options = (config or {}).get('page_size') or {}
+    return max(1, int(options.get('probe_max', DEFAULT_PROBE_MAX)))
@@ -0,0 +1,133 @@
+"""
+自适应请求限速模块
+基于令牌桶的AIMD（加性增、乘性减）限速器，根据服务器实际响应调整请求速率
+作者: mshellc
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+# 触发限速降档的HTTP状态码
+THROTTLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def parse_retry_after(value, max_delay=None):
+    """解析Retry-After响应头，返回需要等待的秒数，无法解析时返回None
+
+    Retry-After 可以是秒数，也可以是HTTP日期；指定 max_delay 时等待时间不超过该值，
+    避免服务器给出过大的值时长时间无法停止。
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        seconds = float(value)
+    else:
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        seconds = max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    return seconds if max_delay is None else min(seconds, float(max_delay))
+
+
+class AdaptiveRateLimiter:
+    """AIMD自适应令牌桶限速器
+
+    - 请求快速且成功时，速率按 increase_step 加性增长，直到 max_rate
+    - 遇到 429/5xx、网络错误或延迟超过 latency_threshold 时，速率乘以 decrease_factor
+    - 服务器返回 Retry-After 时，在指定时间内暂停发放令牌
+    """
+
+    def __init__(self, initial_rate=1.0, min_rate=0.2, max_rate=5.0, increase_step=0.2,
+                 decrease_factor=0.5, latency_threshold=2.0, burst=1):
+        self.min_rate = float(min_rate)
+        self.max_rate = float(max_rate)
+        self.increase_step = float(increase_step)
+        self.decrease_factor = float(decrease_factor)
+        self.latency_threshold = float(latency_threshold)
+        self.burst = max(1, int(burst))
+        self._rate = min(self.max_rate, max(self.min_rate, float(initial_rate)))
+        self._tokens = float(self.burst)
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        """根据配置中的 rate_limit 字段创建限速器"""
+        options = dict((config or {}).get('rate_limit') or {})
+        return cls(**options)
+
+    @property
+    def rate(self):
+        """当前请求速率（次/秒）"""
+        return self._rate
+
+    def _refill(self, now):
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._tokens = min(float(self.burst), self._tokens + elapsed * self._rate)
+
+    def acquire(self, wait=time.sleep):
+        """阻塞直到获得一个请求令牌
+
+        Args:
+            wait: 等待函数，可传入 Event.wait：事件被设置时立即返回False，不再等待令牌
+
+        Returns:
+            获得令牌时返回True
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self._paused_until:
+                    delay = self._paused_until - now
+                elif self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                else:
+                    delay = (1 - self._tokens) / self._rate
+            if wait(delay):
+                return False
+
+    def on_success(self, latency):
+        """记录一次成功请求，延迟过高时视为拥塞信号"""
+        if latency > self.latency_threshold:
+            self._decrease(f"响应延迟 {latency:.2f}s 超过阈值 {self.latency_threshold:.2f}s")
+            return
+        with self._lock:
+            self._rate = min(self.max_rate, self._rate + self.increase_step)
+
+    def on_failure(self, status_code=None, retry_after=None):
+        """记录一次失败请求
+
+        Args:
+            status_code: HTTP状态码，网络错误时为None
+            retry_after: 服务器要求的等待秒数
+        """
+        if retry_after:
+            with self._lock:
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            logging.warning(f"服务器要求 {retry_after:.1f} 秒后重试，暂停发送请求")
+        if status_code is None or status_code in THROTTLE_STATUS_CODES:
+            reason = f"HTTP {status_code}" if status_code else "网络错误"
+            self._decrease(reason)
+
+    def _decrease(self, reason):
+        with self._lock:
+            now = time.monotonic()
+            # 同一时间窗口内的多个失败只降速一次，避免并发请求把速率直接压到底
+            if now - self._last_decrease < 1.0 / self._rate:
+                return
+            self._last_decrease = now
+            old_rate = self._rate
+            self._rate = max(self.min_rate, self._rate * self.decrease_factor)
+        logging.warning(f"{reason}，请求速率由 {old_rate:.2f} 降至 {self._rate:.2f} 次/秒")
@@ -0,0 +1,187 @@
+"""
+HTTP响应磁盘缓存模块
+按完整URL缓存推荐接口的响应，支持TTL、ETag/Last-Modified条件请求和容量上限
+作者: mshellc
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import json_codec
+
+
+def _atomic_write(path, data):
+    """先写临时文件再替换，避免读到写了一半的缓存"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class CachedResponse:
+    """缓存中的一条响应"""
+
+    def __init__(self, url, body, headers, fetched_at):
+        self.url = url
+        self.body = body
+        self.headers = headers
+        self.fetched_at = fetched_at
+
+    def json(self):
+        return json_codec.loads(self.body)
+
+
+class ResponseCache:
+    """磁盘响应缓存
+
+    每条缓存由两个文件组成：<key>.meta（URL、响应头、抓取时间）和 <key>.body（原始响应体），
+    key 为URL的SHA-1。总大小超过 max_bytes 时按最近使用时间淘汰。
+    """
+
+    def __init__(self, directory='cache/http', ttl=600, max_bytes=100 * 1024 * 1024):
+        self.directory = directory
+        self.ttl = float(ttl)
+        self.max_bytes = int(max_bytes)
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._total_bytes = self._scan_size()
+
+    @classmethod
+    def from_config(cls, config):
+        """根据配置中的 response_cache 字段创建缓存，未启用时返回None"""
+        options = (config or {}).get('response_cache') or {}
+        if not options.get('enabled', False):
+            return None
+        return cls(
+            directory=options.get('directory', 'cache/http'),
+            ttl=options.get('ttl', 600),
+            max_bytes=int(options.get('max_size_mb', 100) * 1024 * 1024)
+        )
+
+    def _paths(self, url):
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        base = os.path.join(self.directory, key)
+        return base + '.meta', base + '.body'
+
+    def _scan_size(self):
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.is_file():
+                total += entry.stat().st_size
+        return total
+
+    def get(self, url):
+        """读取缓存条目，不存在或损坏时返回None"""
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            with open(body_path, 'rb') as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        if meta.get('url') != url:
+            return None
+        # 更新访问时间，供LRU淘汰使用
+        try:
+            os.utime(body_path, None)
+        except OSError:
+            pass
+        return CachedResponse(url, body, meta.get('headers', {}), meta.get('fetched_at', 0))
+
+    def is_fresh(self, entry):
+        """条目是否仍在TTL内"""
+        return time.time() - entry.fetched_at < self.ttl
+
+    def conditional_headers(self, entry):
+        """为过期条目生成条件请求头"""
+        headers = {}
+        if entry.headers.get('ETag'):
+            headers['If-None-Match'] = entry.headers['ETag']
+        if entry.headers.get('Last-Modified'):
+            headers['If-Modified-Since'] = entry.headers['Last-Modified']
+        return headers
+
+    def store(self, url, response):
+        """保存响应（只缓存200响应）"""
+        if response.status_code != 200:
+            return
+        headers = {}
+        for name in ('ETag', 'Last-Modified', 'Content-Type'):
+            if response.headers.get(name):
+                headers[name] = response.headers[name]
+        self._write(url, response.content, headers, time.time())
+
+    def touch(self, url, entry):
+        """304重新验证成功后刷新抓取时间"""
+        self._write(url, entry.body, entry.headers, time.time())
+
+    def discard(self, url):
+        """删除一条缓存（如响应体无法解析）"""
+        with self._lock:
+            for path in self._paths(url):
+                try:
+                    size = os.path.getsize(path)
+                    os.remove(path)
+                    self._total_bytes -= size
+                except OSError:
+                    pass
+
+    def _write(self, url, body, headers, fetched_at):
+        meta_path, body_path = self._paths(url)
+        meta = json.dumps({'url': url, 'headers': headers, 'fetched_at': fetched_at}, ensure_ascii=False)
+        with self._lock:
+            old_size = sum(os.path.getsize(p) for p in (meta_path, body_path) if os.path.exists(p))
+            _atomic_write(body_path, body)
+            _atomic_write(meta_path, meta.encode('utf-8'))
+            self._total_bytes += os.path.getsize(meta_path) + os.path.getsize(body_path) - old_size
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """按最近使用时间淘汰，直到总大小降到上限的90%"""
+        bodies = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith('.body'):
+                bodies.append((entry.stat().st_mtime, entry.path))
+        bodies.sort()
+        target = self.max_bytes * 0.9
+        evicted = 0
+        for _, body_path in bodies:
+            if self._total_bytes <= target:
+                break
+            meta_path = body_path[:-len('.body')] + '.meta'
+            for path in (body_path, meta_path):
+                try:
+                    size = os.path.getsize(path)
+                    os.remove(path)
+                    self._total_bytes -= size
+                except OSError:
+                    pass
+            evicted += 1
+        if evicted:
+            logging.info(f"响应缓存超出容量上限，已淘汰 {evicted} 条")
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_response_cache(config=None):
+    """获取进程内共享的响应缓存，未启用时返回None"""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = ResponseCache.from_config(config)
+        return _shared_cache
+
+
+def reset_response_cache():
+    """丢弃共享响应缓存（配置变更后调用），下次获取时按新配置创建，已缓存的文件保留"""
+    global _shared_cache
+    with _shared_cache_lock:
+        _shared_cache = None
@@ -0,0 +1,218 @@
+"""
+统一重试策略模块
+提供单请求重试、单轮重试预算、去相关抖动退避、按状态码处理和熔断
+作者: mshellc
+"""
+
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+
+from rate_limiter import parse_retry_after
+
+# 可以重试的HTTP状态码（其余4xx直接失败）
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """熔断器处于打开状态，请求被快速失败"""
+
+
+class CircuitBreaker:
+    """简单熔断器
+
+    连续失败达到 failure_threshold 次后打开，reset_timeout 秒内所有请求直接失败；
+    超时后进入半开状态放行一个探测请求，成功则关闭，失败则重新打开。
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=60):
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_timeout = float(reset_timeout)
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_request(self, name=''):
+        """请求前检查，熔断打开时抛出 CircuitOpenError"""
+        with self._lock:
+            if self.state == self.OPEN:
+                remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+                if remaining > 0:
+                    raise CircuitOpenError(f"{name} 熔断中，{remaining:.0f} 秒后再试")
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    raise CircuitOpenError(f"{name} 熔断探测中")
+                self._probe_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def release_probe(self):
+        """探测请求未得到结果（如被停止、超出请求预算）时释放探测名额，下一个请求重新探测"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+
+class RetryPolicy:
+    """统一重试策略
+
+    - max_attempts: 单个请求最多尝试次数
+    - run_retry_budget: 一轮爬取内所有请求共享的重试次数上限（0表示不限制）
+    - max_run_attempts: 整轮爬取失败后的最多尝试次数
+    - base_delay / max_delay: 去相关抖动退避的下限和上限（秒）
+    - run_base_delay: 整轮重试之间的退避下限（秒）
+    - 只重试网络错误、429和5xx；其他4xx立即失败
+    - 同一主机连续失败时熔断，熔断期间请求直接失败
+    """
+
+    def __init__(self, max_attempts=3, run_retry_budget=30, max_run_attempts=3,
+                 base_delay=1.0, max_delay=30.0, run_base_delay=10.0,
+                 breaker_failure_threshold=5, breaker_reset_timeout=60):
+        self.max_attempts = max(1, int(max_attempts))
+        self.run_retry_budget = max(0, int(run_retry_budget))
+        self.max_run_attempts = max(1, int(max_run_attempts))
+        self.base_delay = float(base_delay)
+        self.max_delay = float(max_delay)
+        self.run_base_delay = float(run_base_delay)
+        self.breaker_failure_threshold = breaker_failure_threshold
+        self.breaker_reset_timeout = breaker_reset_timeout
+        self.retries_used = 0
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        """根据配置中的 retry 字段创建策略，max_attempts/max_run_attempts 默认取 max_retries"""
+        config = config or {}
+        max_retries = config.get('max_retries', 3)
+        options = {'max_attempts': max_retries, 'max_run_attempts': max_retries}
+        options.update(config.get('retry') or {})
+        return cls(**options)
+
+    def new_run(self):
+        """开始新一轮爬取，重置重试预算"""
+        with self._lock:
+            self.retries_used = 0
+
+    def breaker_for(self, url):
+        """按主机获取熔断器"""
+        host = urlparse(url).hostname or ''
+        with self._lock:
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                breaker = CircuitBreaker(self.breaker_failure_threshold, self.breaker_reset_timeout)
+                self._breakers[host] = breaker
+            return breaker
+
+    def is_retryable(self, error):
+        """判断异常是否值得重试"""
+        if isinstance(error, CircuitOpenError):
+            return False
+        response = getattr(error, 'response', None)
+        if response is not None:
+            return response.status_code in RETRYABLE_STATUS_CODES
+        return isinstance(error, requests.exceptions.RequestException)
+
+    def _consume_budget(self):
+        with self._lock:
+            if self.run_retry_budget and self.retries_used >= self.run_retry_budget:
+                return False
+            self.retries_used += 1
+            return True
+
+    def next_delay(self, previous_delay, base_delay=None):
+        """去相关抖动: delay = min(max_delay, uniform(base, previous * 3))"""
+        base = self.base_delay if base_delay is None else base_delay
+        previous = max(previous_delay or base, base)
+        return min(self.max_delay, random.uniform(base, previous * 3))
+
+    def execute(self, url, request_func, wait=time.sleep, on_retry=None):
+        """按策略执行一次请求
+
+        Args:
+            url: 请求URL（用于按主机熔断）
+            request_func: 无参函数，返回已检查状态码的响应，失败时抛出 RequestException
+            wait: 等待函数，可传入 Event.wait 以便停止时立即返回
+            on_retry: 回调 on_retry(error, attempt, delay)，用于记录日志
+        """
+        breaker = self.breaker_for(url)
+        delay = 0
+        attempt = 0
+        while True:
+            attempt += 1
+            breaker.before_request(urlparse(url).hostname or url)
+            try:
+                result = request_func()
+            except requests.exceptions.RequestException as e:
+                retryable = self.is_retryable(e)
+                if retryable:
+                    breaker.record_failure()
+                else:
+                    # 服务器正常返回了4xx，说明端点可用
+                    breaker.record_success()
+                if not retryable or attempt >= self.max_attempts or not self._consume_budget():
+                    raise
+                response = getattr(e, 'response', None)
+                retry_after = parse_retry_after(response.headers.get('Retry-After'), self.max_delay) \
+                    if response is not None else None
+                delay = retry_after if retry_after is not None else self.next_delay(delay)
+                if on_retry is not None:
+                    on_retry(e, attempt, delay)
+                wait(delay)
+                continue
+            except BaseException:
+                # 其他异常不代表主机状态，但半开状态下必须释放探测名额，否则熔断器会一直停在探测中
+                breaker.release_probe()
+                raise
+            breaker.record_success()
+            return result
+
+    def run_delay(self, previous_delay):
+        """整轮重试之间的退避时间"""
+        return self.next_delay(previous_delay, base_delay=self.run_base_delay)
+
+    def allow_run_retry(self, run_attempt):
+        """判断整轮爬取失败后是否还能重试（同样消耗重试预算）"""
+        return run_attempt < self.max_run_attempts and self._consume_budget()
+
+
+_policies = {}
+_policies_lock = threading.Lock()
+
+
+def get_retry_policy(name, config=None):
+    """获取进程内共享的命名策略（如 'api'、'image'），熔断状态在调用方之间共享"""
+    with _policies_lock:
+        policy = _policies.get(name)
+        if policy is None:
+            policy = RetryPolicy.from_config(config)
+            _policies[name] = policy
+        return policy
+
+
+def reset_retry_policies():
+    """丢弃所有共享策略（配置变更后调用），下次获取时按新配置重建"""
+    with _policies_lock:
+        _policies.clear()
@@ -0,0 +1,301 @@
+"""
+分片爬取模块（协调者/工作进程模式）
+协调者爬取每个任务的第一段以获取total，把剩余页面区间写成租约放入共享队列；
+任意数量的工作进程（可在不同机器上，共享队列数据库所在目录）领取租约并各自写入分片结果；
+全部租约完成后由合并步骤按起始位置顺序生成最终快照
+用法（在项目根目录执行）:
+    python src shard plan      # 协调者：创建一次分片运行
+    python src shard work      # 工作进程：领取并执行租约，可同时启动多个
+    python src shard merge     # 合并分片结果为最终快照
+    python src shard status    # 查看租约进度
+作者: mshellc
+"""
+
+import logging
+import os
+import shutil
+import socket
+import threading
+from datetime import datetime
+
+import http_client
+from douban_crawler import (DEFAULT_API_BASE_URL, RECOMMEND_PATH, expand_crawl_jobs, fetch_douban_movies,
+                            job_config_for, stop_event, unique_job_names)
+from movie_store import get_movie_store
+from page_size import AUTO as PAGE_SIZE_AUTO, PageSizeCache, probe_max_from_config
+from rate_limiter import AdaptiveRateLimiter
+from retry_policy import get_retry_policy
+from snapshot import (count_snapshot_items, create_snapshot_writer, iter_snapshot_items, list_snapshot_files,
+                      read_snapshot_meta)
+from work_queue import LeaseQueue
+
+# 合并时每批写入的条目数
+MERGE_BATCH_SIZE = 500
+
+
+def _shard_options(config):
+    options = (config or {}).get('shard') or {}
+    return {
+        'pages_per_lease': max(1, int(options.get('pages_per_lease', 5))),
+        'poll_interval': float(options.get('poll_interval', 10))
+    }
+
+
+def _parts_dir(queue, run_id, job_name):
+    """分片结果目录：与队列数据库放在同一目录下，工作进程和合并步骤都能访问"""
+    return os.path.join(os.path.dirname(queue.path), 'parts', run_id, job_name)
+
+
+def _endpoint(job_config):
+    api_base_url = job_config.get('api_base_url') or DEFAULT_API_BASE_URL
+    return f"{api_base_url.rstrip('/')}{RECOMMEND_PATH}"
+
+
+def default_worker_id():
+    """工作进程标识：主机名-进程号"""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def _fetch_range(job_config, job_name, offset, size, part_dir, session=None, rate_limiter=None):
+    """爬取 [offset, offset + size) 区间并写入 part_dir，返回分片快照路径，失败时返回None
+
+    分片固定写未压缩的NDJSON，不写检查点、增量索引和电影库（由合并步骤统一写入）。
+    """
+    shard_config = dict(job_config,
+                        start=offset,
+                        actual_count=size,
+                        output_directory=part_dir,
+                        snapshot_format='ndjson',
+                        snapshot_compression='none',
+                        checkpoint=False,
+                        resume=False,
+                        incremental=False,
+                        movie_store={'enabled': False})
+    if not fetch_douban_movies(shard_config, session, None, job_name, rate_limiter):
+        return None
+    files = list_snapshot_files(part_dir, include_partial=False)
+    return os.path.join(part_dir, files[0]) if files else None
+
+
+def plan_run(config, run_id=None):
+    """协调者：为配置中的每个任务创建租约，返回运行ID，所有任务都规划失败时返回None
+
+    每个任务先由协调者爬取第一段（pages_per_lease 页）得到total，
+    第一段直接登记为已完成，剩余区间按 pages_per_lease 页一个租约写入队列。
+    """
+    queue = LeaseQueue.from_config(config)
+    options = _shard_options(config)
+    run_id = run_id or datetime.now().strftime('%Y%m%d_%H%M%S')
+    worker_id = default_worker_id()
+    jobs = expand_crawl_jobs(config) or [{}]
+    retry_policy = get_retry_policy('api', config)
+    job_configs = [job_config_for(config, job) for job in jobs]
+    planned = 0
+    try:
+        for job_config, job_name in zip(job_configs, unique_job_names(job_configs, jobs)):
+            start = job_config.get('start', 0)
+            count = job_config.get('count', 20)
+            if count == PAGE_SIZE_AUTO:
+                # 第一段爬取时探测页大小，之后按探测结果规划租约
+                count = PageSizeCache.from_config(job_config).get(_endpoint(job_config)) or \
+                    probe_max_from_config(job_config)
+            lease_size = count * options['pages_per_lease']
+            actual_count = job_config.get('actual_count', 0)
+            first_size = min(lease_size, actual_count) if actual_count > 0 else lease_size
+
+            part_dir = os.path.join(_parts_dir(queue, run_id, job_name), f"{start}_1")
+            retry_policy.new_run()
+            path = _fetch_range(job_config, job_name, start, first_size, part_dir)
+            if stop_event.is_set():
+                break
+            if path is None:
+                logging.error(f"[{job_name}] 第一段爬取失败，未创建租约")
+                continue
+            if job_config.get('count') == PAGE_SIZE_AUTO:
+                count = PageSizeCache.from_config(job_config).get(_endpoint(job_config)) or count
+                lease_size = count * options['pages_per_lease']
+                # 工作进程直接使用探测结果，不再各自探测
+                job_config['count'] = count
+            meta = read_snapshot_meta(path)
+            total = meta.pop('total', 0)
+            end = min(total, start + actual_count) if actual_count > 0 else total
+            ranges = [(offset, min(lease_size, end - offset))
+                      for offset in range(start + first_size, end, lease_size)]
+
+            queue.add_job(run_id, job_name, job_config, total, meta)
+            queue.mark_done(run_id, job_name, start, first_size, part_dir, count_snapshot_items(path), worker_id)
+            queue.add_leases(run_id, job_name, ranges)
+            planned += 1
+            logging.info(f"[{job_name}] 共 {total} 条，已完成第一段，创建 {len(ranges)} 个租约"
+                         f"（每个 {lease_size} 条）")
+    finally:
+        queue.close()
+    if not planned:
+        return None
+    logging.info(f"分片运行 {run_id} 已创建，启动工作进程: python src shard work --run-id {run_id}")
+    return run_id
+
+
+def _heartbeat(queue, lease, worker_id, done):
+    """定期续约，直到 done 被设置"""
+    interval = max(1.0, queue.lease_timeout / 3)
+    while not done.wait(interval):
+        if not queue.renew(lease, worker_id):
+            logging.warning(f"{lease} 续约失败，租约已被收回，本次结果将被丢弃")
+            return
+
+
+def run_worker(config, run_id=None, worker_id=None, max_leases=0):
+    """工作进程：循环领取并执行租约，队列中没有待处理租约时退出
+
+    Args:
+        config: 本机配置（限速、网络参数取本机配置，爬取参数取协调者登记的任务配置）
+        run_id: 运行ID，为空时使用队列中最近的运行
+        worker_id: 工作进程标识，默认为 主机名-进程号
+        max_leases: 最多执行的租约数，0表示不限
+    Returns:
+        是否所有领取的租约都已成功完成
+    """
+    queue = LeaseQueue.from_config(config)
+    options = _shard_options(config)
+    run_id = run_id or queue.latest_run()
+    if run_id is None:
+        logging.error("队列中没有分片运行，请先执行 shard plan")
+        queue.close()
+        return False
+    worker_id = worker_id or default_worker_id()
+    session = http_client.get_session(config)
+    # 同一工作进程的所有租约共享一个限速器；重试预算按租约计算，每个租约开始前重置
+    rate_limiter = AdaptiveRateLimiter.from_config(config)
+    retry_policy = get_retry_policy('api', config)
+    completed = failed = 0
+    logging.info(f"工作进程 {worker_id} 开始处理分片运行 {run_id}")
+    try:
+        while not stop_event.is_set():
+            if max_leases and completed + failed >= max_leases:
+                break
+            lease = queue.claim(run_id, worker_id)
+            if lease is None:
+                if queue.is_finished(run_id):
+                    break
+                # 其他工作进程仍持有租约，等待它们完成或超时
+                stop_event.wait(options['poll_interval'])
+                continue
+
+            logging.info(f"领取 {lease}（第 {lease.attempts} 次尝试）")
+            part_dir = os.path.join(_parts_dir(queue, run_id, lease.job_name),
+                                    f"{lease.offset}_{lease.attempts}")
+            done = threading.Event()
+            heartbeat = threading.Thread(target=_heartbeat, args=(queue, lease, worker_id, done),
+                                         name='lease-heartbeat', daemon=True)
+            heartbeat.start()
+            retry_policy.new_run()
+            try:
+                path = _fetch_range(lease.config, lease.job_name, lease.offset, lease.size, part_dir,
+                                    session, rate_limiter)
+            finally:
+                done.set()
+                heartbeat.join()
+
+            if path is not None and queue.complete(lease, worker_id, part_dir, count_snapshot_items(path)):
+                completed += 1
+                logging.info(f"{lease} 已完成")
+                continue
+            if path is None and stop_event.is_set():
+                # 收到停止信号而中断的租约不算失败，归还后由其他工作进程或下次启动时重新领取
+                shutil.rmtree(part_dir, ignore_errors=True)
+                if queue.release(lease, worker_id):
+                    logging.info(f"已收到停止信号，归还 {lease}")
+                break
+            failed += 1
+            shutil.rmtree(part_dir, ignore_errors=True)
+            if path is not None:
+                logging.warning(f"{lease} 已被其他工作进程领取，丢弃本次结果")
+            elif queue.fail(lease, worker_id):
+                logging.warning(f"{lease} 执行失败，已释放租约")
+    finally:
+        queue.close()
+    logging.info(f"工作进程 {worker_id} 退出: 完成 {completed} 个租约，失败 {failed} 个")
+    return failed == 0
+
+
+def merge_run(config, run_id=None, allow_partial=False, keep_parts=False):
+    """合并分片结果：按起始位置顺序写入最终快照，并按电影ID去重
+
+    Args:
+        config: 配置（电影库取本机配置）
+        run_id: 运行ID，为空时使用队列中最近的运行
+        allow_partial: 仍有未完成租约时也合并，生成标记为partial的快照
+        keep_parts: 合并后保留分片结果目录
+    Returns:
+        生成的快照路径列表，有任务无法合并时返回None
+    """
+    queue = LeaseQueue.from_config(config)
+    run_id = run_id or queue.latest_run()
+    if run_id is None:
+        logging.error("队列中没有分片运行")
+        queue.close()
+        return None
+    movie_store = get_movie_store(config)
+    filenames = []
+    merged_all = True
+    all_complete = True
+    try:
+        for job_name, job_config, total, meta in queue.jobs(run_id):
+            counts = queue.state_counts(run_id, job_name)
+            unfinished = sum(count for state, count in counts.items() if state != LeaseQueue.DONE)
+            all_complete = all_complete and not unfinished
+            if unfinished and not allow_partial:
+                logging.error(f"[{job_name}] 还有 {unfinished} 个租约未完成 {counts}，"
+                              f"可继续启动工作进程，或使用 --partial 合并已完成部分")
+                merged_all = False
+                continue
+
+            writer = create_snapshot_writer(job_config, job_name, limit=job_config.get('actual_count', 0))
+            writer.open(total, meta)
+            seen_ids = set()
+            try:
+                for offset, part_dir in queue.done_parts(run_id, job_name):
+                    for name in sorted(list_snapshot_files(part_dir)):
+                        batch = []
+                        for item in iter_snapshot_items(os.path.join(part_dir, name)):
+                            item_id = str(item.get('id'))
+                            # 分片之间因排序变化可能出现重复条目
+                            if item_id in seen_ids:
+                                continue
+                            seen_ids.add(item_id)
+                            batch.append(item)
+                            if len(batch) >= MERGE_BATCH_SIZE:
+                                written = writer.write_items(batch)
+                                if movie_store is not None:
+                                    movie_store.upsert_items(written, job_name)
+                                batch = []
+                        written = writer.write_items(batch)
+                        if movie_store is not None:
+                            movie_store.upsert_items(written, job_name)
+                filename = writer.close(partial=bool(unfinished))
+            except BaseException:
+                writer.abort()
+                raise
+            filenames.append(filename)
+            logging.info(f"[{job_name}] 已合并 {writer.count} 条（预期 {total}）到 {filename}")
+            if not keep_parts and not unfinished:
+                shutil.rmtree(_parts_dir(queue, run_id, job_name), ignore_errors=True)
+        if not keep_parts and all_complete:
+            shutil.rmtree(os.path.dirname(_parts_dir(queue, run_id, '')), ignore_errors=True)
+    finally:
+        queue.close()
+    return filenames if merged_all else None
+
+
+def run_status(config, run_id=None):
+    """返回 (运行ID, {job_name: {state: count}})，队列中没有运行时返回None"""
+    queue = LeaseQueue.from_config(config)
+    try:
+        run_id = run_id or queue.latest_run()
+        if run_id is None:
+            return None
+        return run_id, {job_name: queue.state_counts(run_id, job_name)
+                        for job_name, _, _, _ in queue.jobs(run_id)}
+    finally:
+        queue.close()
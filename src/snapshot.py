@@ -0,0 +1,435 @@
+"""
+快照读写模块
+负责data目录下电影快照的写入（整体JSON、逐行NDJSON或列式Parquet，JSON/NDJSON可选gzip/zstd压缩）
+以及统一的惰性读取
+作者: mshellc
+"""
+
+import gzip
+import importlib
+import io
+import os
+from datetime import datetime
+
+import json_codec
+
+SNAPSHOT_PREFIX = 'douban_movies'
+
+# 压缩方式对应的文件后缀
+COMPRESSION_SUFFIXES = {
+    'none': '',
+    'gzip': '.gz',
+    'zstd': '.zst'
+}
+
+SNAPSHOT_EXTENSIONS = tuple(
+    ext + suffix for ext in ('.json', '.ndjson') for suffix in COMPRESSION_SUFFIXES.values()
+) + ('.parquet',)
+
+# NDJSON中头部/尾部记录的标记字段，普通电影条目不含该字段
+RECORD_KEY = '_record'
+
+# Parquet快照的schema元数据键
+PARQUET_META_KEY = b'douban_snapshot'
+
+
+def _import_optional(module_name, feature):
+    """导入可选依赖，未安装时给出安装提示"""
+    try:
+        return importlib.import_module(module_name)
+    except ImportError:
+        raise ImportError(f"{feature}需要安装 {module_name}: pip install {module_name}") from None
+
+
+def compression_for_path(path):
+    """根据文件扩展名判断压缩方式"""
+    for compression, suffix in COMPRESSION_SUFFIXES.items():
+        if suffix and path.endswith(suffix):
+            return compression
+    return 'none'
+
+
+def open_snapshot(path, mode='rb', compression=None):
+    """以二进制方式打开快照文件，透明处理gzip/zstd压缩
+
+    Args:
+        path: 文件路径
+        mode: 'rb' 或 'wb'
+        compression: 压缩方式，默认按扩展名判断（写入 .part 临时文件时需要显式指定）
+    """
+    if compression is None:
+        compression = compression_for_path(path)
+    if compression == 'gzip':
+        return gzip.open(path, mode)
+    if compression == 'zstd':
+        zstandard = _import_optional('zstandard', 'zstd压缩快照')
+        if 'r' in mode:
+            # zstd解压流不支持按行读取，包一层缓冲
+            return io.BufferedReader(zstandard.open(path, mode))
+        return zstandard.open(path, mode)
+    return open(path, mode)
+
+
+def flatten_item(item, prefix=''):
+    """把嵌套的电影数据展开为单层字典，键名用 . 连接（如 rating.value）"""
+    row = {}
+    for key, value in item.items():
+        name = prefix + key
+        if isinstance(value, dict) and value:
+            row.update(flatten_item(value, name + '.'))
+        else:
+            row[name] = value
+    return row
+
+
+def unflatten_row(row, json_columns=()):
+    """把展开的表格行还原为嵌套字典，空值字段省略"""
+    item = {}
+    for name, value in row.items():
+        if value is None:
+            continue
+        if name in json_columns:
+            value = json_codec.loads(value)
+        target = item
+        parts = name.split('.')
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = value
+    return item
+
+
+class SnapshotWriter:
+    """快照写入器基类
+
+    使用流程: open(total, meta) -> 多次 write_items(items) -> close(partial)；
+    出错时调用 abort() 丢弃未完成的文件。
+    """
+
+    extension = ''
+
+    def __init__(self, output_dir, job_name=None, limit=0, compression='none'):
+        if compression not in COMPRESSION_SUFFIXES:
+            raise ValueError(f"不支持的压缩方式: {compression}")
+        self.output_dir = output_dir
+        self.compression = compression
+        self.limit = limit
+        self.count = 0
+        self.ids = []
+        self.total = 0
+        self.meta = {}
+        os.makedirs(output_dir, exist_ok=True)
+        name_parts = [SNAPSHOT_PREFIX]
+        if job_name:
+            name_parts.append(job_name)
+        name_parts.append(datetime.now().strftime("%Y%m%d_%H%M%S"))
+        self.base_path = os.path.join(output_dir, '_'.join(name_parts))
+
+    def final_path(self, partial=False):
+        suffix = COMPRESSION_SUFFIXES[self.compression]
+        return self.base_path + ('_partial' if partial else '') + self.extension + suffix
+
+    def open(self, total, meta):
+        self.total = total
+        self.meta = meta
+
+    def write_items(self, items):
+        """写入一批条目，超过 limit 的部分被丢弃，返回实际写入的条目"""
+        if self.limit > 0:
+            items = items[:max(0, self.limit - self.count)]
+        if not items:
+            return items
+        self.count += len(items)
+        self.ids.extend(str(item.get('id')) for item in items)
+        self._write(items)
+        return items
+
+    def _write(self, items):
+        raise NotImplementedError
+
+    def close(self, partial=False):
+        """完成写入，返回快照文件路径"""
+        raise NotImplementedError
+
+    def abort(self):
+        """放弃写入"""
+
+    def _write_file(self, path, write):
+        """先用 write(临时路径) 写入 .part 临时文件，完成后再重命名为 path，读取方不会读到写了一半的快照"""
+        part_path = path + '.part'
+        try:
+            write(part_path)
+            os.replace(part_path, path)
+        except BaseException:
+            try:
+                os.remove(part_path)
+            except OSError:
+                pass
+            raise
+        return path
+
+
+class JsonSnapshotWriter(SnapshotWriter):
+    """整体JSON快照（原有格式），条目在内存中累积，关闭时一次写入"""
+
+    extension = '.json'
+
+    def __init__(self, output_dir, job_name=None, limit=0, compression='none'):
+        super().__init__(output_dir, job_name, limit, compression)
+        self._items = []
+
+    def _write(self, items):
+        self._items.extend(items)
+
+    def close(self, partial=False):
+        snapshot = {
+            'count': self.count,
+            'total': self.total,
+            'items': self._items,
+            'recommend_categories': self.meta.get('recommend_categories', []),
+            'show_rating_filter': self.meta.get('show_rating_filter', False)
+        }
+        if partial:
+            snapshot['partial'] = True
+        def write(part_path):
+            with open_snapshot(part_path, 'wb', self.compression) as f:
+                # 压缩时去掉缩进，缩进空白会抵消一部分压缩收益
+                json_codec.dump(snapshot, f, indent=self.compression == 'none')
+
+        return self._write_file(self.final_path(partial), write)
+
+
+class NdjsonSnapshotWriter(SnapshotWriter):
+    """逐行JSON快照
+
+    第一行为头部记录（total、recommend_categories等），随后每行一部电影，
+    最后一行为尾部记录（count、complete完成标记）。写入过程中文件名带 .part 后缀，
+    关闭时才重命名为正式文件名，读取方不会读到未完成的快照。
+    """
+
+    extension = '.ndjson'
+
+    def __init__(self, output_dir, job_name=None, limit=0, compression='none'):
+        super().__init__(output_dir, job_name, limit, compression)
+        self._part_path = self.final_path() + '.part'
+        self._file = None
+
+    def open(self, total, meta):
+        super().open(total, meta)
+        self._file = open_snapshot(self._part_path, 'wb', self.compression)
+        header = {
+            RECORD_KEY: 'header',
+            'total': total,
+            'recommend_categories': meta.get('recommend_categories', []),
+            'show_rating_filter': meta.get('show_rating_filter', False),
+            'created_at': datetime.now().isoformat(timespec='seconds')
+        }
+        self._file.write(json_codec.dumps(header) + b'\n')
+
+    def _write(self, items):
+        self._file.write(b''.join(json_codec.dumps(item) + b'\n' for item in items))
+        if self.compression == 'none':
+            # 压缩流每次flush都会截断压缩块，只对未压缩文件逐页刷新
+            self._file.flush()
+
+    def close(self, partial=False):
+        footer = {RECORD_KEY: 'footer', 'count': self.count, 'complete': not partial}
+        self._file.write(json_codec.dumps(footer) + b'\n')
+        self._file.close()
+        path = self.final_path(partial)
+        os.replace(self._part_path, path)
+        return path
+
+    def abort(self):
+        if self._file is not None:
+            self._file.close()
+            try:
+                os.remove(self._part_path)
+            except OSError:
+                pass
+
+
+class ParquetSnapshotWriter(SnapshotWriter):
+    """列式Parquet快照（需要pyarrow）
+
+    电影数据展开为单层表格（rating.value、pic.normal 等列），列表等无法直接
+    存为列的字段以JSON字符串保存；total、推荐分类等信息写入schema元数据。
+    读取时可以只读需要的列。
+    """
+
+    extension = '.parquet'
+
+    def __init__(self, output_dir, job_name=None, limit=0, compression='none'):
+        # Parquet使用内置的列压缩，不再叠加文件级压缩
+        super().__init__(output_dir, job_name, limit)
+        self._pa = _import_optional('pyarrow', 'Parquet快照')
+        self._pq = _import_optional('pyarrow.parquet', 'Parquet快照')
+        self._rows = []
+
+    def _write(self, items):
+        self._rows.extend(flatten_item(item) for item in items)
+
+    def close(self, partial=False):
+        pa = self._pa
+        names = []
+        for row in self._rows:
+            for name in row:
+                if name not in names:
+                    names.append(name)
+        arrays = []
+        json_columns = []
+        for name in names:
+            values = [row.get(name) for row in self._rows]
+            try:
+                if any(isinstance(value, (list, dict)) for value in values):
+                    raise TypeError(name)
+                array = pa.array(values)
+            except (TypeError, pa.ArrowInvalid, pa.ArrowTypeError):
+                # 列表或类型不一致的列以JSON字符串保存
+                array = pa.array([None if value is None else json_codec.dumps(value).decode('utf-8')
+                                  for value in values], type=pa.string())
+                json_columns.append(name)
+            arrays.append(array)
+        meta = {
+            'total': self.total,
+            'count': self.count,
+            'complete': not partial,
+            'recommend_categories': self.meta.get('recommend_categories', []),
+            'show_rating_filter': self.meta.get('show_rating_filter', False),
+            'json_columns': json_columns
+        }
+        table = pa.Table.from_arrays(arrays, names=names)
+        table = table.replace_schema_metadata({PARQUET_META_KEY: json_codec.dumps(meta)})
+        return self._write_file(self.final_path(partial),
+                                lambda part_path: self._pq.write_table(table, part_path, compression='zstd'))
+
+
+SNAPSHOT_WRITERS = {
+    'json': JsonSnapshotWriter,
+    'ndjson': NdjsonSnapshotWriter,
+    'parquet': ParquetSnapshotWriter
+}
+
+
+def create_snapshot_writer(config, job_name=None, limit=0):
+    """按配置 snapshot_format / snapshot_compression 创建快照写入器"""
+    snapshot_format = config.get('snapshot_format', 'json')
+    writer_class = SNAPSHOT_WRITERS.get(snapshot_format)
+    if writer_class is None:
+        raise ValueError(f"不支持的快照格式: {snapshot_format}")
+    compression = config.get('snapshot_compression') or 'none'
+    return writer_class(config.get('output_directory', 'data'), job_name, limit, compression)
+
+
+def is_snapshot_file(filename):
+    """判断文件名是否为快照文件（不含写入中的 .part 文件）"""
+    return filename.startswith(SNAPSHOT_PREFIX) and filename.endswith(SNAPSHOT_EXTENSIONS)
+
+
+def is_partial_snapshot(filename):
+    """判断快照是否为中止的爬取保存的部分结果（文件名带 _partial）"""
+    return '_partial.' in filename
+
+
+def list_snapshot_files(data_dir, include_partial=True):
+    """列出目录下的快照文件名，include_partial 为False时不含部分结果快照"""
+    if not os.path.exists(data_dir):
+        return []
+    return [name for name in os.listdir(data_dir)
+            if os.path.isfile(os.path.join(data_dir, name)) and is_snapshot_file(name)
+            and (include_partial or not is_partial_snapshot(name))]
+
+
+def _project(item, columns):
+    """只保留指定的顶层字段"""
+    return {key: item[key] for key in columns if key in item}
+
+
+def _parquet_meta(parquet_file):
+    metadata = parquet_file.schema_arrow.metadata or {}
+    return json_codec.loads(metadata.get(PARQUET_META_KEY, b'{}'))
+
+
+def _iter_parquet_items(path, columns=None, batch_size=1024):
+    pq = _import_optional('pyarrow.parquet', 'Parquet快照')
+    parquet_file = pq.ParquetFile(path)
+    json_columns = set(_parquet_meta(parquet_file).get('json_columns', []))
+    selected = None
+    if columns is not None:
+        # 按顶层字段选择列，如 rating 对应 rating.value、rating.count 等
+        selected = [name for name in parquet_file.schema_arrow.names
+                    if any(name == column or name.startswith(column + '.') for column in columns)]
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=selected):
+        for row in batch.to_pylist():
+            yield unflatten_row(row, json_columns)
+
+
+def iter_snapshot_items(path, columns=None):
+    """惰性遍历快照中的电影条目
+
+    NDJSON快照逐行读取，内存占用与单条数据相当；JSON快照需要整体解析；
+    Parquet快照按批读取，指定 columns（顶层字段名）时只读取这些列。
+
+    Args:
+        path: 快照文件路径（压缩格式按扩展名自动识别）
+        columns: 需要的顶层字段，如 ('id', 'title', 'rating')；None表示全部字段
+    """
+    if path.endswith('.parquet'):
+        yield from _iter_parquet_items(path, columns)
+        return
+    with open_snapshot(path) as f:
+        if '.ndjson' in os.path.basename(path):
+            records = (json_codec.loads(line) for line in f if line.strip())
+            items = (record for record in records if RECORD_KEY not in record)
+        else:
+            items = json_codec.load(f).get('items', [])
+        for item in items:
+            yield item if columns is None else _project(item, columns)
+
+
+def read_snapshot_meta(path):
+    """读取快照的 total、recommend_categories、show_rating_filter
+
+    NDJSON快照只读取头部记录，Parquet快照读取文件元数据，JSON快照需要整体解析。
+    """
+    keys = ('total', 'recommend_categories', 'show_rating_filter')
+    if path.endswith('.parquet'):
+        pq = _import_optional('pyarrow.parquet', 'Parquet快照')
+        meta = _parquet_meta(pq.ParquetFile(path))
+    else:
+        with open_snapshot(path) as f:
+            if '.ndjson' in os.path.basename(path):
+                meta = json_codec.loads(f.readline() or b'{}')
+            else:
+                meta = json_codec.load(f)
+    return {key: meta[key] for key in keys if key in meta}
+
+
+def _read_last_line(path, chunk_size=4096):
+    """读取文件最后一行（用于获取NDJSON尾部记录）"""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        f.seek(max(0, end - chunk_size))
+        lines = f.read().splitlines()
+    return lines[-1].decode('utf-8') if lines else ''
+
+
+def count_snapshot_items(path):
+    """统计快照中的电影数量
+
+    未压缩的NDJSON快照读取尾部记录、Parquet快照读取文件元数据，都无需解析全部数据。
+    """
+    if path.endswith('.parquet'):
+        pq = _import_optional('pyarrow.parquet', 'Parquet快照')
+        return pq.ParquetFile(path).metadata.num_rows
+    if path.endswith('.ndjson'):
+        try:
+            footer = json_codec.loads(_read_last_line(path))
+            if footer.get(RECORD_KEY) == 'footer':
+                return footer.get('count', 0)
+        except ValueError:
+            pass
+    if '.ndjson' in os.path.basename(path):
+        return sum(1 for _ in iter_snapshot_items(path))
+    with open_snapshot(path) as f:
+        return len(json_codec.load(f).get('items', []))
@@ -0,0 +1,222 @@
+"""
+分片爬取租约队列模块
+基于SQLite的共享工作队列：协调者把页面区间写成租约，多个工作进程领取、续约、完成，
+租约超时未续约的工作进程视为已退出，其租约会被其他工作进程重新领取
+作者: mshellc
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+import json_codec
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    run_id TEXT NOT NULL,
+    job_name TEXT NOT NULL,
+    config TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    meta TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (run_id, job_name)
+);
+CREATE TABLE IF NOT EXISTS leases (
+    run_id TEXT NOT NULL,
+    job_name TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    part_dir TEXT,
+    item_count INTEGER,
+    updated_at REAL,
+    PRIMARY KEY (run_id, job_name, offset)
+);
+CREATE INDEX IF NOT EXISTS idx_leases_state ON leases(run_id, state);
+'''
+
+
+class Lease:
+    """一个已领取的租约：某个任务中从 offset 开始的 size 条数据"""
+
+    def __init__(self, run_id, job_name, offset, size, attempts, config):
+        self.run_id = run_id
+        self.job_name = job_name
+        self.offset = offset
+        self.size = size
+        self.attempts = attempts
+        self.config = config
+
+    def __repr__(self):
+        return f"Lease({self.job_name}, offset={self.offset}, size={self.size})"
+
+
+class LeaseQueue:
+    """SQLite租约队列
+
+    租约状态: pending -> leased -> done；失败或超时回到 pending，
+    尝试次数达到 max_attempts 后标记为 failed。领取使用 BEGIN IMMEDIATE，
+    多个进程（或通过共享目录访问同一数据库文件的多台机器）不会领取到同一租约。
+    """
+
+    PENDING = 'pending'
+    LEASED = 'leased'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    def __init__(self, path, lease_timeout=300, max_attempts=3):
+        self.path = path
+        self.lease_timeout = float(lease_timeout)
+        self.max_attempts = max(1, int(max_attempts))
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False, isolation_level=None)
+        self._conn.executescript(SCHEMA)
+
+    @classmethod
+    def from_config(cls, config):
+        """根据配置中的 shard 字段打开队列"""
+        options = (config or {}).get('shard') or {}
+        path = options.get('queue_path') or os.path.join((config or {}).get('output_directory', 'data'),
+                                                          '.queue', 'queue.db')
+        return cls(path, options.get('lease_timeout', 300), options.get('max_attempts', 3))
+
+    def _transaction(self, func):
+        """在写事务中执行 func(conn)"""
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = func(self._conn)
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+            return result
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def add_job(self, run_id, job_name, config, total, meta):
+        """登记一个任务（工作进程按此配置爬取）"""
+        def insert(conn):
+            conn.execute('INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?)',
+                         (run_id, job_name, json_codec.dumps(config).decode('utf-8'), total,
+                          json_codec.dumps(meta).decode('utf-8'), time.time()))
+        self._transaction(insert)
+
+    def add_leases(self, run_id, job_name, ranges):
+        """写入待领取的租约，ranges 为 [(offset, size), ...]，已存在的租约保持不变"""
+        now = time.time()
+
+        def insert(conn):
+            conn.executemany(
+                'INSERT OR IGNORE INTO leases (run_id, job_name, offset, size, state, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                [(run_id, job_name, offset, size, self.PENDING, now) for offset, size in ranges])
+        self._transaction(insert)
+
+    def mark_done(self, run_id, job_name, offset, size, part_dir, item_count, worker):
+        """直接登记一个已完成的租约（协调者自己爬取的第一段）"""
+        def insert(conn):
+            conn.execute(
+                'INSERT OR REPLACE INTO leases (run_id, job_name, offset, size, state, worker, attempts, '
+                'part_dir, item_count, updated_at) VALUES (?, ?, ?, ?, ?, ?, 1, ?, ?, ?)',
+                (run_id, job_name, offset, size, self.DONE, worker, part_dir, item_count, time.time()))
+        self._transaction(insert)
+
+    def claim(self, run_id, worker):
+        """领取一个待处理或已超时的租约，没有可领取的租约时返回None"""
+        def claim_one(conn):
+            now = time.time()
+            # 尝试次数已用完的超时租约不再重新领取
+            conn.execute('UPDATE leases SET state = ?, updated_at = ? WHERE run_id = ? AND state = ? '
+                         'AND lease_expires < ? AND attempts >= ?',
+                         (self.FAILED, now, run_id, self.LEASED, now, self.max_attempts))
+            row = conn.execute(
+                'SELECT job_name, offset, size, attempts FROM leases WHERE run_id = ? AND attempts < ? AND '
+                '(state = ? OR (state = ? AND lease_expires < ?)) ORDER BY job_name, offset LIMIT 1',
+                (run_id, self.max_attempts, self.PENDING, self.LEASED, now)).fetchone()
+            if row is None:
+                return None
+            job_name, offset, size, attempts = row
+            conn.execute(
+                'UPDATE leases SET state = ?, worker = ?, lease_expires = ?, attempts = attempts + 1, '
+                'updated_at = ? WHERE run_id = ? AND job_name = ? AND offset = ?',
+                (self.LEASED, worker, now + self.lease_timeout, now, run_id, job_name, offset))
+            config = conn.execute('SELECT config FROM jobs WHERE run_id = ? AND job_name = ?',
+                                  (run_id, job_name)).fetchone()[0]
+            return Lease(run_id, job_name, offset, size, attempts + 1, json_codec.loads(config))
+        return self._transaction(claim_one)
+
+    def _update_held(self, lease, worker, assignments, params):
+        """只更新仍由该工作进程持有的租约，返回是否更新成功"""
+        def update(conn):
+            cursor = conn.execute(
+                f'UPDATE leases SET {assignments}, updated_at = ? WHERE run_id = ? AND job_name = ? '
+                f'AND offset = ? AND state = ? AND worker = ?',
+                tuple(params) + (time.time(), lease.run_id, lease.job_name, lease.offset, self.LEASED, worker))
+            return cursor.rowcount == 1
+        return self._transaction(update)
+
+    def renew(self, lease, worker):
+        """续约，返回False表示租约已被收回"""
+        return self._update_held(lease, worker, 'lease_expires = ?', (time.time() + self.lease_timeout,))
+
+    def complete(self, lease, worker, part_dir, item_count):
+        """完成租约，返回False表示租约已超时并被其他工作进程领取（本次结果作废）"""
+        return self._update_held(lease, worker, 'state = ?, part_dir = ?, item_count = ?',
+                                 (self.DONE, part_dir, item_count))
+
+    def fail(self, lease, worker):
+        """放弃租约：还有尝试次数时回到待领取状态，否则标记为失败"""
+        state = self.PENDING if lease.attempts < self.max_attempts else self.FAILED
+        return self._update_held(lease, worker, 'state = ?, worker = NULL, lease_expires = NULL', (state,))
+
+    def release(self, lease, worker):
+        """归还租约（如工作进程收到停止信号）：回到待领取状态，不计入尝试次数"""
+        return self._update_held(lease, worker,
+                                 'state = ?, worker = NULL, lease_expires = NULL, attempts = attempts - 1',
+                                 (self.PENDING,))
+
+    def latest_run(self):
+        """最近创建的运行ID"""
+        rows = self._query('SELECT run_id FROM jobs ORDER BY created_at DESC LIMIT 1')
+        return rows[0][0] if rows else None
+
+    def jobs(self, run_id):
+        """运行中的任务列表 [(job_name, config, total, meta), ...]"""
+        rows = self._query('SELECT job_name, config, total, meta FROM jobs WHERE run_id = ? ORDER BY job_name',
+                           (run_id,))
+        return [(name, json_codec.loads(config), total, json_codec.loads(meta)) for name, config, total, meta in rows]
+
+    def state_counts(self, run_id, job_name=None):
+        """按状态统计租约数量（可限定任务），超时未续约的租约计为 expired"""
+        now = time.time()
+        sql = ('SELECT state, state = ? AND lease_expires < ?, COUNT(*) FROM leases WHERE run_id = ?'
+               + (' AND job_name = ?' if job_name is not None else '') + ' GROUP BY 1, 2')
+        params = (self.LEASED, now, run_id) + ((job_name,) if job_name is not None else ())
+        counts = {}
+        for state, expired, count in self._query(sql, params):
+            key = 'expired' if expired else state
+            counts[key] = counts.get(key, 0) + count
+        return counts
+
+    def is_finished(self, run_id):
+        """没有待领取或处理中的租约"""
+        rows = self._query('SELECT COUNT(*) FROM leases WHERE run_id = ? AND state IN (?, ?)',
+                           (run_id, self.PENDING, self.LEASED))
+        return rows[0][0] == 0
+
+    def done_parts(self, run_id, job_name):
+        """已完成租约的结果目录，按 offset 排序 [(offset, part_dir), ...]"""
+        return self._query('SELECT offset, part_dir FROM leases WHERE run_id = ? AND job_name = ? AND state = ? '
+                           'ORDER BY offset', (run_id, job_name, self.DONE))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
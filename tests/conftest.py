@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试公共夹具
+把 src 加入导入路径，提供本地模拟接口和指向临时目录的爬取配置，
+每个测试前后重置爬虫的进程级共享状态（停止信号、重试策略、磁带、电影库、响应缓存）
+作者: mshellc
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import douban_crawler
+import mock_douban_api
+from http_cassette import close_cassette
+from movie_store import close_movie_store
+from response_cache import reset_response_cache
+from retry_policy import reset_retry_policies
+
+
+def _reset_shared_state():
+    douban_crawler.stop_event.clear()
+    reset_retry_policies()
+    close_cassette()
+    close_movie_store()
+    reset_response_cache()
+
+
+@pytest.fixture(autouse=True)
+def isolated_crawler(tmp_path, monkeypatch):
+    """在临时目录中运行（页大小缓存、图片缓存等相对路径不写入项目目录），并重置共享状态"""
+    monkeypatch.chdir(tmp_path)
+    _reset_shared_state()
+    yield
+    _reset_shared_state()
+
+
+@pytest.fixture
+def mock_api():
+    """启动模拟接口：mock_api(**options) 返回服务器，测试结束后关闭"""
+    servers = []
+
+    def start(**options):
+        server = mock_douban_api.start_mock_server(**options)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def crawl_config(tmp_path):
+    """指向模拟接口的爬取配置：crawl_config(server, **overrides)
+
+    限速和退避参数调小，测试不会因等待而变慢；快照写入临时目录的 data 下。
+    """
+    def build(server, **overrides):
+        config = {
+            'api_base_url': server.url,
+            'count': 20,
+            'output_directory': str(tmp_path / 'data'),
+            'snapshot_format': 'ndjson',
+            'rate_limit': {'initial_rate': 500, 'max_rate': 500},
+            'retry': {'base_delay': 0.01, 'max_delay': 0.05, 'max_attempts': 5,
+                      'breaker_failure_threshold': 50}
+        }
+        config.update(overrides)
+        return config
+
+    return build
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+用本地模拟接口测试完整的爬取流程
+正常爬取、429突发、停止后从检查点继续、榜单漂移补抓、HTTP录制与回放
+作者: mshellc
+"""
+
+import os
+import threading
+
+import douban_crawler
+from douban_crawler import fetch_douban_movies
+from http_cassette import Cassette, close_cassette
+from rate_limiter import AdaptiveRateLimiter
+from snapshot import is_partial_snapshot, iter_snapshot_items, list_snapshot_files
+
+FIRST_ID = 10000000
+
+
+def read_snapshot_ids(data_dir, partial=False):
+    """读取目录中唯一一个（完整或部分结果）快照的电影ID列表"""
+    names = [name for name in list_snapshot_files(data_dir) if is_partial_snapshot(name) == partial]
+    assert len(names) == 1, names
+    return [int(item['id']) for item in iter_snapshot_items(os.path.join(data_dir, names[0]))]
+
+
+def test_normal_run(mock_api, crawl_config):
+    """并发爬取全部分页，快照按榜单顺序包含全部电影"""
+    server = mock_api(total=230, latency=0.01, latency_jitter=0.02)
+    config = crawl_config(server, concurrency=4)
+
+    assert fetch_douban_movies(config)
+
+    assert read_snapshot_ids(config['output_directory']) == list(range(FIRST_ID, FIRST_ID + 230))
+    assert server.api.page_requests == 12
+    assert not os.listdir(os.path.join(config['output_directory'], '.checkpoints'))
+
+
+def test_429_burst_backs_off_and_recovers(mock_api, crawl_config):
+    """429突发时按 Retry-After（不超过 max_delay）等待并降速，重试后数据完整"""
+    server = mock_api(total=200, burst_every=4, burst_length=2, retry_after=30)
+    config = crawl_config(server)
+    rate_limiter = AdaptiveRateLimiter(initial_rate=100, max_rate=100, increase_step=0)
+
+    assert fetch_douban_movies(config, rate_limiter=rate_limiter)
+
+    assert server.api.responses.get(429, 0) >= 2
+    assert rate_limiter.rate < 100
+    assert read_snapshot_ids(config['output_directory']) == list(range(FIRST_ID, FIRST_ID + 200))
+
+
+def test_stop_then_resume_from_checkpoint(mock_api, crawl_config):
+    """停止时保存部分结果且不留 .part 文件；resume 时只请求剩余页面"""
+    server = mock_api(total=300, latency=0.05)
+    config = crawl_config(server, resume=True)
+    data_dir = config['output_directory']
+
+    timer = threading.Timer(0.3, douban_crawler.stop_event.set)
+    timer.start()
+    assert not fetch_douban_movies(config)
+    timer.join()
+    partial_ids = read_snapshot_ids(data_dir, partial=True)
+    assert 0 < len(partial_ids) < 300
+    assert not [name for name in os.listdir(data_dir) if name.endswith('.part')]
+    first_run_pages = server.api.page_requests
+
+    douban_crawler.stop_event.clear()
+    assert fetch_douban_movies(config)
+
+    assert read_snapshot_ids(data_dir) == list(range(FIRST_ID, FIRST_ID + 300))
+    assert server.api.page_requests - first_run_pages < 15
+
+
+def test_drift_refetch_recovers_shifted_movies(mock_api, crawl_config):
+    """榜单在爬取过程中插入新电影时按ID去重，并补抓被挤到下一页之后的电影"""
+    server = mock_api(total=200, drift_every=3, drift_size=2)
+    config = crawl_config(server, checkpoint=False)
+
+    assert fetch_douban_movies(config)
+
+    ids = read_snapshot_ids(config['output_directory'])
+    assert len(ids) == len(set(ids))
+    assert set(range(FIRST_ID, FIRST_ID + 200)) <= set(ids)
+
+
+def test_record_then_replay_without_network(mock_api, crawl_config, tmp_path):
+    """录制的磁带（含5xx重试）在接口关闭后回放，得到相同的快照"""
+    server = mock_api(total=120, error_rate=0.2, seed=3)
+    cassette_path = str(tmp_path / 'run.cassette.gz')
+    record_config = crawl_config(server, checkpoint=False, output_directory=str(tmp_path / 'record'),
+                                 cassette={'mode': 'record', 'path': cassette_path})
+    assert fetch_douban_movies(record_config)
+    assert server.api.responses.get(500, 0) + server.api.responses.get(503, 0) > 0
+    close_cassette()
+    server.shutdown()
+    server.server_close()
+
+    replay_config = dict(record_config, output_directory=str(tmp_path / 'replay'),
+                         cassette={'mode': 'replay', 'path': cassette_path, 'latency': 'zero'})
+    assert fetch_douban_movies(replay_config)
+
+    assert read_snapshot_ids(replay_config['output_directory']) == read_snapshot_ids(record_config['output_directory'])
+
+
+def test_truncated_cassette_keeps_complete_entries(mock_api, tmp_path):
+    """录制进程被强制结束（没有gzip结束标记）时，回放仍能读取已写入的完整记录"""
+    import requests
+
+    server = mock_api(total=100)
+    path = str(tmp_path / 'killed.cassette.gz')
+    recorder = Cassette(path, Cassette.RECORD)
+    session = requests.Session()
+    urls = [f"{server.url}{douban_crawler.RECOMMEND_PATH}?start={start}&count=20" for start in (0, 20, 40)]
+    for url in urls:
+        recorder.get(session, url)
+    # 模拟进程被结束：不调用 close()，磁带文件没有结束标记
+    with open(path, 'rb') as f:
+        data = f.read()
+    killed_path = str(tmp_path / 'copy.cassette.gz')
+    with open(killed_path, 'wb') as f:
+        f.write(data)
+    recorder.close()
+
+    player = Cassette(killed_path, Cassette.REPLAY, latency='zero')
+    for url in urls:
+        assert player.get(session, url).status_code == 200
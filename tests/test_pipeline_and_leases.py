@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试爬取流水线（背压、出错中止）和分片租约队列（领取、超时收回、归还、失败次数）
+作者: mshellc
+"""
+
+import threading
+import time
+
+import pytest
+
+from crawl_pipeline import Pipeline, Stage
+from work_queue import LeaseQueue
+
+
+def test_pipeline_passes_items_through_all_stages():
+    results = []
+    lock = threading.Lock()
+
+    def collect(item):
+        with lock:
+            results.append(item)
+
+    pipeline = Pipeline([Stage('double', lambda x: x * 2, workers=3),
+                         Stage('skip_odd', lambda x: x if x % 4 == 0 else None),
+                         Stage('collect', collect)]).start()
+    for number in range(50):
+        pipeline.put(number)
+    pipeline.join()
+
+    assert sorted(results) == [x * 2 for x in range(50) if x % 2 == 0]
+    assert [stage['processed'] for stage in pipeline.summary()['stages']] == [50, 50, 25]
+
+
+def test_pipeline_backpressure_blocks_producer():
+    """最后一个阶段处理慢时，上游阶段因队列已满而阻塞，put 也随之变慢"""
+    pipeline = Pipeline([Stage('fast', lambda x: x), Stage('slow', lambda x: time.sleep(0.05))],
+                        queue_size=1).start()
+    started = time.monotonic()
+    for number in range(10):
+        pipeline.put(number)
+    put_seconds = time.monotonic() - started
+    pipeline.join()
+
+    assert put_seconds > 0.2
+    assert pipeline.summary()['stages'][0]['blocked_seconds'] > 0.1
+
+
+def test_pipeline_aborts_on_stage_error():
+    """任一阶段出错时流水线中止，put/join 重新抛出该异常，工作线程全部退出"""
+    def fail_on_three(item):
+        if item == 3:
+            raise ValueError('bad page')
+        return item
+
+    pipeline = Pipeline([Stage('parse', fail_on_three, workers=2), Stage('sink', lambda x: time.sleep(0.01))],
+                        queue_size=2).start()
+    with pytest.raises(ValueError, match='bad page'):
+        for number in range(1000):
+            pipeline.put(number)
+        pipeline.join()
+    with pytest.raises(ValueError):
+        pipeline.join()
+    assert not any(thread.is_alive() for threads in pipeline._threads for thread in threads)
+
+
+def test_pipeline_abort_stops_workers():
+    pipeline = Pipeline([Stage('slow', lambda x: time.sleep(0.01))]).start()
+    pipeline.put(1)
+    pipeline.abort()
+    assert not any(thread.is_alive() for threads in pipeline._threads for thread in threads)
+
+
+@pytest.fixture
+def lease_queue(tmp_path):
+    queue = LeaseQueue(str(tmp_path / 'queue.db'), lease_timeout=0.3, max_attempts=2)
+    queue.add_job('run', 'job', {'tags': '2025'}, 100, {})
+    queue.add_leases('run', 'job', [(20, 20), (40, 20)])
+    yield queue
+    queue.close()
+
+
+def test_lease_claim_and_complete(lease_queue):
+    first = lease_queue.claim('run', 'w1')
+    second = lease_queue.claim('run', 'w2')
+    assert (first.offset, second.offset) == (20, 40)
+    assert first.config == {'tags': '2025'}
+    assert lease_queue.claim('run', 'w3') is None
+
+    assert lease_queue.complete(first, 'w1', 'parts/20', 20)
+    assert lease_queue.complete(second, 'w2', 'parts/40', 20)
+    assert lease_queue.is_finished('run')
+    assert lease_queue.done_parts('run', 'job') == [(20, 'parts/20'), (40, 'parts/40')]
+
+
+def test_expired_lease_is_reclaimed_and_stale_result_rejected(lease_queue):
+    lease = lease_queue.claim('run', 'w1')
+    lease_queue.claim('run', 'w1')
+    time.sleep(0.35)
+    assert lease_queue.state_counts('run')['expired'] == 2
+
+    reclaimed = lease_queue.claim('run', 'w2')
+    assert reclaimed.offset == lease.offset
+    assert reclaimed.attempts == 2
+    # 原工作进程的续约和结果都被拒绝
+    assert not lease_queue.renew(lease, 'w1')
+    assert not lease_queue.complete(lease, 'w1', 'parts/stale', 20)
+    assert lease_queue.complete(reclaimed, 'w2', 'parts/20', 20)
+
+
+def test_release_does_not_count_an_attempt(lease_queue):
+    lease = lease_queue.claim('run', 'w1')
+    assert lease_queue.release(lease, 'w1')
+    again = lease_queue.claim('run', 'w1')
+    assert again.offset == lease.offset
+    assert again.attempts == 1
+
+
+def test_failed_lease_retries_until_max_attempts(lease_queue):
+    lease = lease_queue.claim('run', 'w1')
+    assert lease_queue.fail(lease, 'w1')
+    lease = lease_queue.claim('run', 'w1')
+    assert lease.attempts == 2
+    assert lease_queue.fail(lease, 'w1')
+    assert lease_queue.state_counts('run', 'job').get(LeaseQueue.FAILED) == 1
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试自适应限速器（AIMD）、Retry-After解析、重试策略和熔断器状态
+作者: mshellc
+"""
+
+import threading
+import time
+
+import pytest
+import requests
+
+from douban_crawler import CrawlCancelled
+from rate_limiter import AdaptiveRateLimiter, parse_retry_after
+from retry_policy import CircuitBreaker, CircuitOpenError, RetryPolicy
+
+URL = 'https://m.douban.com/rexxar/api/v2/movie/recommend'
+
+
+def http_error(status, headers=None):
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    return requests.exceptions.HTTPError(f"HTTP {status}", response=response)
+
+
+def scripted(*outcomes):
+    """按顺序返回结果或抛出异常的请求函数，记录调用次数"""
+    calls = []
+
+    def request():
+        outcome = outcomes[min(len(calls), len(outcomes) - 1)]
+        calls.append(outcome)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+    request.calls = calls
+    return request
+
+
+def no_wait(delay):
+    return False
+
+
+def test_rate_limiter_additive_increase_multiplicative_decrease():
+    limiter = AdaptiveRateLimiter(initial_rate=2, min_rate=0.5, max_rate=3, increase_step=0.5)
+    limiter.on_success(0.1)
+    assert limiter.rate == 2.5
+    limiter.on_success(0.1)
+    limiter.on_success(0.1)
+    assert limiter.rate == 3
+
+    limiter.on_failure(429)
+    assert limiter.rate == 1.5
+    # 同一时间窗口内的多个失败只降速一次
+    limiter.on_failure(503)
+    assert limiter.rate == 1.5
+
+    limiter.on_success(limiter.latency_threshold + 1)
+    assert limiter.rate == 1.5
+    # 4xx（非限流）不降速
+    limiter._last_decrease = 0.0
+    limiter.on_failure(404)
+    assert limiter.rate == 1.5
+
+
+def test_rate_limiter_never_drops_below_min_rate():
+    limiter = AdaptiveRateLimiter(initial_rate=1, min_rate=0.5)
+    for _ in range(5):
+        limiter._last_decrease = 0.0
+        limiter.on_failure(None)
+    assert limiter.rate == 0.5
+
+
+def test_acquire_returns_false_when_stopped_during_pause():
+    limiter = AdaptiveRateLimiter(initial_rate=100)
+    limiter.on_failure(429, retry_after=1000)
+    stop_event = threading.Event()
+    threading.Timer(0.1, stop_event.set).start()
+    started = time.monotonic()
+    assert limiter.acquire(wait=stop_event.wait) is False
+    assert time.monotonic() - started < 5
+
+
+def test_parse_retry_after():
+    assert parse_retry_after('5') == 5
+    assert parse_retry_after('120', max_delay=30) == 30
+    assert parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0
+    assert parse_retry_after('') is None
+    assert parse_retry_after('soon') is None
+
+
+def test_retries_5xx_until_success():
+    policy = RetryPolicy(max_attempts=3, base_delay=0.01, max_delay=0.02)
+    request = scripted(http_error(503), http_error(500), 'ok')
+    retries = []
+    on_retry = lambda error, attempt, delay: retries.append(attempt)
+    assert policy.execute(URL, request, wait=no_wait, on_retry=on_retry) == 'ok'
+    assert retries == [1, 2]
+    assert policy.retries_used == 2
+
+
+def test_client_errors_are_not_retried():
+    policy = RetryPolicy(max_attempts=3)
+    request = scripted(http_error(404), 'ok')
+    with pytest.raises(requests.exceptions.HTTPError):
+        policy.execute(URL, request, wait=no_wait)
+    assert len(request.calls) == 1
+    assert policy.breaker_for(URL).state == CircuitBreaker.CLOSED
+
+
+def test_retry_after_is_capped_at_max_delay():
+    policy = RetryPolicy(max_attempts=2, max_delay=0.5)
+    delays = []
+    policy.execute(URL, scripted(http_error(429, {'Retry-After': '3600'}), 'ok'),
+                   wait=delays.append)
+    assert delays == [0.5]
+
+
+def test_run_retry_budget_is_shared_until_new_run():
+    policy = RetryPolicy(max_attempts=5, run_retry_budget=2, base_delay=0.01, max_delay=0.02,
+                         breaker_failure_threshold=50)
+    with pytest.raises(requests.exceptions.HTTPError):
+        policy.execute(URL, scripted(http_error(503)), wait=no_wait)
+    assert policy.retries_used == 2
+    # 预算用完后不再重试
+    request = scripted(http_error(503), 'ok')
+    with pytest.raises(requests.exceptions.HTTPError):
+        policy.execute(URL, request, wait=no_wait)
+    assert len(request.calls) == 1
+
+    policy.new_run()
+    assert policy.execute(URL, scripted(http_error(503), 'ok'), wait=no_wait) == 'ok'
+
+
+def test_circuit_breaker_opens_then_half_open_probe_closes_it():
+    policy = RetryPolicy(max_attempts=1, breaker_failure_threshold=2, breaker_reset_timeout=0.2)
+    for _ in range(2):
+        with pytest.raises(requests.exceptions.HTTPError):
+            policy.execute(URL, scripted(http_error(500)), wait=no_wait)
+    breaker = policy.breaker_for(URL)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    request = scripted('ok')
+    with pytest.raises(CircuitOpenError):
+        policy.execute(URL, request, wait=no_wait)
+    assert not request.calls
+
+    time.sleep(0.25)
+    assert policy.execute(URL, request, wait=no_wait) == 'ok'
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_failed_probe_reopens_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    breaker.before_request()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_probe_slot_released_when_probe_raises_non_http_error():
+    policy = RetryPolicy(max_attempts=1, breaker_failure_threshold=1, breaker_reset_timeout=0)
+    with pytest.raises(requests.exceptions.HTTPError):
+        policy.execute(URL, scripted(http_error(500)), wait=no_wait)
+
+    # 半开状态下的探测请求被停止信号中断（非网络异常）
+    with pytest.raises(CrawlCancelled):
+        policy.execute(URL, scripted(CrawlCancelled()), wait=no_wait)
+
+    assert policy.execute(URL, scripted('ok'), wait=no_wait) == 'ok'
+    assert policy.breaker_for(URL).state == CircuitBreaker.CLOSED